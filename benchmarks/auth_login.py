@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""
+Password verification benchmark.
+
+Runs concurrent logins (password verification of users) and measures
+logins/sec and max event loop lag (delay of periodic timer, i.e. how long
+other requests of worker wait): sha1 and PBKDF2 verified in event loop
+(BaseUser.check_password) and PBKDF2 verified in thread pool with bounded
+concurrency (BaseUser.verify_password, as in AuthBasedService).
+
+Usage: python3 benchmarks/auth_login.py [logins count] [concurrency]
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core import passwords
+from leela.services.auth import BaseUser
+
+
+@asyncio.coroutine
+def measure_lag(state):
+    max_lag = 0
+    while not state['done']:
+        t0 = time.time()
+        yield from asyncio.sleep(0.001)
+        max_lag = max(max_lag, time.time() - t0 - 0.001)
+    return max_lag
+
+
+@asyncio.coroutine
+def login_inline(user, password):
+    return user.check_password(password)
+
+
+@asyncio.coroutine
+def login_executor(user, password):
+    return (yield from user.verify_password(password))
+
+
+@asyncio.coroutine
+def run_logins(login, user, count, concurrency):
+    queue = iter(range(count))
+
+    @asyncio.coroutine
+    def client():
+        for _ in queue:
+            valid = yield from login(user, '123')
+            assert valid
+            # let other coroutines run between logins
+            yield from asyncio.sleep(0)
+
+    state = {'done': False}
+    lag_task = asyncio.ensure_future(measure_lag(state))
+    t0 = time.time()
+    yield from asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.time() - t0
+    state['done'] = True
+    return count / elapsed, (yield from lag_task)
+
+
+def main(count, concurrency):
+    loop = asyncio.get_event_loop()
+    hashers = passwords.get_hashers()
+    cases = [
+        ('sha1, loop', login_inline,
+         BaseUser('bench', passwords.SHA1Hasher().encode('123'), [])),
+        ('pbkdf2, loop', login_inline,
+         BaseUser('bench', hashers.encode('123'), [])),
+        ('pbkdf2, executor', login_executor,
+         BaseUser('bench', hashers.encode('123'), []))]
+
+    print('{:>18} {:>12} {:>16}'.format('case', 'logins/sec',
+                                        'max loop lag, ms'))
+    for name, login, user in cases:
+        rate, lag = loop.run_until_complete(
+            run_logins(login, user, count, concurrency))
+        print('{:>18} {:>12.1f} {:>16.1f}'.format(name, rate, lag * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""
+JSON codecs benchmark.
+
+Compares loads/dumps throughput of all installed JSON codecs
+(see leela.core.codecs) on ~50KB and ~500KB JSON documents.
+
+Usage: python3 benchmarks/json_codecs.py [rounds]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core.codecs import StdJSONCodec, available_json_codecs
+
+
+def make_payload(items_count):
+    rnd = random.Random(42)
+    return {'total': items_count,
+            'items': [{'id': i,
+                       'name': 'item #{}'.format(i),
+                       'price': rnd.random() * 1000,
+                       'active': bool(i % 2),
+                       'tags': ['tag{}'.format(rnd.randint(0, 100))
+                                for _ in range(3)],
+                       'owner': {'username': 'user{}'.format(i % 50),
+                                 'roles': ['reader', 'writer']}}
+                      for i in range(items_count)]}
+
+
+def measure(func, arg, rounds):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - t0) / rounds * 1000
+
+
+def main(rounds):
+    payloads = []
+    for items_count in (250, 2500):
+        payload = make_payload(items_count)
+        raw = StdJSONCodec().dumps(payload)
+        payloads.append(('{}KB'.format(len(raw) // 1024), payload, raw))
+
+    print('{:>10} {:>8} {:>12} {:>12}'.format(
+        'codec', 'payload', 'loads, ms', 'dumps, ms'))
+    for codec in available_json_codecs():
+        for name, payload, raw in payloads:
+            loads_t = measure(codec.loads, raw, rounds)
+            dumps_t = measure(codec.dumps, payload, rounds)
+            print('{:>10} {:>8} {:>12.3f} {:>12.3f}'.format(
+                codec.name, name, loads_t, dumps_t))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
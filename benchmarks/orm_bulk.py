@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+ORM bulk operations benchmark (SQLite reference database).
+
+Compares Model.save() called in loop with Model.save_many()
+and Model.remove() in loop with Model.remove_many().
+
+Usage: python3 benchmarks/orm_bulk.py [objects count]
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core.orm import Model
+from leela.core.orm_sqlite import SQLiteDatabase
+
+
+class Item(Model):
+    name = None
+    value = 0
+    tags = []
+
+
+def make_items(count):
+    return [Item(_id=str(i), name='item{}'.format(i), value=i, tags=['x'])
+            for i in range(count)]
+
+
+@asyncio.coroutine
+def run(count):
+    path = tempfile.mkdtemp()
+    db = SQLiteDatabase(os.path.join(path, 'bench.db'))
+    yield from db.connect()
+    Item.init(db)
+    try:
+        items = make_items(count)
+        t0 = time.time()
+        for item in items:
+            yield from item.save()
+        save_time = time.time() - t0
+
+        t0 = time.time()
+        for item in items:
+            yield from item.remove()
+        remove_time = time.time() - t0
+
+        items = make_items(count)
+        t0 = time.time()
+        yield from Item.save_many(items)
+        save_many_time = time.time() - t0
+
+        t0 = time.time()
+        yield from Item.remove_many(items)
+        remove_many_time = time.time() - t0
+    finally:
+        yield from db.disconnect()
+        shutil.rmtree(path)
+
+    print('{:>12} {:>12} {:>12} {:>8}'.format('operation', 'loop, s',
+                                              'bulk, s', 'speedup'))
+    print('{:>12} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+        'save', save_time, save_many_time, save_time / save_many_time))
+    print('{:>12} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+        'remove', remove_time, remove_many_time,
+        remove_time / remove_many_time))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    asyncio.get_event_loop().run_until_complete(run(count))
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""
+ORM model objects benchmark.
+
+Compares Model and CompactModel: objects construction (like rows
+loaded from database), fields access, to_dict() and memory per object.
+
+Usage: python3 benchmarks/orm_models.py [objects count]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core.orm import Model, CompactModel
+
+
+class Item(Model):
+    name = None
+    value = 0
+    price = 0.0
+    is_active = True
+    tags = []
+
+
+class CompactItem(CompactModel):
+    name = None
+    value = 0
+    price = 0.0
+    is_active = True
+    tags = []
+
+
+def make_rows(count):
+    return [{'_id': str(i), 'name': 'item{}'.format(i), 'value': i,
+             'price': i / 10} for i in range(count)]
+
+
+def memory_per_object(model_class, rows):
+    tracemalloc.start()
+    objects = [model_class(**row) for row in rows]
+    memory = tracemalloc.get_traced_memory()[0] / len(objects)
+    tracemalloc.stop()
+    return memory
+
+
+def bench(model_class, rows):
+    t0 = time.time()
+    objects = [model_class(**row) for row in rows]
+    construct_time = time.time() - t0
+
+    t0 = time.time()
+    for obj in objects:
+        obj.name, obj.value, obj.price, obj.is_active
+    access_time = time.time() - t0
+
+    t0 = time.time()
+    for obj in objects:
+        obj.to_dict()
+    to_dict_time = time.time() - t0
+    memory = memory_per_object(model_class, rows[:100000])
+    return construct_time, access_time, to_dict_time, memory
+
+
+def main(count):
+    rows = make_rows(count)
+    results = [('Model', bench(Item, rows)),
+               ('CompactModel', bench(CompactItem, rows))]
+
+    print('{:>14} {:>12} {:>12} {:>12} {:>14}'.format(
+        'class', 'construct, s', 'access, s', 'to_dict, s', 'bytes/object'))
+    for name, (construct, access, to_dict, memory) in results:
+        print('{:>14} {:>12.3f} {:>12.3f} {:>12.3f} {:>14.0f}'.format(
+            name, construct, access, to_dict, memory))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""
+Middlewares pipeline microbenchmark.
+
+Compares requests/sec of legacy per-request middlewares walk
+with precompiled per-route pipeline for 0, 3 and 10 middlewares.
+Handlers are called directly (without network stack).
+
+Usage: python3 benchmarks/pipeline.py [requests count]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import traceback
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core import *
+from leela.core.middleware import LeelaMiddleware
+from leela.middlewares.auth import AuthMiddleware
+
+
+class FakeContent(object):
+    @asyncio.coroutine
+    def read(self):
+        return b''
+
+
+class FakeRequest(object):
+    method = 'GET'
+    path = '/api/bench'
+    match_info = {}
+    GET = {}
+    cookies = {}
+    content = FakeContent()
+
+
+class NoopMiddleware(LeelaMiddleware):
+    pass
+
+
+class HeaderMiddleware(LeelaMiddleware):
+    @asyncio.coroutine
+    def on_response(self, request, data, response, params, cache):
+        response.headers['X-Bench'] = '1'
+        return response
+
+
+def legacy_handler(service, method):
+    """request handler as it was built before routes compilation"""
+    def handler(request):
+        try:
+            dclass = method._l_decorator_class
+            data = yield from dclass._parse_request(request)
+
+            mw_cache = {}
+            for middleware in service.middlewares():
+                resp = yield from middleware.on_request(
+                    request, data, method._l_api.mw_params, mw_cache)
+                if resp:
+                    return resp
+
+            ret = yield from method(data)
+            resp = dclass._form_response(ret)
+
+            for middleware in service.middlewares():
+                resp = yield from middleware.on_response(
+                    request, data, resp, method._l_api.mw_params, mw_cache)
+        except web.HTTPException as ex:
+            resp = ex
+        except Exception as ex:
+            resp = web.Response(text=traceback.format_exc(), status=500)
+
+        return resp
+    return asyncio.coroutine(handler)
+
+
+def make_middlewares(count):
+    kinds = [NoopMiddleware, AuthMiddleware, HeaderMiddleware]
+    return [kinds[i % len(kinds)]() for i in range(count)]
+
+
+def make_service(mw_count):
+    class BenchService(LeelaService):
+        @leela_get('bench')
+        def bench(self, req):
+            return {'status': 'ok'}
+
+    BenchService.set_middlewares(make_middlewares(mw_count))
+    return BenchService()
+
+
+def measure(loop, handler, count):
+    request = FakeRequest()
+
+    @asyncio.coroutine
+    def run():
+        for _ in range(count):
+            yield from handler(request)
+
+    t0 = time.perf_counter()
+    loop.run_until_complete(run())
+    return count / (time.perf_counter() - t0)
+
+
+def main(count):
+    loop = asyncio.get_event_loop()
+    print('{:>12} {:>14} {:>14} {:>8}'.format(
+        'middlewares', 'legacy req/s', 'compiled req/s', 'speedup'))
+    for mw_count in (0, 3, 10):
+        service = make_service(mw_count)
+        method = service.bench
+
+        old = measure(loop, legacy_handler(service, method), count)
+        handler, _ = leela_api._compile_route(service, method)
+        new = measure(loop, handler, count)
+
+        print('{:>12} {:>14.0f} {:>14.0f} {:>7.2f}x'.format(
+            mw_count, old, new, new / old))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
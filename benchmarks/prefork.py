@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""
+Pre-fork mode benchmark.
+
+Starts N leela workers accepting connections on one shared TCP socket
+(like leela dispatcher does with nginx_proxy: false) and measures
+requests/sec of simple API method with keep-alive HTTP clients.
+
+Usage: python3 benchmarks/prefork.py [workers count] [seconds]
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core import *
+
+HOST = '127.0.0.1'
+CONCURRENCY = 64
+REQUEST = ('GET /api/bench HTTP/1.1\r\n'
+           'Host: {}\r\n\r\n'.format(HOST)).encode()
+
+
+class BenchService(LeelaService):
+    @leela_get('bench')
+    def bench(self, req):
+        return {'status': 'ok'}
+
+
+def run_worker(sock):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = Application()
+    loop.run_until_complete(
+        app.init_service('benchmarks.prefork.BenchService', {}, []))
+    app.make_tcp_server(None, None, sock=sock)
+    loop.add_signal_handler(signal.SIGINT, loop.stop)
+    loop.run_forever()
+
+
+@asyncio.coroutine
+def client(port, deadline, counter):
+    reader, writer = yield from asyncio.open_connection(HOST, port)
+    while time.time() < deadline:
+        writer.write(REQUEST)
+        length = 0
+        while True:
+            line = yield from reader.readline()
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+            if line == b'\r\n':
+                break
+        yield from reader.readexactly(length)
+        counter[0] += 1
+    writer.close()
+
+
+def measure(port, seconds):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    counter = [0]
+    deadline = time.time() + seconds
+    clients = [client(port, deadline, counter) for _ in range(CONCURRENCY)]
+    loop.run_until_complete(asyncio.gather(*clients))
+    loop.close()
+    return counter[0] / seconds
+
+
+def main(workers_count, seconds):
+    for count in sorted({1, workers_count}):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((HOST, 0))
+        sock.listen(1024)
+        port = sock.getsockname()[1]
+
+        workers = [multiprocessing.Process(target=run_worker, args=(sock,))
+                   for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        time.sleep(1)
+
+        # load generator runs in separate process too
+        with multiprocessing.Pool(1) as pool:
+            rps = pool.apply(measure, (port, seconds))
+        print('{} worker(s): {:.0f} req/s'.format(count, rps))
+
+        for worker in workers:
+            os.kill(worker.pid, signal.SIGINT)
+            worker.join()
+        sock.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count(),
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10)
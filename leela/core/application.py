@@ -12,6 +12,16 @@ from aiohttp import web
 from leela.core.decorators import leela_api
 from leela.core.service import LeelaService
 from leela.core.middleware import LeelaMiddleware
+from leela.core.codecs import get_json_codec
+from leela.core.compression import Compressor, MIN_SIZE
+from leela.core.static import StaticFiles
+from leela.core import metrics
+from leela.core import executors
+from leela.utils.logger import logger
+
+
+# interval of requests metrics dumping for leela dispatcher
+METRICS_DUMP_INTERVAL = 5
 
 
 class Application(object):
@@ -21,6 +31,8 @@ class Application(object):
         self.__unixsocket = None
         self.__server = None
         self.__handler = None
+        self.__metrics_path = None
+        self.__metrics_task = None
 
     def set_logger_config(self, logger_config_path):
         try:
@@ -31,6 +43,37 @@ class Application(object):
             raise RuntimeError('Invalid logger config file: {}'
                                .format(err))
 
+    def set_json_codec(self, codec_name):
+        leela_api.set_json_codec(get_json_codec(codec_name))
+
+    def set_compression(self, min_size=MIN_SIZE):
+        """compress responses of API methods (if client accepts it).
+        MUST be called before server is started
+        """
+        leela_api.set_compressor(Compressor(min_size))
+
+    def set_executors(self, thread_pool_size=None, process_pool_size=None):
+        """set sizes of pools for API methods with executor parameter"""
+        executors.configure(thread_pool_size, process_pool_size)
+
+    def dump_metrics(self, path, interval=METRICS_DUMP_INTERVAL):
+        """dump requests metrics to file periodically and on destroy"""
+        self.__metrics_path = path
+        self.__metrics_task = asyncio.ensure_future(
+            self.__dump_metrics_loop(interval))
+
+    @asyncio.coroutine
+    def __dump_metrics_loop(self, interval):
+        while True:
+            yield from asyncio.sleep(interval)
+            self.__dump_metrics()
+
+    def __dump_metrics(self):
+        try:
+            metrics.registry.dump(self.__metrics_path)
+        except OSError as err:
+            logger.error('Requests metrics dump failed: {}'.format(err))
+
     def _import_class(self, class_endpoint):
         parts = class_endpoint.split('.')
         class_name = parts.pop(-1)
@@ -106,34 +149,35 @@ class Application(object):
         self.__services.append(s_instance)
 
     def handle_static(self, static_path):
-        self.__app.router.add_static('/static', static_path)
-
-        @asyncio.coroutine
-        def root_handler(request):
-            idx_path = os.path.join(static_path, 'index.html')
-            if not os.path.exists(idx_path):
-                raise web.HTTPNotFound()
-            data = open(idx_path).read()
-            return web.Response(body=data.encode())
+        static_files = StaticFiles(static_path)
+        self.__app.router.add_route('GET', '/static/{filename:.+}',
+                                    static_files.handle)
 
         @asyncio.coroutine
         def root_opt_handler(request):
             return web.Response(headers={'Allow': 'GET'})
 
-        self.__app.router.add_route('GET', '/', root_handler)
+        self.__app.router.add_route('GET', '/', static_files.handle_index)
         self.__app.router.add_route('OPTIONS', '/', root_opt_handler)
 
     def __make_router(self):
-        for method, obj_name, handle, _, opt_handler in leela_api.get_routes():
+        for method, obj_name, handle, _, opt_handler in \
+                leela_api.compile_routes():
             path = "/api/{}".format(obj_name)
             self.__app.router.add_route(method, path, handle)
             self.__app.router.add_route('OPTIONS', path, opt_handler)
 
-    def make_tcp_server(self, host, port):
+    def make_tcp_server(self, host, port, sock=None):
+        """start TCP server on host:port
+        or on already bound socket if sock is passed
+        """
         self.__make_router()
         loop = asyncio.get_event_loop()
         self.__handler = self.__app.make_handler()
-        future = loop.create_server(self.__handler, host, port)
+        if sock is not None:
+            future = loop.create_server(self.__handler, sock=sock)
+        else:
+            future = loop.create_server(self.__handler, host, port)
         self.__server = loop.run_until_complete(future)
 
     def make_unix_server(self, path):
@@ -159,6 +203,12 @@ class Application(object):
             yield from self.__server.wait_closed()
 
         yield from self.__app.finish()
+        executors.shutdown()
+
+        if self.__metrics_task:
+            self.__metrics_task.cancel()
+            self.__dump_metrics()
+        self.__metrics_task = None
 
         self.__services = []
         self.__server = None
@@ -0,0 +1,120 @@
+import json
+import datetime
+
+
+class JSONCodec(object):
+    """Base JSON codec interface
+
+    loads() gets raw request body (bytes)
+    dumps() returns encoded bytes ready for sending
+    """
+    name = None
+
+    def loads(self, data):
+        raise NotImplementedError()
+
+    def dumps(self, obj):
+        raise NotImplementedError()
+
+
+def _default(obj):
+    """encodes values of types that are not supported by JSON
+    (all codecs encode them in the same way)
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return obj.decode()
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def _json_types(obj):
+    """copy of obj with values of not JSON types encoded by _default()"""
+    if isinstance(obj, dict):
+        return {key: _json_types(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_types(item) for item in obj]
+    if obj is None or isinstance(obj, (str, int, float)):
+        return obj
+    return _default(obj)
+
+
+class StdJSONCodec(JSONCodec):
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=_default).encode()
+
+
+class OrJSONCodec(JSONCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+        self.__dumps = orjson.dumps
+        self.__option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj):
+        return self.__dumps(obj, default=_default, option=self.__option)
+
+
+class UJSONCodec(JSONCodec):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.loads = ujson.loads
+        self.__dumps = ujson.dumps
+
+    def dumps(self, obj):
+        try:
+            return self.__dumps(obj, ensure_ascii=False).encode()
+        except TypeError:
+            # ujson does not call default() for not JSON types
+            return self.__dumps(_json_types(obj), ensure_ascii=False).encode()
+
+
+class RapidJSONCodec(JSONCodec):
+    name = 'rapidjson'
+
+    def __init__(self):
+        import rapidjson
+        self.loads = rapidjson.loads
+        self.__dumps = rapidjson.dumps
+        self.__mapping_mode = rapidjson.MM_COERCE_KEYS_TO_STRINGS
+
+    def dumps(self, obj):
+        return self.__dumps(obj, ensure_ascii=False, default=_default,
+                            mapping_mode=self.__mapping_mode).encode()
+
+
+JSON_CODECS = {codec.name: codec for codec in (StdJSONCodec, OrJSONCodec,
+                                               UJSONCodec, RapidJSONCodec)}
+
+
+def get_json_codec(name):
+    """get JSON codec instance by name (json, orjson, ujson, rapidjson)"""
+    codec_class = JSON_CODECS.get(name, None)
+    if codec_class is None:
+        raise RuntimeError('Unknown JSON codec "{}" (supported: {})'
+                           .format(name, ', '.join(sorted(JSON_CODECS))))
+    try:
+        return codec_class()
+    except ImportError as err:
+        raise RuntimeError('JSON codec "{}" is not available: {}'
+                           .format(name, err))
+
+
+def available_json_codecs():
+    """get instances of all JSON codecs installed in system"""
+    ret = []
+    for name in sorted(JSON_CODECS):
+        try:
+            ret.append(get_json_codec(name))
+        except RuntimeError:
+            pass
+    return ret
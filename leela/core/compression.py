@@ -0,0 +1,170 @@
+"""
+Responses compression negotiated by Accept-Encoding request header.
+
+It is used by workers that serve clients directly (without nginx proxy).
+gzip and deflate are always available, brotli - if brotli package
+is installed. Large bodies are compressed in shared thread pool
+of worker, so event loop is not blocked by compression.
+"""
+
+import zlib
+import gzip
+import asyncio
+import functools
+from aiohttp import web
+
+from leela.core import executors
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# responses with smaller bodies are not compressed
+MIN_SIZE = 500
+# bodies of this size and larger are compressed in executor
+EXECUTOR_MIN_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+# fast brotli quality for dynamic content (11 is too slow)
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = frozenset(('application/json', 'application/x-ndjson',
+                                'application/javascript', 'application/xml',
+                                'image/svg+xml'))
+
+# codings supported by aiohttp for streamed responses
+_STREAM_CODINGS = ('gzip', 'deflate')
+
+
+def parse_accept_encoding(header):
+    """returns dict {coding: quality} of Accept-Encoding header value"""
+    ret = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        ret[coding] = quality
+    return ret
+
+
+def coded_etag(etag, coding):
+    """ETag of response body compressed by coding
+    (as ETags of precompressed static files)
+    """
+    if etag.endswith('"'):
+        return '{}-{}"'.format(etag[:-1], coding)
+    return '{}-{}'.format(etag, coding)
+
+
+def is_compressible(content_type):
+    if not content_type:
+        return False
+    return content_type.startswith('text/') or \
+        content_type in COMPRESSIBLE_TYPES
+
+
+def add_vary(response):
+    """add Accept-Encoding to Vary header of response"""
+    vary = response.headers.get('VARY', None)
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        response.headers['Vary'] = vary + ', Accept-Encoding'
+
+
+class Compressor(object):
+    """compresses bodies of API methods responses
+
+    min_size - responses with smaller bodies are not compressed
+    use_brotli - use brotli if client accepts it (and package is installed)
+    """
+    def __init__(self, min_size=MIN_SIZE, *, use_brotli=True):
+        self.__min_size = min_size
+        self.__codings = [
+            ('gzip', functools.partial(gzip.compress,
+                                       compresslevel=GZIP_LEVEL)),
+            ('deflate', functools.partial(zlib.compress, level=GZIP_LEVEL))]
+        if use_brotli and brotli is not None:
+            self.__codings.insert(0, ('br', functools.partial(
+                brotli.compress, quality=BROTLI_QUALITY)))
+
+    def codings(self):
+        """names of supported codings in preference order"""
+        return [name for name, _ in self.__codings]
+
+    def compressible(self, content_type, size):
+        """body of such type and size should be compressed"""
+        return size >= self.__min_size and is_compressible(content_type)
+
+    def negotiate(self, accept_encoding, codings=None):
+        """returns (coding, compress function) accepted by client
+        (one of codings if they are passed) or (None, None)
+        """
+        if not accept_encoding:
+            return None, None
+        accepted = parse_accept_encoding(accept_encoding)
+        default = accepted.get('*', 0.0)
+        for name, compress in self.__codings:
+            if codings is not None and name not in codings:
+                continue
+            if accepted.get(name, default) > 0:
+                return name, compress
+        return None, None
+
+    @asyncio.coroutine
+    def compress(self, request, response):
+        """compress response body if client accepts it (response
+        is changed in place). Streamed responses are compressed
+        by aiohttp while they are written.
+        """
+        if 'CONTENT-ENCODING' in response.headers or \
+                not is_compressible(response.content_type):
+            return response
+
+        is_stream = not isinstance(response, web.Response)
+        if not is_stream and (response.body is None or
+                              len(response.body) < self.__min_size):
+            return response
+
+        add_vary(response)
+        coding, compress = self.negotiate(
+            request.headers.get('ACCEPT-ENCODING', ''),
+            _STREAM_CODINGS if is_stream else None)
+        if coding is None:
+            return response
+
+        etag = response.headers.get('ETAG', None)
+        if is_stream:
+            response.enable_compression()
+            if etag is not None and not etag.startswith('W/'):
+                # coding is selected by aiohttp
+                response.headers['ETag'] = 'W/' + etag
+            return response
+
+        response.body = yield from self.compress_body(compress,
+                                                      response.body)
+        response.headers['Content-Encoding'] = coding
+        if etag is not None:
+            response.headers['ETag'] = coded_etag(etag, coding)
+        return response
+
+    @staticmethod
+    @asyncio.coroutine
+    def compress_body(compress, body):
+        """compress body by compress function returned by negotiate()
+        (large bodies are compressed in thread pool)
+        """
+        if len(body) >= EXECUTOR_MIN_SIZE:
+            pool = executors.get_executor(executors.THREAD)
+            return (yield from pool.run(compress, body))
+        return compress(body)
+
@@ -1,13 +1,19 @@
 
-import json
 import re
 import inspect
 import asyncio
 import aiohttp
+import functools
 import traceback
-from aiohttp import web
+from time import perf_counter
+from aiohttp import web, hdrs
+from aiohttp.multipart import MultipartReader, parse_content_disposition
 
 from leela.utils.logger import logger
+from leela.core.codecs import StdJSONCodec
+from leela.core import metrics
+from leela.core import executors
+from leela.core import uploads
 
 
 class SmartDict(dict):
@@ -19,7 +25,11 @@ class SmartDict(dict):
             self[key] = value
 
     def __getattr__(self, attr):
-        return self[attr]
+        try:
+            return self[attr]
+        except KeyError:
+            # AttributeError is expected by pickle and copy
+            raise AttributeError(attr)
 
     def __setattr__(self, attr, value):
         raise ValueError('Request should not be modified')
@@ -42,24 +52,188 @@ class SmartRequest:
             self.query, self.params, self.data)
 
 
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+class JSONStreamResponse(web.StreamResponse):
+    """Streamed JSON array (or NDJSON if client accepts it)
+    of items from iterator or async iterator.
+
+    Items are encoded one by one and written by chunks using
+    chunked transfer encoding, so whole result is never kept in memory.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, items, codec):
+        super().__init__()
+        self.__items = items
+        self.__codec = codec
+        self.content_type = 'application/json'
+
+    @classmethod
+    def is_stream(cls, obj):
+        return hasattr(obj, '__next__') or hasattr(obj, '__aiter__')
+
+    @asyncio.coroutine
+    def stream(self, request):
+        ndjson = NDJSON_CONTENT_TYPE in request.headers.get('ACCEPT', '')
+        if ndjson:
+            self.content_type = NDJSON_CONTENT_TYPE
+            begin, delimiter, end = b'', b'\n', b'\n'
+        else:
+            self.content_type = 'application/json'
+            begin, delimiter, end = b'[', b',', b']'
+
+        self.enable_chunked_encoding()
+        self.start(request)
+
+        dumps = self.__codec.dumps
+        buf = bytearray(begin)
+        first = True
+        items = self.__items
+        is_async = hasattr(items, '__aiter__')
+        if is_async:
+            items = items.__aiter__()
+        else:
+            items = iter(items)
+
+        try:
+            while True:
+                try:
+                    if is_async:
+                        item = yield from items.__anext__()
+                    else:
+                        item = next(items)
+                except (StopIteration, StopAsyncIteration):
+                    break
+
+                if not first:
+                    buf += delimiter
+                first = False
+                buf += dumps(item)
+
+                if len(buf) >= self.CHUNK_SIZE:
+                    self.write(bytes(buf))
+                    buf = bytearray()
+                    yield from self.drain()
+
+            if not (ndjson and first):
+                # empty NDJSON stream is just empty body
+                buf += end
+            if buf:
+                self.write(bytes(buf))
+            yield from self.write_eof()
+        except Exception as err:
+            logger.error('JSON stream to {} failed: {}'
+                         .format(request.path, err), exc_info=1)
+            self.force_close()
+            if is_async and hasattr(items, 'aclose'):
+                # e.g. ORM cursor holds database connection
+                yield from items.aclose()
+
+
+def query_key(request, data):
+    """single flight key of request: path and query parameters"""
+    return (request.path, tuple(sorted(request.GET.items())))
+
+
+_CONTENT_HEADERS = ('CONTENT-TYPE', 'CONTENT-LENGTH')
+
+
+class _SingleFlight(object):
+    """concurrent calls of API method with the same key share
+    one method call and its encoded response
+    """
+    __slots__ = ('key_func', 'per_session', 'in_flight')
+
+    def __init__(self, key_func, per_session):
+        self.key_func = key_func
+        self.per_session = per_session
+        self.in_flight = {}
+
+    def key(self, request, data):
+        key = self.key_func(request, data)
+        if self.per_session:
+            # results are never shared between sessions
+            session_id = data.session.get_id() if data.session else None
+            key = (key, session_id)
+        return key
+
+    @asyncio.coroutine
+    def call(self, key, call_method):
+        pending = self.in_flight.get(key, None)
+        if pending is not None:
+            shared = yield from asyncio.shield(pending)
+            if shared is not None:
+                status, body, headers, content_type, charset = shared
+                resp = web.Response(body=body, status=status,
+                                    headers=headers,
+                                    content_type=content_type)
+                if charset:
+                    resp.charset = charset
+                return resp
+            # failed or not shareable (e.g. stream) response
+            return (yield from call_method())
+
+        future = self.in_flight[key] = asyncio.Future()
+        shared = None
+        try:
+            resp = yield from call_method()
+            if type(resp) is web.Response and resp.body is not None:
+                # response can be changed by middlewares later
+                # (content headers are set by shared response itself)
+                headers = {str(name): value
+                           for name, value in resp.headers.items()
+                           if name.upper() not in _CONTENT_HEADERS}
+                shared = (resp.status, resp.body, headers,
+                          resp.content_type, resp.charset)
+            return resp
+        finally:
+            del self.in_flight[key]
+            future.set_result(shared)
+
+
 class leela_api(object):
     http_method = None
     __routes = []
     __routes_map = {}
+    __compiled_routes = []
+    _json_codec = StdJSONCodec()
+    _compressor = None
+    # classmethod(data) that releases resources of parsed request
+    _release_request = None
 
     def __init__(self, object_name, *,
-                 req_validator=None, resp_validator=None, **mw_params):
+                 req_validator=None, resp_validator=None,
+                 single_flight=False, executor=None, **mw_params):
         """
         object_name - name of API object
         req_validator - request validator (None if no need to validate)
         resp_validator - response validator (None if no need to validate)
+        single_flight - concurrent requests with the same key share
+                        single method call (True - requests are keyed
+                        by query_key(), or callable(request, data) -> key)
+        executor - 'thread' or 'process' for calling blocking (not
+                   coroutine) method in worker's pool
         mw_params - parameters for middlewares
         """
+        if single_flight and self.http_method != 'GET':
+            raise ValueError('single_flight is supported by GET API '
+                             'methods only ({})'.format(object_name))
+        if executor not in (None, executors.THREAD, executors.PROCESS):
+            raise ValueError('Unknown executor "{}" of API method {}'
+                             .format(executor, object_name))
         self.object_name = object_name
         self.req_validator = req_validator
         self.resp_validator = resp_validator
+        self.single_flight = single_flight
+        self.executor = executor
         self.mw_params = mw_params
 
+    def _request_parser(self):
+        """returns coroutine function(request) -> SmartRequest"""
+        return self._parse_request
+
     @classmethod
     @asyncio.coroutine
     def _parse_request(cls, request):
@@ -70,7 +244,7 @@ class leela_api(object):
 
         data = yield from request.content.read()
         if data:
-            data = json.loads(data.decode())
+            data = cls._json_codec.loads(data)
         else:
             data = {}
 
@@ -82,71 +256,289 @@ class leela_api(object):
         if isinstance(ret_object, web.Response):
             return ret_object
 
-        return web.Response(body=json.dumps(ret_object).encode(),
+        if JSONStreamResponse.is_stream(ret_object):
+            return JSONStreamResponse(ret_object, cls._json_codec)
+
+        return web.Response(body=cls._json_codec.dumps(ret_object),
                             content_type='application/json')
 
     def __call__(self, func):
         func._l_api = self
         func._l_decorator_class = self.__class__
 
-        return asyncio.coroutine(func)
+        if self.executor is None:
+            return asyncio.coroutine(func)
+        return self.__executor_method(func)
+
+    def __executor_method(self, func):
+        if inspect.isgeneratorfunction(func):
+            raise ValueError('Method {} called in executor should not be '
+                             'coroutine'.format(func.__qualname__))
+        kind = self.executor
+        route = (self.http_method, self.object_name)
+
+        @functools.wraps(func)
+        @asyncio.coroutine
+        def wrapper(service, req):
+            wait_hist = metrics.registry.route(*route).stage('executor_wait')
+            if kind == executors.THREAD:
+                args = (func, service, req)
+            else:
+                # service and session are not available in other process
+                p_req = SmartRequest()
+                p_req.params, p_req.query, p_req.data = \
+                    req.params, req.query, req.data
+                args = (executors.call_method, func.__module__,
+                        func.__qualname__, (None, p_req))
+            return (yield from executors.get_executor(kind).run(
+                *args, wait_hist=wait_hist))
+        return wrapper
+
+    @classmethod
+    def set_json_codec(cls, codec):
+        """set JSON codec (leela.core.codecs.JSONCodec instance)
+        for all API methods
+        """
+        leela_api._json_codec = codec
+
+    @classmethod
+    def set_compressor(cls, compressor):
+        """set responses compressor (leela.core.compression.Compressor
+        instance or None) for all API methods
+        """
+        leela_api._compressor = compressor
+
+    @classmethod
+    def get_compressor(cls):
+        return leela_api._compressor
 
     @classmethod
     def _decorate_method(cls, service, method):
+        docs = '' if not method.__doc__ \
+                  else method.__doc__.strip().split('\n')[0]
+        cls.__routes.append((method._l_api.http_method,
+                             method._l_api.object_name,
+                             service,
+                             method,
+                             docs))
+
+    @classmethod
+    def _compile_pipeline(cls, service, method):
+        """resolve middlewares hooks that are active for method's mw_params
+
+        Returns tuple (on_request hooks, on_response hooks,
+        on_response hooks for OPTIONS requests, on_failure hooks)
+        of bound methods
+        """
+        mw_params = method._l_api.mw_params
+        on_request = []
+        on_response = []
+        on_preflight = []
+        on_failure = []
+        for middleware in service.middlewares():
+            if middleware.need_on_request(mw_params):
+                on_request.append(middleware.on_request)
+            if middleware.need_on_response(mw_params):
+                on_response.append(middleware.on_response)
+            if middleware.need_on_preflight(mw_params):
+                on_preflight.append(middleware.on_response)
+            if middleware.need_on_failure(mw_params):
+                on_failure.append(middleware.on_failure)
+        return (tuple(on_request), tuple(on_response), tuple(on_preflight),
+                tuple(on_failure))
+
+    @classmethod
+    def _compile_route(cls, service, method):
+        dclass = method._l_decorator_class
+        parse_request = method._l_api._request_parser()
+        release_request = dclass._release_request
+        form_response = dclass._form_response
+        mw_params = method._l_api.mw_params
+        on_request, on_response, on_preflight, on_failure = \
+            cls._compile_pipeline(service, method)
+
+        route_metrics = metrics.registry.route(method._l_api.http_method,
+                                               method._l_api.object_name)
+        total_hist = route_metrics.stage('total')
+        parse_hist = route_metrics.stage('parse')
+        handler_hist = route_metrics.stage('handler')
+        serialize_hist = route_metrics.stage('serialize')
+        # stages of middlewares are named by position and endpoint
+        mw_names = {id(middleware): '{}:{}.{}'.format(
+            pos, type(middleware).__module__, type(middleware).__qualname__)
+            for pos, middleware in enumerate(service.middlewares())}
+        mw_on_response_hooks = tuple(
+            (hook, route_metrics.stage('{}.on_response'.format(
+                mw_names[id(hook.__self__)])))
+            for hook in on_response)
+        # response returned by on_request() of middleware is processed
+        # by on_response() of middlewares with on_request() called before
+        mw_on_request_hooks = []
+        requested = set()
+        for hook in on_request:
+            mw_on_request_hooks.append((
+                hook, route_metrics.stage('{}.on_request'.format(
+                    mw_names[id(hook.__self__)])),
+                tuple((mw_hook, hist)
+                      for mw_hook, hist in mw_on_response_hooks
+                      if mw_hook.__self__ in requested)))
+            requested.add(hook.__self__)
+        compressor = cls._compressor
+        compress_hist = route_metrics.stage('compress') \
+            if compressor is not None else None
+
+        single_flight = None
+        if method._l_api.single_flight:
+            key_func = method._l_api.single_flight
+            if key_func is True:
+                key_func = query_key
+            # authorization sensitive results are shared by session only
+            single_flight = _SingleFlight(key_func,
+                                          bool(mw_params.get('auth', None)))
+
+        @asyncio.coroutine
+        def call_method(data):
+            ret = yield from method(data)
+            return form_response(ret)
+
+        @asyncio.coroutine
+        def failed(request, data, error, mw_cache):
+            for mw_on_failure in on_failure:
+                try:
+                    yield from mw_on_failure(request, data, error,
+                                             mw_params, mw_cache)
+                except Exception:
+                    logger.error('{} failed'.format(mw_on_failure),
+                                 exc_info=1)
+
+        @asyncio.coroutine
         def handler(request):
+            started = perf_counter()
+            resp = None
+            data = None
+            mw_cache = {}
             try:
-                dclass = method._l_decorator_class
-
-                data = yield from dclass._parse_request(request)
+                data = yield from parse_request(request)
+                stamp = perf_counter()
+                parse_hist.observe(stamp - started)
 
                 #FIXME req validation
 
-                mw_cache = {}
-                for middleware in service.middlewares():
-                    resp = yield from middleware.on_request(
-                        request, data, method._l_api.mw_params, mw_cache)
+                for mw_on_request, hist, early_hooks in mw_on_request_hooks:
+                    resp = yield from mw_on_request(
+                        request, data, mw_params, mw_cache)
+                    now = perf_counter()
+                    hist.observe(now - stamp)
+                    stamp = now
                     if resp:
                         assert isinstance(resp, web.Response), \
                             'Middleware {} returns invalid response: {}' \
-                            .format(middleware, resp)
+                            .format(mw_on_request.__self__, resp)
+                        for mw_on_response, hist in early_hooks:
+                            resp = yield from mw_on_response(
+                                request, data, resp, mw_params, mw_cache)
+                            now = perf_counter()
+                            hist.observe(now - stamp)
+                            stamp = now
+                        if compressor is not None:
+                            resp = yield from compressor.compress(request,
+                                                                  resp)
                         return resp
 
-                ret = yield from method(data)
-
-                #FIXME resp validation
-
-                resp = dclass._form_response(ret)
-
-                for middleware in service.middlewares():
-                    resp = yield from middleware.on_response(
-                        request, data, resp, method._l_api.mw_params, mw_cache)
+                if single_flight is None:
+                    ret = yield from method(data)
+                    now = perf_counter()
+                    handler_hist.observe(now - stamp)
+                    stamp = now
+
+                    #FIXME resp validation
+
+                    resp = form_response(ret)
+                    now = perf_counter()
+                    serialize_hist.observe(now - stamp)
+                else:
+                    key = single_flight.key(request, data)
+                    resp = yield from single_flight.call(
+                        key, functools.partial(call_method, data))
+                    now = perf_counter()
+                    handler_hist.observe(now - stamp)
+                stamp = now
+
+                for mw_on_response, hist in mw_on_response_hooks:
+                    resp = yield from mw_on_response(
+                        request, data, resp, mw_params, mw_cache)
+                    now = perf_counter()
+                    hist.observe(now - stamp)
+                    stamp = now
+
+                if compressor is not None:
+                    resp = yield from compressor.compress(request, resp)
+                    now = perf_counter()
+                    compress_hist.observe(now - stamp)
+                    stamp = now
+
+                if isinstance(resp, JSONStreamResponse):
+                    yield from resp.stream(request)
+                    route_metrics.stage('stream').observe(
+                        perf_counter() - stamp)
             except web.HTTPException as ex:
                 resp = ex
+                if on_failure:
+                    yield from failed(request, data, ex, mw_cache)
             except Exception as ex:
                 resp = web.Response(text=traceback.format_exc(), status=500)
+                if on_failure:
+                    yield from failed(request, data, ex, mw_cache)
+            except BaseException as ex:
+                # handler is cancelled (client is disconnected)
+                if on_failure:
+                    yield from failed(request, data, ex, mw_cache)
+                raise
+            finally:
+                if release_request is not None and data is not None:
+                    release_request(data)
+                route_metrics.count(500 if resp is None else resp.status)
+                total_hist.observe(perf_counter() - started)
 
             return resp
 
+        preflight_metrics = metrics.registry.route('OPTIONS',
+                                                   method._l_api.object_name)
+        preflight_hist = preflight_metrics.stage('total')
+
+        @asyncio.coroutine
         def option_handler(request):
+            started = perf_counter()
             resp = web.Response()
-            for middleware in service.middlewares():
-                resp = middleware.on_response(
-                    request, SmartRequest(), resp,
-                    method._l_api.mw_params, {})
+            data = SmartRequest()
+            mw_cache = {}
+            for mw_on_response in on_preflight:
+                resp = yield from mw_on_response(
+                    request, data, resp, mw_params, mw_cache)
+            preflight_metrics.count(resp.status)
+            preflight_hist.observe(perf_counter() - started)
             return resp
 
+        return handler, option_handler
 
-        docs = '' if not method.__doc__ \
-                  else method.__doc__.strip().split('\n')[0]
-        cls.__routes.append((method._l_api.http_method,
-                             method._l_api.object_name,
-                             handler,
-                             docs,
-                             option_handler))
+    @classmethod
+    def compile_routes(cls):
+        """build request handlers for all registered API methods
+
+        Middlewares pipeline is resolved once per route here,
+        so request processing just walks precomputed hooks tuples
+        """
+        compiled = []
+        for http_method, obj_name, service, method, docs in cls.__routes:
+            handler, option_handler = cls._compile_route(service, method)
+            compiled.append((http_method, obj_name, handler,
+                             docs, option_handler))
+        cls.__compiled_routes = compiled
+        return compiled
 
     @classmethod
     def get_routes(cls):
-        for route in cls.__routes:
+        for route in cls.__compiled_routes:
             yield route
 
     @classmethod
@@ -184,18 +576,105 @@ class leela_delete(leela_post):
 class leela_form_post(leela_api):
     http_method = 'POST'
 
+    def __init__(self, object_name, *, max_size=None, hashes=(),
+                 spool_max_memory=uploads.SPOOL_MAX_MEMORY, upload_dir=None,
+                 **kwargs):
+        """
+        max_size - max size of request body in bytes
+                   (413 is returned for larger requests)
+        hashes - names of hashlib algorithms of uploaded files digests
+                 (computed while files are uploaded)
+        spool_max_memory - uploaded files of this size and larger
+                           are written to temporary files
+        upload_dir - directory of temporary files (system default if None)
+        """
+        super().__init__(object_name, **kwargs)
+        self.max_size = max_size
+        self.upload_params = {'hashes': hashes,
+                              'spool_max_memory': spool_max_memory,
+                              'upload_dir': upload_dir}
+
+    def _request_parser(self):
+        return functools.partial(self._parse_request, max_size=self.max_size,
+                                 **self.upload_params)
+
+    @staticmethod
+    def _check_size(request, max_size):
+        if max_size is not None and request.content_length is not None \
+                and request.content_length > max_size:
+            raise web.HTTPRequestEntityTooLarge(
+                reason='Request is larger than {} bytes'.format(max_size))
+
     @classmethod
     @asyncio.coroutine
-    def _parse_request(cls, request):
+    def _parse_request(cls, request, max_size=None, **upload_params):
         ret = SmartRequest()
 
         ret.params.from_dict(request.match_info)
         ret.query.from_dict(request.GET)
 
-        data = yield from request.post()
-        ret.data.from_dict(data)
+        cls._check_size(request, max_size)
+        if request.content_type != 'multipart/form-data':
+            if max_size is not None and request.content_length is None:
+                # body is read by request.post() completely
+                raise web.HTTPLengthRequired()
+            data = yield from request.post()
+            ret.data.from_dict(data)
+            return ret
+
+        try:
+            yield from cls.__parse_multipart(request, ret.data, max_size,
+                                             upload_params)
+        except BaseException:
+            cls._release_request(ret)
+            raise
         return ret
 
+    @classmethod
+    @asyncio.coroutine
+    def __parse_multipart(cls, request, data, max_size, upload_params):
+        # files are spooled while they are read (body is not buffered)
+        reader = MultipartReader(request.headers, request.content)
+        size = 0
+        while True:
+            part = yield from reader.next()
+            if part is None:
+                break
+            _, disposition = parse_content_disposition(
+                part.headers.get(hdrs.CONTENT_DISPOSITION))
+            name = disposition.get('name', None)
+            remaining = None if max_size is None else max_size - size
+
+            if part.filename is None:
+                value = bytearray()
+                while True:
+                    chunk = yield from part.read_chunk(uploads.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if remaining is not None and \
+                            len(value) + len(chunk) > remaining:
+                        raise web.HTTPRequestEntityTooLarge(
+                            reason='Request is larger than {} bytes'.format(
+                                max_size))
+                    value.extend(chunk)
+                size += len(value)
+                data[name] = part.decode(value).decode(
+                    part.get_charset('utf-8'))
+                continue
+
+            upload = uploads.SpooledUpload(
+                name, part.filename, part.headers.get(hdrs.CONTENT_TYPE),
+                max_size=remaining, **upload_params)
+            data[name] = upload
+            yield from upload.read_from(part.read_chunk)
+            size += upload.size
+
+    @classmethod
+    def _release_request(cls, data):
+        for value in data.data.values():
+            if isinstance(value, uploads.SpooledUpload):
+                value.close()
+
 
 class leela_postfile(leela_form_post):
     @classmethod
@@ -226,15 +705,60 @@ class leela_websocket(leela_get):
 
 
 class leela_uploadstream(leela_post):
+    def __init__(self, object_name, *, spool=False, max_size=None,
+                 hashes=(), spool_max_memory=uploads.SPOOL_MAX_MEMORY,
+                 upload_dir=None, **kwargs):
+        """
+        spool - read request body to request.data.file (SpooledUpload)
+                instead of passing request.data.stream to method
+        max_size, hashes, spool_max_memory, upload_dir -
+                see leela_form_post (hashes and spool_max_memory
+                are used with spool=True only)
+        """
+        super().__init__(object_name, **kwargs)
+        self.spool = spool
+        self.max_size = max_size
+        self.upload_params = {'hashes': hashes,
+                              'spool_max_memory': spool_max_memory,
+                              'upload_dir': upload_dir}
+
+    def _request_parser(self):
+        return functools.partial(self._parse_request, spool=self.spool,
+                                 max_size=self.max_size,
+                                 **self.upload_params)
+
     @classmethod
     @asyncio.coroutine
-    def _parse_request(cls, request):
+    def _parse_request(cls, request, spool=False, max_size=None,
+                       **upload_params):
         ret = SmartRequest()
         ret.params.from_dict(request.match_info)
         ret.query.from_dict(request.GET)
-        ret.data['stream'] = request.content
+        leela_form_post._check_size(request, max_size)
+        if not spool:
+            ret.data['stream'] = request.content
+            return ret
+
+        upload = uploads.SpooledUpload(
+            content_type=request.headers.get(hdrs.CONTENT_TYPE, None),
+            max_size=max_size, **upload_params)
+        ret.data['file'] = upload
+        try:
+            yield from upload.read_from(request.content.read)
+        except BaseException:
+            upload.close()
+            raise
         return ret
 
+    @classmethod
+    def _release_request(cls, data):
+        upload = data.data.get('file', None)
+        if upload is not None:
+            upload.close()
+
     @classmethod
     def _form_response(cls, ret_object):
-        return web.Response()
+        # stream consumers usually return nothing
+        if ret_object is None:
+            return web.Response()
+        return super()._form_response(ret_object)
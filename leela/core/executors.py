@@ -0,0 +1,103 @@
+"""
+Worker executors for blocking API methods.
+
+API methods declared with executor='thread' or executor='process'
+are called in shared thread or process pool of worker, so they do
+not block event loop. Pools are created on first usage.
+"""
+
+import asyncio
+import importlib
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from leela.core import metrics
+
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+def _timed_call(func, args):
+    # executed in pool: returns time when execution is started
+    return perf_counter(), func(*args)
+
+
+def call_method(module_name, qualname, args):
+    """call original function of API method in other process
+    (methods are resolved by name because they can not be pickled)
+    """
+    obj = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj.__wrapped__(*args)
+
+
+class PoolExecutor(object):
+    """thread or process pool with saturation metrics
+
+    max_workers - pool size (default of concurrent.futures if None)
+    """
+    def __init__(self, kind, max_workers=None):
+        if kind not in (THREAD, PROCESS):
+            raise ValueError('Unknown executor "{}"'.format(kind))
+        self.__kind = kind
+        self.__max_workers = max_workers
+        self.__executor = None
+        self.__tasks = metrics.registry.gauge('executor_tasks', pool=kind)
+        self.__workers = metrics.registry.gauge('executor_workers',
+                                                pool=kind)
+
+    def executor(self):
+        if self.__executor is None:
+            if self.__kind == THREAD:
+                self.__executor = ThreadPoolExecutor(self.__max_workers)
+            else:
+                self.__executor = ProcessPoolExecutor(self.__max_workers)
+            self.__workers.value = self.__executor._max_workers
+        return self.__executor
+
+    @asyncio.coroutine
+    def run(self, func, *args, wait_hist=None):
+        """call func(*args) in pool.
+        Time of waiting for free pool worker is observed by wait_hist
+        """
+        loop = asyncio.get_event_loop()
+        self.__tasks.inc()
+        submitted = perf_counter()
+        try:
+            started, ret = yield from loop.run_in_executor(
+                self.executor(), _timed_call, func, args)
+        finally:
+            self.__tasks.dec()
+        if wait_hist is not None:
+            wait_hist.observe(max(started - submitted, 0))
+        return ret
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+            self.__workers.value = 0
+
+
+_executors = {}
+
+
+def configure(thread_pool_size=None, process_pool_size=None):
+    """set pools sizes (MUST be called before pools usage)"""
+    shutdown()
+    _executors[THREAD] = PoolExecutor(THREAD, thread_pool_size)
+    _executors[PROCESS] = PoolExecutor(PROCESS, process_pool_size)
+
+
+def get_executor(kind):
+    if kind not in _executors:
+        _executors[kind] = PoolExecutor(kind)
+    return _executors[kind]
+
+
+def shutdown():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
@@ -0,0 +1,227 @@
+"""
+Requests metrics of API methods.
+
+Every API route has requests counter (by response status) and latency
+histograms for processing stages: total, request parsing, each
+middleware on_request/on_response hook, handler and response
+serialization. Gauges report current state of worker resources
+(e.g. executor pools). Metrics are exported in Prometheus text format.
+"""
+
+import os
+import json
+import tempfile
+from bisect import bisect_left
+
+
+# latency histogram buckets upper bounds (in seconds)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        # last item counts values greater than last bucket
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    __slots__ = ('method', 'route', 'statuses', 'stages')
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.statuses = {}
+        self.stages = {}
+
+    def stage(self, name):
+        """returns latency histogram of processing stage"""
+        hist = self.stages.get(name, None)
+        if hist is None:
+            hist = self.stages[name] = Histogram()
+        return hist
+
+    def count(self, status):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class Gauge:
+    __slots__ = ('name', 'labels', 'value')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+    def dec(self, value=1):
+        self.value -= value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__routes = {}
+        self.__gauges = {}
+
+    def route(self, method, route):
+        key = (method, route)
+        metrics = self.__routes.get(key, None)
+        if metrics is None:
+            metrics = self.__routes[key] = RouteMetrics(method, route)
+        return metrics
+
+    def gauge(self, name, **labels):
+        """returns gauge by name and labels (values of gauges
+        of all workers are summed up)
+        """
+        key = (name, tuple(sorted(labels.items())))
+        gauge = self.__gauges.get(key, None)
+        if gauge is None:
+            gauge = self.__gauges[key] = Gauge(name, labels)
+        return gauge
+
+    def clear(self):
+        """clear routes metrics (gauges are kept)"""
+        self.__routes = {}
+
+    def snapshot(self):
+        """returns JSON serializable copy of collected metrics"""
+        routes = []
+        for metrics in self.__routes.values():
+            routes.append({
+                'method': metrics.method,
+                'route': metrics.route,
+                'statuses': {str(status): count for status, count
+                             in metrics.statuses.items()},
+                'stages': {name: {'counts': list(hist.counts),
+                                  'sum': hist.sum}
+                           for name, hist in metrics.stages.items()}})
+        gauges = [{'name': gauge.name, 'labels': dict(gauge.labels),
+                   'value': gauge.value} for gauge in self.__gauges.values()]
+        return {'buckets': list(BUCKETS), 'routes': routes, 'gauges': gauges}
+
+    def dump(self, path):
+        """write snapshot to file atomically"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as fobj:
+            json.dump(self.snapshot(), fobj)
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+
+def merge_snapshots(snapshots):
+    """sum metrics snapshots of many processes into one snapshot"""
+    routes = {}
+    gauges = {}
+    for snapshot in snapshots:
+        if snapshot.get('buckets', None) != list(BUCKETS):
+            continue  # dumped with other leela version
+        for route in snapshot['routes']:
+            key = (route['method'], route['route'])
+            merged = routes.get(key, None)
+            if merged is None:
+                routes[key] = merged = {'method': route['method'],
+                                        'route': route['route'],
+                                        'statuses': {}, 'stages': {}}
+            for status, count in route['statuses'].items():
+                merged['statuses'][status] = \
+                    merged['statuses'].get(status, 0) + count
+            for name, hist in route['stages'].items():
+                m_hist = merged['stages'].get(name, None)
+                if m_hist is None:
+                    merged['stages'][name] = {'counts': list(hist['counts']),
+                                              'sum': hist['sum']}
+                    continue
+                m_hist['counts'] = [a + b for a, b in
+                                    zip(m_hist['counts'], hist['counts'])]
+                m_hist['sum'] += hist['sum']
+        for gauge in snapshot.get('gauges', ()):
+            key = (gauge['name'], tuple(sorted(gauge['labels'].items())))
+            merged = gauges.get(key, None)
+            if merged is None:
+                gauges[key] = {'name': gauge['name'],
+                               'labels': dict(gauge['labels']),
+                               'value': gauge['value']}
+            else:
+                merged['value'] += gauge['value']
+    return {'buckets': list(BUCKETS), 'routes': list(routes.values()),
+            'gauges': list(gauges.values())}
+
+
+def load_snapshots(path):
+    """read metrics snapshots dumped to directory"""
+    snapshots = []
+    for file_name in os.listdir(path):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(path, file_name)) as fobj:
+                snapshots.append(json.load(fobj))
+        except (IOError, ValueError):
+            continue  # removed or not completely written
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+                     .replace('\n', r'\n')
+
+
+def format_prometheus(snapshot):
+    """returns metrics snapshot in Prometheus text exposition format"""
+    lines = ['# HELP leela_requests_total Total number of API requests.',
+             '# TYPE leela_requests_total counter']
+    routes = sorted(snapshot['routes'],
+                    key=lambda r: (r['route'], r['method']))
+    for route in routes:
+        labels = 'method="{}",route="{}"'.format(_escape(route['method']),
+                                                 _escape(route['route']))
+        for status, count in sorted(route['statuses'].items()):
+            lines.append('leela_requests_total{{{},status="{}"}} {}'
+                         .format(labels, status, count))
+
+    lines.append('# HELP leela_request_duration_seconds '
+                 'API requests processing time by stage.')
+    lines.append('# TYPE leela_request_duration_seconds histogram')
+    bounds = [repr(float(bound)) for bound in snapshot['buckets']]
+    bounds.append('+Inf')
+    for route in routes:
+        for name, hist in sorted(route['stages'].items()):
+            labels = 'method="{}",route="{}",stage="{}"'.format(
+                _escape(route['method']), _escape(route['route']),
+                _escape(name))
+            total = 0
+            for bound, count in zip(bounds, hist['counts']):
+                total += count
+                lines.append('leela_request_duration_seconds_bucket'
+                             '{{{},le="{}"}} {}'.format(labels, bound, total))
+            lines.append('leela_request_duration_seconds_sum{{{}}} {}'
+                         .format(labels, repr(float(hist['sum']))))
+            lines.append('leela_request_duration_seconds_count{{{}}} {}'
+                         .format(labels, total))
+
+    gauges = sorted(snapshot.get('gauges', ()),
+                    key=lambda g: (g['name'], sorted(g['labels'].items())))
+    name = None
+    for gauge in gauges:
+        if gauge['name'] != name:
+            name = gauge['name']
+            lines.append('# TYPE leela_{} gauge'.format(name))
+        labels = ','.join('{}="{}"'.format(key, _escape(value)) for key, value
+                          in sorted(gauge['labels'].items()))
+        lines.append('leela_{}{{{}}} {}'.format(name, labels, gauge['value']))
+    lines.append('')
+    return '\n'.join(lines)
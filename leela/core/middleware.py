@@ -1,4 +1,3 @@
-
 import asyncio
 
 class LeelaMiddleware(object):
@@ -12,6 +11,33 @@ class LeelaMiddleware(object):
         """you should implement your 'destructor' in this method"""
         pass
 
+    def need_on_request(self, params):
+        """should on_request() be called for API method with such params?
+        Called once per route while routes are compiled.
+        By default - True if on_request() is overridden
+        """
+        return type(self).on_request is not LeelaMiddleware.on_request
+
+    def need_on_response(self, params):
+        """should on_response() be called for API method with such params?
+        Called once per route while routes are compiled.
+        By default - True if on_response() is overridden
+        """
+        return type(self).on_response is not LeelaMiddleware.on_response
+
+    def need_on_preflight(self, params):
+        """should on_response() be called for OPTIONS (CORS preflight)
+        requests of API method with such params?
+        By default - the same as need_on_response()
+        """
+        return self.need_on_response(params)
+
+    def need_on_failure(self, params):
+        """should on_failure() be called for API method with such params?
+        By default - True if on_failure() is overridden
+        """
+        return type(self).on_failure is not LeelaMiddleware.on_failure
+
     @asyncio.coroutine
     def on_request(self, request, data, params, cache):
         return None
@@ -19,3 +45,12 @@ class LeelaMiddleware(object):
     @asyncio.coroutine
     def on_response(self, request, data, response, params, cache):
         return response
+
+    @asyncio.coroutine
+    def on_failure(self, request, data, error, params, cache):
+        """called if request processing is failed (exception is raised
+        by API method or middleware), on_response() is not called then.
+        data is None if request is not parsed.
+        error - exception (aiohttp.web.HTTPException is response)
+        """
+        pass
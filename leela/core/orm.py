@@ -1,14 +1,173 @@
 
+import time
+import weakref
 import inspect
+import operator
 import asyncio
-from copy import copy
+import functools
+from copy import copy, deepcopy
+from collections import deque
+
+from leela.utils.lru_cache import LRUCache
+
+
+# sort orders for QueryResult.sort()
+ASC = 1
+DESC = -1
+
+# default count of objects fetched from database by cursor at once
+CURSOR_BATCH_SIZE = 1000
+
+_MISSING = object()
+
+_PLAIN_TYPES = frozenset((dict, list, tuple, str, int, float, bool))
+
+
+def to_json_dict(fields):
+    """returns copy of fields dict with values of not JSON types
+    converted to strings (like Model.to_dict())
+    """
+    return {key: value if type(value) in _PLAIN_TYPES else str(value)
+            for key, value in fields.items()}
+
+try:
+    _current_task = asyncio.current_task
+except AttributeError:
+    _current_task = asyncio.Task.current_task
+
+
+class IdentityMap(object):
+    """Objects loaded during request processing
+
+    While identity map is active in current task, Model.get() returns
+    the same object for the same id without database requests
+    and results of Model.find_one() are cached for the same query.
+    Saved and removed objects are updated in identity map.
+    """
+    __active_maps = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.__objects = {}
+        self.__queries = {}
+
+    @classmethod
+    def current(cls):
+        """returns identity map that is active in current task or None"""
+        try:
+            task = _current_task()
+        except RuntimeError:
+            return None
+        if task is None:
+            return None
+        return cls.__active_maps.get(task, None)
+
+    def activate(self):
+        task = _current_task()
+        if task is None:
+            raise RuntimeError('Identity map can be activated in task only')
+        self.__active_maps[task] = self
+
+    def deactivate(self):
+        task = _current_task()
+        if task is not None and self.__active_maps.get(task) is self:
+            del self.__active_maps[task]
+
+    def get(self, model_class, obj_id, default=None):
+        """returns loaded object (or None if it does not exist)"""
+        return self.__objects.get((model_class, obj_id), default)
+
+    def add(self, model_class, obj_id, obj):
+        """add loaded object (None if object does not exist)
+        and returns object that is already loaded with the same id
+        """
+        key = (model_class, obj_id)
+        loaded = self.__objects.get(key, None)
+        if loaded is not None and obj is not None:
+            return loaded
+        self.__objects[key] = obj
+        return obj
+
+    def find(self, model_class, query, default=None):
+        try:
+            key = (model_class, frozenset(query.items()))
+            return self.__queries.get(key, default)
+        except TypeError:
+            return default  # unhashable query value
+
+    def add_query(self, model_class, query, obj):
+        try:
+            self.__queries[(model_class, frozenset(query.items()))] = obj
+        except TypeError:
+            pass
+
+    def saved(self, model_class, obj):
+        self.__objects[(model_class, obj.get_id())] = obj
+        self.__clear_queries(model_class)
+
+    def removed(self, model_class, obj_id):
+        self.__objects[(model_class, obj_id)] = None
+        self.__clear_queries(model_class)
+
+    def __clear_queries(self, model_class):
+        for key in [key for key in self.__queries if key[0] is model_class]:
+            del self.__queries[key]
 
 
 class ModelMeta(type):
+    def __new__(mcs, name, bases, dct):
+        is_compact = dct.get('_compact', any(getattr(base, '_compact', False)
+                                             for base in bases))
+        if is_compact and '__slots__' not in dct:
+            dct = mcs.__make_compact(bases, dct)
+        return super(ModelMeta, mcs).__new__(mcs, name, bases, dct)
+
+    @staticmethod
+    def __make_compact(bases, dct):
+        """move fields of compact model class to __slots__"""
+        dct = dict(dct)
+        fields = {}
+        slots = set()
+        id_name = dct.get('_id', None)
+        for base in reversed(bases):
+            if isinstance(base, ModelMeta) and base.get_fields():
+                fields.update(base.get_fields())
+            for klass in base.__mro__:
+                slots.update(klass.__dict__.get('__slots__', ()))
+            if id_name is None:
+                id_name = getattr(base, '_id', None)
+        id_name = id_name or '_id'
+
+        for key, value in list(dct.items()):
+            if key[0] == '_' or inspect.isroutine(value) or \
+                    hasattr(value, '__get__'):
+                continue
+            fields[key] = dct.pop(key)
+
+        id_slot = id_name if id_name in fields else '_l_id'
+        new_slots = [key for key in fields if key not in slots]
+        for slot in (id_slot, '_l_extra'):
+            if slot not in slots and slot not in new_slots:
+                new_slots.append(slot)
+
+        arg_slots = {key: key for key in fields}
+        arg_slots['_id'] = arg_slots[id_name] = id_slot
+
+        dct['__slots__'] = tuple(new_slots)
+        dct['_l_fields'] = fields
+        dct['_l_id_slot'] = id_slot
+        dct['_l_arg_slots'] = arg_slots
+        # values of fields, id and extra arguments by one call
+        dct['_l_fields_getter'] = operator.attrgetter(*fields, id_slot,
+                                                      '_l_extra')
+        return dct
+
     def __init__(cls, name, bases, dct):
         super(ModelMeta, cls).__init__(name, bases, dct)
-        cls.__detect_f_keys()
-        cls.set_f_keys(cls.__detect_f_keys())
+        if '_l_fields' in cls.__dict__:
+            # compact model fields (see __make_compact)
+            cls.set_f_keys(dict(cls._l_fields))
+        else:
+            cls.set_f_keys(cls.__detect_f_keys())
 
         if cls._meta_name == 'model':
             cls._meta_name = cls.__name__.lower()
@@ -32,6 +191,7 @@ class Model(object, metaclass=ModelMeta):
     __db = None
     __query_result_class = None
     __f_keys = None
+    __read_cache = None
 
     _meta_name = 'model'
     _id = None
@@ -45,6 +205,44 @@ class Model(object, metaclass=ModelMeta):
     def set_f_keys(cls, f_keys):
         cls.__f_keys = f_keys
 
+    @classmethod
+    def get_fields(cls):
+        """returns dict of model fields names and default values"""
+        return cls.__f_keys
+
+    @classmethod
+    def enable_read_cache(cls, max_size=1024, ttl=5):
+        """cache objects loaded by get() in process memory
+
+        Cached objects are invalidated by save() and remove() of this
+        process only, so changes made by other processes are visible
+        with delay up to ttl seconds.
+        """
+        cls.__read_cache = LRUCache(max_size, ttl)
+
+    @classmethod
+    def disable_read_cache(cls):
+        cls.__read_cache = None
+
+    @classmethod
+    def __saved(cls, obj):
+        if cls.__read_cache is not None:
+            cls.__read_cache.pop((cls, obj.get_id()))
+        identity_map = IdentityMap.current()
+        if identity_map is not None:
+            identity_map.saved(cls, obj)
+
+    @classmethod
+    def __removed(cls, obj):
+        obj_id = obj._fields_dict().get(cls._id, None)
+        if obj_id is None:
+            return
+        if cls.__read_cache is not None:
+            cls.__read_cache.pop((cls, obj_id))
+        identity_map = IdentityMap.current()
+        if identity_map is not None:
+            identity_map.removed(cls, obj_id)
+
     def __init__(self, **args):
         self.__args = copy(self.__f_keys)
         for arg, val in args.items():
@@ -58,6 +256,16 @@ class Model(object, metaclass=ModelMeta):
     def get_id(self):
         return self.__args[self._id]
 
+    def _fields_dict(self):
+        """fields values passed to database connector"""
+        return self.__args
+
+    def _sync_fields(self, args):
+        """apply changes of fields values made by database connector
+        (e.g. generated id) to object
+        """
+        pass
+
     @classmethod
     def find(cls, **query):
         for key in query:
@@ -69,37 +277,107 @@ class Model(object, metaclass=ModelMeta):
 
     @classmethod
     def find_one(cls, **query):
-        return cls.find(**query).first()
+        identity_map = IdentityMap.current()
+        if identity_map is not None:
+            obj = identity_map.find(cls, query, _MISSING)
+            if obj is not _MISSING:
+                return obj
+
+        obj = cls.find(**query).first()
+        if asyncio.iscoroutine(obj):
+            obj = yield from obj
+
+        if identity_map is not None:
+            if obj is not None:
+                obj = identity_map.add(cls, obj.get_id(), obj)
+            identity_map.add_query(cls, query, obj)
+        return obj
 
     @classmethod
     def get(cls, obj_id):
-        key_class = cls.__query_result_class._key_class 
-        res = cls.__query_result_class(cls.__db, cls,
-                                       {cls._id: key_class(cls._id, obj_id)})
-
-        res = yield from res
-        res = list(res)
-        if not res:
-            return None
-        return res[0]
+        identity_map = IdentityMap.current()
+        if identity_map is not None:
+            obj = identity_map.get(cls, obj_id, _MISSING)
+            if obj is not _MISSING:
+                return obj
+
+        obj = None
+        read_cache = cls.__read_cache
+        if read_cache is not None:
+            args = read_cache.get((cls, obj_id), None)
+            if args is not None:
+                obj = cls(**deepcopy(args))
+
+        if obj is None:
+            key_class = cls.__query_result_class._key_class
+            res = cls.__query_result_class(
+                cls.__db, cls, {cls._id: key_class(cls._id, obj_id)})
+
+            res = yield from res
+            res = list(res)
+            if res:
+                obj = res[0]
+                if read_cache is not None:
+                    read_cache.set((cls, obj_id),
+                                   deepcopy(obj._fields_dict()))
+
+        if identity_map is not None:
+            obj = identity_map.add(cls, obj_id, obj)
+        return obj
 
     def save(self):
-        ret = self.__query_result_class(self.__db, self.__class__, self.__args)
+        args = self._fields_dict()
+        ret = self.__query_result_class(self.__db, self.__class__, args)
         res = yield from ret.upsert()
+        self._sync_fields(args)
+        self.__saved(self)
         return res
 
     def remove(self):
-        ret = self.__query_result_class(self.__db, self.__class__, self.__args)
+        ret = self.__query_result_class(self.__db, self.__class__,
+                                        self._fields_dict())
         res = yield from ret.remove()
+        self.__removed(self)
         return res
 
-    def to_dict(self):
-        ret = copy(self.__args)
-        for key, value in ret.items():
-            if type(value) not in (dict, list, tuple, str, int, float, bool):
-                ret[key] = str(value)
+    @classmethod
+    def __objects_args(cls, objects):
+        ret = []
+        for obj in objects:
+            if not isinstance(obj, cls):
+                raise RuntimeError('{} is not instance of "{}"'
+                                   .format(obj, cls.__name__))
+            ret.append(obj._fields_dict())
         return ret
 
+    @classmethod
+    def save_many(cls, objects):
+        """save (insert or update) many objects by single database request"""
+        items = cls.__objects_args(objects)
+        if not items:
+            return 0
+        res = yield from cls.__query_result_class.bulk_upsert(cls.__db, cls,
+                                                              items)
+        for obj, args in zip(objects, items):
+            obj._sync_fields(args)
+            cls.__saved(obj)
+        return res
+
+    @classmethod
+    def remove_many(cls, objects):
+        """remove many objects by single database request"""
+        items = cls.__objects_args(objects)
+        if not items:
+            return 0
+        res = yield from cls.__query_result_class.bulk_remove(cls.__db, cls,
+                                                              items)
+        for obj in objects:
+            cls.__removed(obj)
+        return res
+
+    def to_dict(self):
+        return to_json_dict(self.__args)
+
     def __getattribute__(self, attr):
         if attr[0] == '_':
             return super(Model, self).__getattribute__(attr)
@@ -123,6 +401,86 @@ class Model(object, metaclass=ModelMeta):
         return '<{}> {}'.format(self.__class__.__name__, self.__args)
 
 
+_MUTABLE_TYPES = (dict, list, set)
+
+
+class CompactModel(Model):
+    """Model with fields stored in __slots__ generated by ModelMeta
+
+    Objects take less memory and fields are accessed without
+    Python level hooks. Default values of fields are not assigned
+    in constructor: they are stored on first access (mutable
+    defaults - dict, list, set - are copied).
+    """
+    __slots__ = ()
+    _compact = True
+    _l_fields = {}
+    _l_id_slot = '_l_id'
+    _l_arg_slots = {}
+    _l_fields_getter = None
+
+    __getattribute__ = object.__getattribute__
+    __setattr__ = object.__setattr__
+
+    def __init__(self, **args):
+        self._l_extra = None
+        if self._l_id_slot == '_l_id':
+            self._l_id = None
+        arg_slots = self._l_arg_slots
+        for arg, val in args.items():
+            slot = arg_slots.get(arg, None)
+            if slot is not None:
+                setattr(self, slot, val)
+            elif arg[0] == '_':
+                if self._l_extra is None:
+                    self._l_extra = {}
+                self._l_extra[arg] = val
+            else:
+                raise RuntimeError('"{}" attribute does not found for "{}"'.
+                                   format(arg, self.__class__.__name__))
+
+    def __getattr__(self, attr):
+        # called for fields that are not set yet only
+        fields = type(self)._l_fields
+        if attr not in fields:
+            raise AttributeError('"{}" object has no attribute "{}"'
+                                 .format(self.__class__.__name__, attr))
+        value = fields[attr]
+        if isinstance(value, _MUTABLE_TYPES):
+            value = copy(value)
+        setattr(self, attr, value)
+        return value
+
+    def get_id(self):
+        return getattr(self, self._l_id_slot)
+
+    def _fields_dict(self):
+        # id and extra arguments follow fields values (zip() skips them)
+        values = self._l_fields_getter(self)
+        ret = dict(zip(self._l_fields, values))
+        obj_id = values[-2]
+        if obj_id is not None:
+            ret[self._id] = obj_id
+        if values[-1] is not None:
+            ret.update(values[-1])
+        return ret
+
+    def _sync_fields(self, args):
+        obj_id = args.get(self._id, None)
+        if obj_id is not None:
+            setattr(self, self._l_id_slot, obj_id)
+
+    def to_dict(self):
+        return to_json_dict(self._fields_dict())
+
+    def __repr__(self):
+        return '<{}> {}'.format(self.__class__.__name__, self._fields_dict())
+
+
+# subclasses of compact model are named by class name like Model subclasses
+CompactModel._meta_name = Model._meta_name
+
+
 def model_iterator(model_class, data):
     for item in data:
         yield model_class(**item)
@@ -131,8 +489,168 @@ def default_key_class(key, val):
     return val
 
 
+class CursorBatches(object):
+    """Source of query results batches for Cursor
+
+    Database connectors implement it for fetching results
+    by batches on database side (e.g. server side cursors)
+    """
+    @asyncio.coroutine
+    def fetch(self):
+        """returns list of next results (fields dicts),
+        empty list if results are exhausted
+        """
+        return []
+
+    @asyncio.coroutine
+    def close(self):
+        """release database resources (called once)"""
+        pass
+
+
+class _ResultBatches(CursorBatches):
+    """batches of completely fetched query result
+    (for database connectors without cursors support)
+    """
+    def __init__(self, query_result, batch_size):
+        self.__query_result = query_result
+        self.__batch_size = batch_size
+        self.__objects = None
+
+    @asyncio.coroutine
+    def fetch(self):
+        if self.__objects is None:
+            self.__objects = list((yield from self.__query_result))
+        batch = self.__objects[:self.__batch_size]
+        del self.__objects[:self.__batch_size]
+        return batch
+
+
+class Cursor(object):
+    """Async iterator over query results
+
+        async for obj in Model.find(...).cursor(batch_size=100):
+            ...
+
+    Results are fetched by batches, next batch is fetched while
+    current one is processed if prefetch is True. Model objects
+    are created lazily while batch is iterated.
+    Cursor is closed when results are exhausted, close() MUST be
+    called if iteration is stopped before.
+    """
+    def __init__(self, batches, model_class=None, *, prefetch=True):
+        self.__batches = batches
+        self.__model_class = model_class
+        self.__prefetch = prefetch
+        self.__objects = iter(())
+        self.__next_batch = None
+        self.__closed = False
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        while True:
+            obj = next(self.__objects, _MISSING)
+            if obj is not _MISSING:
+                return obj
+            if self.__closed:
+                raise StopAsyncIteration
+
+            batch = yield from self.__fetch()
+            if not batch:
+                yield from self.close()
+                raise StopAsyncIteration
+            if self.__prefetch:
+                self.__next_batch = asyncio.ensure_future(
+                    self.__batches.fetch())
+            if self.__model_class is None:
+                self.__objects = iter(batch)
+            else:
+                self.__objects = model_iterator(self.__model_class, batch)
+
+    @asyncio.coroutine
+    def __fetch(self):
+        if self.__next_batch is None:
+            return (yield from self.__batches.fetch())
+        future, self.__next_batch = self.__next_batch, None
+        return (yield from future)
+
+    @asyncio.coroutine
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__objects = iter(())
+        if self.__next_batch is not None:
+            # fetching can not be interrupted in database driver,
+            # so batch is awaited before resources are released
+            yield from asyncio.wait([self.__next_batch])
+            if not self.__next_batch.cancelled():
+                self.__next_batch.exception()
+            self.__next_batch = None
+        yield from self.__batches.close()
+
+    # async generators protocol
+    aclose = close
+
+
+def _object_fields(obj, fields=None):
+    ret = obj._fields_dict()
+    if fields is None:
+        return dict(ret)
+    return {key: value for key, value in ret.items()
+            if key in fields or key == obj._id}
+
+
+def _object_json_dict(obj, fields=None):
+    return to_json_dict(_object_fields(obj, fields))
+
+
+class _ConvertedResult(object):
+    """query result of database connector without raw() or as_dicts()
+    support: loaded model objects are converted by convert(obj, fields)
+    """
+    def __init__(self, query_result, convert):
+        self.__query_result = query_result
+        self.__convert = convert
+
+    def __getattr__(self, name):
+        attr = getattr(self.__query_result, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def method(*args, **kwargs):
+            ret = attr(*args, **kwargs)
+            # chained query methods (sort(), only(), ...)
+            return self if ret is self.__query_result else ret
+        return method
+
+    def __convert_obj(self, obj):
+        return self.__convert(obj, self.__query_result._l_only)
+
+    @asyncio.coroutine
+    def first(self):
+        obj = self.__query_result.first()
+        if asyncio.iscoroutine(obj):
+            obj = yield from obj
+        return None if obj is None else self.__convert_obj(obj)
+
+    def cursor(self, batch_size=CURSOR_BATCH_SIZE, *, prefetch=True):
+        return Cursor(_ResultBatches(self, batch_size), prefetch=prefetch)
+
+    @asyncio.coroutine
+    def __iter__(self):
+        objects = yield from self.__query_result
+        return [self.__convert_obj(obj) for obj in objects or ()]
+
+
 class QueryResult(object):
     _key_class = default_key_class
+    # fields passed to only()
+    _l_only = None
 
     def __init__(self, db, model_class, query):
         pass
@@ -145,11 +663,60 @@ class QueryResult(object):
     def remove(self):
         pass
 
+    @classmethod
+    @asyncio.coroutine
+    def bulk_upsert(cls, db, model_class, items):
+        """insert or update many objects (list of fields dicts)
+
+        Database implementations should do it by single round trip,
+        this implementation upserts objects one by one.
+        Returns count of upserted objects
+        """
+        for item in items:
+            yield from cls(db, model_class, item).upsert()
+        return len(items)
+
+    @classmethod
+    @asyncio.coroutine
+    def bulk_remove(cls, db, model_class, items):
+        """remove many objects (list of fields dicts)
+
+        Database implementations should do it by single round trip,
+        this implementation removes objects one by one.
+        Returns count of processed objects
+        """
+        for item in items:
+            yield from cls(db, model_class, item).remove()
+        return len(items)
+
     def sort(self, **order):
         '''order = {field: ASC | DESC , ...}
         '''
         return self
 
+    def only(self, *fields):
+        """fetch only listed fields (and id) of objects.
+        Not fetched fields of model objects have default values,
+        so such objects should not be saved.
+        """
+        self._l_only = fields
+        return self
+
+    def raw(self):
+        """return fields dicts as they are loaded from database
+        instead of model objects
+
+        Database implementations should not create model objects,
+        this implementation converts loaded objects.
+        """
+        return _ConvertedResult(self, _object_fields)
+
+    def as_dicts(self):
+        """return JSON ready dicts (like Model.to_dict() results)
+        instead of model objects
+        """
+        return _ConvertedResult(self, _object_json_dict)
+
     def hint(self, index):
         return self
 
@@ -162,33 +729,270 @@ class QueryResult(object):
     def first(self):
         return None
 
+    def cursor(self, batch_size=CURSOR_BATCH_SIZE, *, prefetch=True):
+        """returns Cursor for iteration over results by batches
+
+        Database implementations should fetch results by batches
+        (see CursorBatches), this implementation fetches all results
+        at once.
+        """
+        return Cursor(_ResultBatches(self, batch_size), prefetch=prefetch)
+
     @asyncio.coroutine
     def __iter__(self):
         for i in range(0):
             yield i
 
 
+class ConnectionPool(object):
+    """pool of database connections
+
+    open_connection() - coroutine, returns new connection
+    close_connection(conn) - coroutine, closes connection
+    check_connection(conn) - coroutine, returns False if connection
+                             is broken
+    min_size - count of connections opened by fill()
+    max_size - max count of opened connections
+    acquire_timeout - max time (in seconds) of waiting for free connection
+    health_check_interval - connection idle for longer time (in seconds)
+                            is checked before it is returned by acquire()
+    """
+    def __init__(self, open_connection, close_connection, check_connection,
+                 *, min_size=1, max_size=10, acquire_timeout=10,
+                 health_check_interval=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid connection pool size: {}..{}'
+                             .format(min_size, max_size))
+        self.__open = open_connection
+        self.__close = close_connection
+        self.__check = check_connection
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__acquire_timeout = acquire_timeout
+        self.__health_check_interval = health_check_interval
+
+        self.__free = deque()
+        self.__waiters = deque()
+        self.__size = 0
+        self.__closed = False
+
+    def size(self):
+        """count of opened connections"""
+        return self.__size
+
+    def free_size(self):
+        return len(self.__free)
+
+    @asyncio.coroutine
+    def fill(self):
+        while self.__size < self.__min_size:
+            self.__size += 1
+            try:
+                conn = yield from self.__open()
+            except BaseException:
+                self.__size -= 1
+                raise
+            self.__free.append((conn, time.monotonic()))
+
+    @asyncio.coroutine
+    def acquire(self):
+        if self.__closed:
+            raise RuntimeError('Connection pool is closed')
+        try:
+            return (yield from asyncio.wait_for(self.__acquire(),
+                                                self.__acquire_timeout))
+        except asyncio.TimeoutError:
+            raise RuntimeError('Database connection is not acquired '
+                               'in {} seconds'.format(self.__acquire_timeout))
+
+    @asyncio.coroutine
+    def __acquire(self):
+        while True:
+            while self.__free:
+                # most recently used connection is taken
+                conn, released_at = self.__free.pop()
+                idle_time = time.monotonic() - released_at
+                if idle_time > self.__health_check_interval:
+                    try:
+                        is_alive = yield from self.__check_connection(conn)
+                    except BaseException:
+                        # acquire() is timed out or cancelled while
+                        # connection is checked (its state is unknown)
+                        asyncio.ensure_future(self.__discard(conn))
+                        raise
+                    if not is_alive:
+                        yield from self.__discard(conn)
+                        continue
+                return conn
+
+            if self.__size < self.__max_size:
+                self.__size += 1
+                try:
+                    return (yield from self.__open())
+                except BaseException:
+                    self.__size -= 1
+                    self.__wakeup()
+                    raise
+
+            waiter = asyncio.Future()
+            self.__waiters.append(waiter)
+            try:
+                yield from waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    self.__wakeup()  # released connection is not taken
+                raise
+            finally:
+                if waiter in self.__waiters:
+                    self.__waiters.remove(waiter)
+
+    @asyncio.coroutine
+    def __check_connection(self, conn):
+        try:
+            return (yield from self.__check(conn))
+        except asyncio.CancelledError:
+            raise  # it is Exception in old Python versions
+        except Exception:
+            return False
+
+    @asyncio.coroutine
+    def __discard(self, conn):
+        self.__size -= 1
+        self.__wakeup()
+        try:
+            yield from self.__close(conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+    def __wakeup(self):
+        while self.__waiters:
+            waiter = self.__waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def release(self, conn, discard=False):
+        """return connection to pool
+
+        discard - close connection (e.g. if it is broken)
+        """
+        if self.__closed or discard:
+            asyncio.ensure_future(self.__discard(conn))
+            return
+        self.__free.append((conn, time.monotonic()))
+        self.__wakeup()
+
+    @asyncio.coroutine
+    def close(self):
+        """close free connections, acquired ones are closed on release"""
+        self.__closed = True
+        for waiter in self.__waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError('Connection pool is closed'))
+        self.__waiters.clear()
+        while self.__free:
+            conn, _ = self.__free.pop()
+            yield from self.__discard(conn)
+
+
+class PooledConnection(object):
+    """context manager that returns connection to pool on exit"""
+    def __init__(self, pool, conn):
+        self.__pool = pool
+        self.__conn = conn
+
+    def __enter__(self):
+        return self.__conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__pool.release(self.__conn)
+
+
 class AbstractDatabase(object):
+    """Database connector
+
+    Implementations should override _open_connection(),
+    _close_connection() and _check_connection() for using
+    connections pool or connect() and disconnect() methods
+    """
     _query_result_class = QueryResult
 
     @classmethod
     def get_query_result_class(cls):
         return cls._query_result_class
 
-    def __init__(self, db_name):
+    def __init__(self, db_name, *, pool_min_size=1, pool_max_size=10,
+                 acquire_timeout=10, health_check_interval=30):
         self.__db_name = db_name
+        self.__pool_params = {'min_size': pool_min_size,
+                              'max_size': pool_max_size,
+                              'acquire_timeout': acquire_timeout,
+                              'health_check_interval': health_check_interval}
+        self.__pool = None
 
     def db_name(self):
         return self.__db_name
 
     @asyncio.coroutine
     def connect(self, **conn_params):
-        pass
+        """open connections pool (connectors that do not override
+        _open_connection() do not use pool)
+        """
+        if type(self)._open_connection is AbstractDatabase._open_connection:
+            return
+        pool = ConnectionPool(
+            functools.partial(self._open_connection, **conn_params),
+            self._close_connection, self._check_connection,
+            **self.__pool_params)
+        yield from pool.fill()
+        self.__pool = pool
 
     @asyncio.coroutine
     def disconnect(self):
-        pass
+        if self.__pool is not None:
+            yield from self.__pool.close()
+        self.__pool = None
 
     @asyncio.coroutine
     def drop_database(self):
         pass
+
+    def pool(self):
+        return self.__pool
+
+    @asyncio.coroutine
+    def acquire(self):
+        """get connection from pool.
+        It MUST be returned by release() after usage
+        """
+        if self.__pool is None:
+            raise RuntimeError('Database is not connected')
+        return (yield from self.__pool.acquire())
+
+    def release(self, conn, discard=False):
+        self.__pool.release(conn, discard)
+
+    @asyncio.coroutine
+    def connection(self):
+        """get connection from pool as context manager:
+
+            with (yield from db.connection()) as conn:
+                ...
+        """
+        conn = yield from self.acquire()
+        return PooledConnection(self.__pool, conn)
+
+    @asyncio.coroutine
+    def _open_connection(self, **conn_params):
+        raise NotImplementedError('{} does not support connections pool'
+                                  .format(self.__class__.__name__))
+
+    @asyncio.coroutine
+    def _close_connection(self, conn):
+        pass
+
+    @asyncio.coroutine
+    def _check_connection(self, conn):
+        return True
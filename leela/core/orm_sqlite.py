@@ -0,0 +1,397 @@
+"""
+Reference ORM database implementation based on sqlite3 module.
+
+Every model is stored in table named by model's _meta_name with column
+per model field. Dicts and lists are stored as JSON and restored
+for fields with dict/list default value.
+Queries are executed in shared thread pool of worker
+with pooled connections.
+"""
+
+import json
+import uuid
+import sqlite3
+import asyncio
+import functools
+
+from leela.core import executors
+from leela.core.orm import (AbstractDatabase, QueryResult, Cursor,
+                            CursorBatches, CURSOR_BATCH_SIZE, ASC, DESC,
+                            to_json_dict)
+
+
+# max count of SQL variables in one statement
+MAX_VARIABLES = 900
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _encode(value):
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, sort_keys=True)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _decode(default, value):
+    if value is None:
+        return None
+    if isinstance(default, (dict, list, tuple)) and isinstance(value, str):
+        return json.loads(value)
+    if isinstance(default, bool):
+        return bool(value)
+    return value
+
+
+class _Table(object):
+    """SQL statements for model class"""
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.fields = model_class.get_fields()
+        self.id_column = model_class._id
+        self.columns = [self.id_column] + \
+            sorted(f for f in self.fields if f != self.id_column)
+        self.name = _quote(model_class._meta_name)
+
+        columns_sql = ', '.join(_quote(col) for col in self.columns)
+        columns_defs = [_quote(self.id_column) + ' PRIMARY KEY'] + \
+            [_quote(col) for col in self.columns[1:]]
+        self.create_sql = 'CREATE TABLE IF NOT EXISTS {} ({})' \
+            .format(self.name, ', '.join(columns_defs))
+        self.upsert_sql = 'INSERT OR REPLACE INTO {} ({}) VALUES ({})' \
+            .format(self.name, columns_sql, ', '.join('?' * len(self.columns)))
+
+    def column(self, field):
+        return self.id_column if field == '_id' else field
+
+    def projection(self, fields):
+        """returns columns list for fields (id column is first always)"""
+        columns = set()
+        for field in fields:
+            column = self.column(field)
+            if column != self.id_column and column not in self.fields:
+                raise RuntimeError('"{}" attribute does not found for "{}"'.
+                                   format(field, self.model_class.__name__))
+            columns.add(column)
+        columns.discard(self.id_column)
+        return [self.id_column] + sorted(columns)
+
+    def select_sql(self, columns):
+        return 'SELECT {} FROM {}'.format(
+            ', '.join(_quote(col) for col in columns), self.name)
+
+    def row(self, item):
+        """returns upsert statement values for model fields dict"""
+        obj_id = item.get(self.id_column, None)
+        if obj_id is None:
+            # like auto generated ids of document databases
+            obj_id = item[self.id_column] = uuid.uuid4().hex
+        return [obj_id] + [_encode(item.get(col, None))
+                           for col in self.columns[1:]]
+
+    def args(self, row, columns):
+        args = {}
+        for column, value in zip(columns, row):
+            args[column] = _decode(self.fields.get(column, None), value)
+        return args
+
+    def model(self, row, columns):
+        return self.model_class(**self.args(row, columns))
+
+    def json_dict(self, row, columns):
+        return to_json_dict(self.args(row, columns))
+
+    def where(self, query):
+        if not query:
+            return '', []
+        conditions = []
+        values = []
+        for field, value in query.items():
+            column = _quote(self.column(field))
+            if value is None:
+                conditions.append('{} IS NULL'.format(column))
+            else:
+                conditions.append('{} = ?'.format(column))
+                values.append(_encode(value))
+        return ' WHERE ' + ' AND '.join(conditions), values
+
+
+class _SQLiteBatches(CursorBatches):
+    """rows fetched by sqlite3 cursor of connection held by batches"""
+    def __init__(self, db, table, sql, values, convert, batch_size):
+        self.__db = db
+        self.__table = table
+        self.__sql = sql
+        self.__values = values
+        self.__convert = convert
+        self.__batch_size = batch_size
+        self.__conn = None
+        self.__cursor = None
+        self.__exhausted = False
+
+    @asyncio.coroutine
+    def fetch(self):
+        if self.__exhausted:
+            return []
+        pool = executors.get_executor(executors.THREAD)
+        if self.__conn is None:
+            self.__conn = yield from self.__db.acquire_table(self.__table)
+            self.__cursor = yield from pool.run(
+                self.__conn.execute, self.__sql, self.__values)
+
+        rows = yield from pool.run(self.__cursor.fetchmany,
+                                   self.__batch_size)
+        if len(rows) < self.__batch_size:
+            self.__exhausted = True
+        convert = self.__convert
+        return [convert(row) for row in rows]
+
+    @asyncio.coroutine
+    def close(self):
+        self.__exhausted = True
+        if self.__conn is None:
+            return
+        self.__cursor.close()
+        self.__db.release(self.__conn)
+        self.__conn = self.__cursor = None
+
+
+class SQLiteQueryResult(QueryResult):
+    def __init__(self, db, model_class, query):
+        self.__db = db
+        self.__table = db.table(model_class)
+        self.__query = query
+        self.__order = []
+        self.__columns = self.__table.columns
+        self.__result = self.__table.model
+
+    @asyncio.coroutine
+    def upsert(self):
+        table = self.__table
+        row = table.row(self.__query)
+
+        def upsert(conn):
+            with conn:
+                conn.execute(table.upsert_sql, row)
+
+        yield from self.__db.execute(table, upsert)
+        return row[0]
+
+    @asyncio.coroutine
+    def remove(self):
+        table = self.__table
+        query = self.__query
+        obj_id = query.get(table.id_column, None)
+        if obj_id is not None:
+            query = {table.id_column: obj_id}
+        where, values = table.where(query)
+        sql = 'DELETE FROM {}{}'.format(table.name, where)
+
+        def remove(conn):
+            with conn:
+                return conn.execute(sql, values).rowcount
+
+        return (yield from self.__db.execute(table, remove))
+
+    @classmethod
+    @asyncio.coroutine
+    def bulk_upsert(cls, db, model_class, items):
+        table = db.table(model_class)
+        rows = [table.row(item) for item in items]
+
+        def upsert(conn):
+            with conn:
+                conn.executemany(table.upsert_sql, rows)
+
+        yield from db.execute(table, upsert)
+        return len(rows)
+
+    @classmethod
+    @asyncio.coroutine
+    def bulk_remove(cls, db, model_class, items):
+        table = db.table(model_class)
+        ids = []
+        for item in items:
+            obj_id = item.get(table.id_column, None)
+            if obj_id is None:
+                raise RuntimeError('Object without id can not be removed: {}'
+                                   .format(item))
+            ids.append(obj_id)
+
+        def remove(conn):
+            count = 0
+            with conn:
+                for i in range(0, len(ids), MAX_VARIABLES):
+                    chunk = ids[i:i + MAX_VARIABLES]
+                    sql = 'DELETE FROM {} WHERE {} IN ({})'.format(
+                        table.name, _quote(table.id_column),
+                        ', '.join('?' * len(chunk)))
+                    count += conn.execute(sql, chunk).rowcount
+            return count
+
+        return (yield from db.execute(table, remove))
+
+    def sort(self, **order):
+        '''order = {field: ASC | DESC , ...}
+        '''
+        for field, direction in order.items():
+            if direction not in (ASC, DESC):
+                raise ValueError('Invalid sort order "{}" for "{}"'
+                                 .format(direction, field))
+            self.__order.append('{} {}'.format(
+                _quote(self.__table.column(field)),
+                'ASC' if direction == ASC else 'DESC'))
+        return self
+
+    def only(self, *fields):
+        self.__columns = self.__table.projection(fields)
+        return self
+
+    def raw(self):
+        self.__result = self.__table.args
+        return self
+
+    def as_dicts(self):
+        self.__result = self.__table.json_dict
+        return self
+
+    def __select_sql(self, limit=None):
+        where, values = self.__table.where(self.__query)
+        sql = self.__table.select_sql(self.__columns) + where
+        if self.__order:
+            sql += ' ORDER BY ' + ', '.join(self.__order)
+        if limit is not None:
+            sql += ' LIMIT {}'.format(int(limit))
+        return sql, values
+
+    @asyncio.coroutine
+    def count(self):
+        where, values = self.__table.where(self.__query)
+        sql = 'SELECT COUNT(*) FROM {}{}'.format(self.__table.name, where)
+
+        def count(conn):
+            return conn.execute(sql, values).fetchone()[0]
+
+        return (yield from self.__db.execute(self.__table, count))
+
+    @asyncio.coroutine
+    def __fetch(self, limit=None):
+        sql, values = self.__select_sql(limit)
+
+        def fetch(conn):
+            return conn.execute(sql, values).fetchall()
+
+        rows = yield from self.__db.execute(self.__table, fetch)
+        result, columns = self.__result, self.__columns
+        return [result(row, columns) for row in rows]
+
+    @asyncio.coroutine
+    def first(self):
+        res = yield from self.__fetch(1)
+        return res[0] if res else None
+
+    def cursor(self, batch_size=CURSOR_BATCH_SIZE, *, prefetch=True):
+        sql, values = self.__select_sql()
+        table, columns = self.__table, self.__columns
+        if self.__result == table.model:
+            # models are created lazily by cursor
+            convert, model_class = table.args, table.model_class
+        else:
+            convert, model_class = self.__result, None
+        batches = _SQLiteBatches(self.__db, table, sql, values,
+                                 functools.partial(convert, columns=columns),
+                                 batch_size)
+        return Cursor(batches, model_class, prefetch=prefetch)
+
+    @asyncio.coroutine
+    def __iter__(self):
+        return (yield from self.__fetch())
+
+
+class SQLiteDatabase(AbstractDatabase):
+    """db_name - path to database file
+
+    Connection parameters (connect() arguments) are passed
+    to sqlite3.connect(), e.g. timeout
+    """
+    _query_result_class = SQLiteQueryResult
+
+    def __init__(self, db_name, **pool_params):
+        super().__init__(db_name, **pool_params)
+        self.__tables = {}
+        self.__created_tables = set()
+
+    def table(self, model_class):
+        table = self.__tables.get(model_class, None)
+        if table is None:
+            table = self.__tables[model_class] = _Table(model_class)
+        return table
+
+    @asyncio.coroutine
+    def execute(self, table, func):
+        """call func(connection) in executor thread with pooled connection
+        (table of model is created if it does not exist)
+        """
+        pool = executors.get_executor(executors.THREAD)
+        conn = yield from self.acquire_table(table)
+        try:
+            return (yield from pool.run(func, conn))
+        finally:
+            self.release(conn)
+
+    @asyncio.coroutine
+    def acquire_table(self, table):
+        """get connection from pool (like acquire()) and create table
+        of model if it does not exist
+        """
+        pool = executors.get_executor(executors.THREAD)
+        conn = yield from self.acquire()
+        try:
+            if table.name not in self.__created_tables:
+                yield from pool.run(conn.execute, table.create_sql)
+                self.__created_tables.add(table.name)
+        except BaseException:
+            self.release(conn)
+            raise
+        return conn
+
+    @asyncio.coroutine
+    def _open_connection(self, **conn_params):
+        def connect():
+            conn = sqlite3.connect(self.db_name(), check_same_thread=False,
+                                   **conn_params)
+            conn.execute('PRAGMA journal_mode=WAL')
+            return conn
+
+        pool = executors.get_executor(executors.THREAD)
+        return (yield from pool.run(connect))
+
+    @asyncio.coroutine
+    def _close_connection(self, conn):
+        conn.close()
+
+    @asyncio.coroutine
+    def _check_connection(self, conn):
+        pool = executors.get_executor(executors.THREAD)
+        yield from pool.run(conn.execute, 'SELECT 1')
+        return True
+
+    @asyncio.coroutine
+    def drop_database(self):
+        tables = list(self.__tables.values())
+
+        def drop(conn):
+            with conn:
+                for table in tables:
+                    conn.execute('DROP TABLE IF EXISTS {}'.format(table.name))
+
+        pool = executors.get_executor(executors.THREAD)
+        conn = yield from self.acquire()
+        try:
+            yield from pool.run(drop, conn)
+        finally:
+            self.release(conn)
+        self.__created_tables.clear()
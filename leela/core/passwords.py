@@ -0,0 +1,219 @@
+"""
+Password hashers with versioned digests.
+
+Digests are prefixed by hasher name: 'sha1$<hex>',
+'pbkdf2$<iterations>$<salt>$<hash>', 'scrypt$<n>$<r>$<p>$<salt>$<hash>'.
+Plain sha1 hex digests (made by old leela versions) are recognized
+as sha1 digests. Slow hashers (PBKDF2, scrypt) are computed in worker
+thread pool with bounded concurrency, so logins do not block event loop
+and do not occupy all threads of pool.
+"""
+
+import os
+import hmac
+import base64
+import binascii
+import asyncio
+import hashlib
+
+from leela.core import executors
+
+
+SALT_SIZE = 16
+PBKDF2_ITERATIONS = 260000
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+# max count of digests computed in thread pool at the same time
+MAX_CONCURRENCY = 4
+
+# errors of malformed digests parsing
+_DIGEST_ERRORS = (ValueError, binascii.Error, OverflowError)
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(data):
+    return base64.b64decode(data + '=' * (-len(data) % 4), validate=True)
+
+
+class SHA1Hasher(object):
+    """unsalted sha1 digests (for compatibility only)"""
+    name = 'sha1'
+    is_slow = False
+
+    def encode(self, password):
+        digest = hashlib.sha1(password.encode()).hexdigest()
+        return '{}${}'.format(self.name, digest)
+
+    def verify(self, password, digest):
+        return hmac.compare_digest(self.encode(password), digest)
+
+    def must_update(self, digest):
+        return False
+
+
+class PBKDF2Hasher(object):
+    """PBKDF2-HMAC-SHA256 digests"""
+    name = 'pbkdf2'
+    is_slow = True
+
+    def __init__(self, iterations=PBKDF2_ITERATIONS):
+        self.__iterations = iterations
+
+    def __hash(self, password, salt, iterations):
+        return _b64encode(hashlib.pbkdf2_hmac('sha256', password.encode(),
+                                              salt, iterations))
+
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(SALT_SIZE)
+        return '{}${}${}${}'.format(
+            self.name, self.__iterations, _b64encode(salt),
+            self.__hash(password, salt, self.__iterations))
+
+    def verify(self, password, digest):
+        try:
+            _, iterations, salt, hashed = digest.split('$')
+            return hmac.compare_digest(
+                self.__hash(password, _b64decode(salt), int(iterations)),
+                hashed)
+        except _DIGEST_ERRORS:
+            return False
+
+    def must_update(self, digest):
+        try:
+            _, iterations, salt, _ = digest.split('$')
+            _b64decode(salt)
+            return int(iterations) != self.__iterations
+        except _DIGEST_ERRORS:
+            return True
+
+
+class ScryptHasher(object):
+    """scrypt digests (hashlib.scrypt requires OpenSSL 1.1+)"""
+    name = 'scrypt'
+    is_slow = True
+
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        if not hasattr(hashlib, 'scrypt'):
+            raise RuntimeError('scrypt is not supported by hashlib')
+        self.__params = (n, r, p)
+
+    @staticmethod
+    def __hash(password, salt, n, r, p):
+        return _b64encode(hashlib.scrypt(password.encode(), salt=salt,
+                                         n=n, r=r, p=p,
+                                         maxmem=2 * 128 * n * r * p))
+
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(SALT_SIZE)
+        n, r, p = self.__params
+        return '{}${}${}${}${}${}'.format(
+            self.name, n, r, p, _b64encode(salt),
+            self.__hash(password, salt, n, r, p))
+
+    def verify(self, password, digest):
+        try:
+            _, n, r, p, salt, hashed = digest.split('$')
+            return hmac.compare_digest(
+                self.__hash(password, _b64decode(salt),
+                            int(n), int(r), int(p)),
+                hashed)
+        except _DIGEST_ERRORS:
+            return False
+
+    def must_update(self, digest):
+        try:
+            _, n, r, p, salt, _ = digest.split('$')
+            _b64decode(salt)
+            return (int(n), int(r), int(p)) != self.__params
+        except _DIGEST_ERRORS:
+            return True
+
+
+class PasswordHashers(object):
+    """digests of new passwords are made by the first hasher,
+    digests of other hashers are verified and should be updated
+
+    max_concurrency - max count of slow digests computed
+                      in thread pool at the same time
+    """
+    def __init__(self, hashers, max_concurrency=MAX_CONCURRENCY):
+        if not hashers:
+            raise ValueError('Password hashers are not specified')
+        self.__hashers = {hasher.name: hasher for hasher in hashers}
+        self.__preferred = hashers[0]
+        self.__max_concurrency = max_concurrency
+        self.__semaphore = None
+
+    def __hasher(self, digest):
+        name, sep, _ = digest.partition('$')
+        if not sep:
+            # digest of old leela versions
+            return self.__hashers.get(SHA1Hasher.name, None), \
+                '{}${}'.format(SHA1Hasher.name, digest)
+        return self.__hashers.get(name, None), digest
+
+    def encode(self, password):
+        return self.__preferred.encode(password)
+
+    def check(self, password, digest):
+        """verify password in current thread"""
+        if not digest:
+            return False
+        hasher, digest = self.__hasher(digest)
+        if hasher is None:
+            return False
+        return hasher.verify(password, digest)
+
+    def must_update(self, digest):
+        """digest is made by other hasher or with other parameters"""
+        hasher, digest = self.__hasher(digest or '')
+        if hasher is not self.__preferred:
+            return True
+        return hasher.must_update(digest)
+
+    @asyncio.coroutine
+    def __run(self, is_slow, func, *args):
+        if not is_slow:
+            return func(*args)
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.__max_concurrency)
+        yield from self.__semaphore.acquire()
+        try:
+            return (yield from executors.get_executor(executors.THREAD).run(
+                func, *args))
+        finally:
+            self.__semaphore.release()
+
+    @asyncio.coroutine
+    def verify(self, password, digest):
+        """verify password in thread pool (for slow hashers)"""
+        if not digest:
+            return False
+        hasher, digest = self.__hasher(digest)
+        if hasher is None:
+            return False
+        return (yield from self.__run(hasher.is_slow, hasher.verify,
+                                      password, digest))
+
+    @asyncio.coroutine
+    def encode_async(self, password):
+        """make digest of password in thread pool (for slow hashers)"""
+        return (yield from self.__run(self.__preferred.is_slow,
+                                      self.__preferred.encode, password))
+
+
+_hashers = PasswordHashers([PBKDF2Hasher(), SHA1Hasher()])
+
+
+def configure(hashers, max_concurrency=MAX_CONCURRENCY):
+    """set password hashers (the first one is used for new digests)"""
+    global _hashers
+    _hashers = PasswordHashers(hashers, max_concurrency)
+
+
+def get_hashers():
+    return _hashers
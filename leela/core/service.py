@@ -3,6 +3,7 @@ import asyncio
 from aiohttp import web
 
 from .decorators import leela_get, leela_api
+from . import metrics
 
 
 class LeelaService(object):
@@ -55,3 +56,10 @@ class LeelaService(object):
                     </ul>
                   </body></html>'''.format(li_list)
         return web.Response(text=html)
+
+    @leela_get('__metrics__')
+    def util_metrics(self, req):
+        """requests metrics of this process in Prometheus text format"""
+        text = metrics.format_prometheus(metrics.registry.snapshot())
+        return web.Response(body=text.encode(), headers={
+            'Content-Type': metrics.PROMETHEUS_CONTENT_TYPE})
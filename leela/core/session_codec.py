@@ -0,0 +1,211 @@
+"""
+Compact versioned binary format for sessions data.
+
+Supported values: None, bool, int, float, str, bytes, list, tuple,
+dict, set and user-defined types registered by register_type().
+Every dump starts with format version byte.
+"""
+
+import struct
+
+
+FORMAT_VERSION = 1
+
+T_NONE = 0x00
+T_FALSE = 0x01
+T_TRUE = 0x02
+T_INT8 = 0x03
+T_INT32 = 0x04
+T_INT64 = 0x05
+T_BIGINT = 0x06
+T_FLOAT = 0x07
+T_SHORT_STR = 0x08
+T_STR = 0x09
+T_BYTES = 0x0A
+T_LIST = 0x0B
+T_TUPLE = 0x0C
+T_DICT = 0x0D
+T_SET = 0x0E
+T_EXT = 0x0F
+
+_INT8 = struct.Struct('<b')
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+_UINT8 = struct.Struct('<B')
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+_FLOAT = struct.Struct('<d')
+
+# encoded tags (by tag value)
+_TAGS = tuple(_UINT8.pack(tag) for tag in range(T_EXT + 1))
+
+
+class SessionCodecError(ValueError):
+    pass
+
+
+_ext_by_type = {}
+_ext_by_id = {}
+
+
+def register_type(type_id, obj_type, encode, decode):
+    """register user-defined type for sessions data
+
+    type_id - unique integer (0..65535) stored in dump instead of type name
+    encode(obj) - should return value of supported type
+    decode(value) - should return obj_type instance
+    """
+    if type_id in _ext_by_id and _ext_by_id[type_id][0] is not obj_type:
+        raise SessionCodecError('Session type id {} is already registered '
+                                'for {}'.format(type_id,
+                                                _ext_by_id[type_id][0]))
+    _ext_by_type[obj_type] = (type_id, encode)
+    _ext_by_id[type_id] = (obj_type, decode)
+
+
+def _find_ext(obj_type):
+    for base in obj_type.__mro__:
+        ext = _ext_by_type.get(base, None)
+        if ext is not None:
+            return ext
+    return None
+
+
+def _encode_len(out, tag, length):
+    out.append(_TAGS[tag])
+    out.append(_UINT32.pack(length))
+
+
+def _encode(obj, out):
+    obj_type = type(obj)
+    if obj is None:
+        out.append(_TAGS[T_NONE])
+    elif obj_type is bool:
+        out.append(_TAGS[T_TRUE] if obj else _TAGS[T_FALSE])
+    elif obj_type is int:
+        if -0x80 <= obj < 0x80:
+            out.append(_TAGS[T_INT8] + _INT8.pack(obj))
+        elif -0x80000000 <= obj < 0x80000000:
+            out.append(_TAGS[T_INT32] + _INT32.pack(obj))
+        elif -0x8000000000000000 <= obj < 0x8000000000000000:
+            out.append(_TAGS[T_INT64] + _INT64.pack(obj))
+        else:
+            data = str(obj).encode()
+            _encode_len(out, T_BIGINT, len(data))
+            out.append(data)
+    elif obj_type is float:
+        out.append(_TAGS[T_FLOAT] + _FLOAT.pack(obj))
+    elif obj_type is str:
+        data = obj.encode()
+        if len(data) < 0x100:
+            out.append(_TAGS[T_SHORT_STR] + _UINT8.pack(len(data)) + data)
+        else:
+            _encode_len(out, T_STR, len(data))
+            out.append(data)
+    elif obj_type is bytes:
+        _encode_len(out, T_BYTES, len(obj))
+        out.append(obj)
+    elif obj_type is list or obj_type is tuple or obj_type is set:
+        tag = T_LIST if obj_type is list else \
+            T_TUPLE if obj_type is tuple else T_SET
+        _encode_len(out, tag, len(obj))
+        for item in obj:
+            _encode(item, out)
+    elif obj_type is dict:
+        _encode_len(out, T_DICT, len(obj))
+        for key, value in obj.items():
+            _encode(key, out)
+            _encode(value, out)
+    else:
+        ext = _find_ext(obj_type)
+        if ext is None:
+            raise SessionCodecError('Type {} is not supported in session. '
+                                    'Register it using register_type()'
+                                    .format(obj_type))
+        type_id, encode = ext
+        out.append(_TAGS[T_EXT] + _UINT16.pack(type_id))
+        _encode(encode(obj), out)
+
+
+def _decode(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag == T_NONE:
+        return None, pos
+    if tag == T_FALSE:
+        return False, pos
+    if tag == T_TRUE:
+        return True, pos
+    if tag == T_INT8:
+        return _INT8.unpack_from(data, pos)[0], pos + 1
+    if tag == T_INT32:
+        return _INT32.unpack_from(data, pos)[0], pos + 4
+    if tag == T_INT64:
+        return _INT64.unpack_from(data, pos)[0], pos + 8
+    if tag == T_FLOAT:
+        return _FLOAT.unpack_from(data, pos)[0], pos + 8
+    if tag == T_SHORT_STR:
+        length = data[pos]
+        pos += 1
+        if pos + length > len(data):
+            raise SessionCodecError('Session data is truncated')
+        return data[pos:pos + length].decode(), pos + length
+    if tag == T_EXT:
+        type_id = _UINT16.unpack_from(data, pos)[0]
+        ext = _ext_by_id.get(type_id, None)
+        if ext is None:
+            raise SessionCodecError('Unknown session type id {}'
+                                    .format(type_id))
+        value, pos = _decode(data, pos + 2)
+        return ext[1](value), pos
+
+    length = _UINT32.unpack_from(data, pos)[0]
+    pos += 4
+    if pos + length > len(data):
+        raise SessionCodecError('Session data is truncated')
+    if tag == T_BIGINT:
+        return int(data[pos:pos + length]), pos + length
+    if tag == T_STR:
+        return data[pos:pos + length].decode(), pos + length
+    if tag == T_BYTES:
+        return bytes(data[pos:pos + length]), pos + length
+    if tag == T_DICT:
+        ret = {}
+        for _ in range(length):
+            key, pos = _decode(data, pos)
+            ret[key], pos = _decode(data, pos)
+        return ret, pos
+    if tag in (T_LIST, T_TUPLE, T_SET):
+        ret = []
+        for _ in range(length):
+            item, pos = _decode(data, pos)
+            ret.append(item)
+        if tag == T_TUPLE:
+            ret = tuple(ret)
+        elif tag == T_SET:
+            ret = set(ret)
+        return ret, pos
+
+    raise SessionCodecError('Invalid session data tag {}'.format(tag))
+
+
+def dumps(obj):
+    out = [_UINT8.pack(FORMAT_VERSION)]
+    _encode(obj, out)
+    return b''.join(out)
+
+
+def loads(data):
+    if not data or data[0] != FORMAT_VERSION:
+        raise SessionCodecError('Unsupported session data format')
+    try:
+        obj, pos = _decode(data, 1)
+    except SessionCodecError:
+        raise
+    except Exception as err:
+        # bad lengths, numbers, unhashable keys, errors of type decoders
+        raise SessionCodecError('Corrupted session data: {!r}'.format(err))
+    if pos != len(data):
+        raise SessionCodecError('Session data has {} trailing bytes'
+                                .format(len(data) - pos))
+    return obj
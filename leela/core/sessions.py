@@ -1,19 +1,30 @@
 
+import os
 import time
 import string
 import random
-import pickle
 import hashlib
 import asyncio
+import tempfile
+import heapq
+from collections import OrderedDict
+
+from leela.core import session_codec
+from leela.utils.lru_cache import LRUCache
+from leela.utils.redis_client import RedisClient
+from leela.utils.logger import logger
 
 
 DEFAULT_EXPIRE_TIME = 60*60*24*30  # 30 days
+REDIS_EXPIRE_FIELD = b'\x00expire_time'
 
 
 class Session(object):
     def __init__(self, session_id, session_data=None, expire_time=None):
         self.__session_id = session_id
         self.__session_data = session_data if session_data else {}
+        self.__changed_keys = set()
+        self.__removed_keys = set()
         self.need_remove = False
         self.modified = False
         self.expire_time = expire_time
@@ -23,13 +34,20 @@ class Session(object):
 
     def set(self, key, value):
         self.__session_data[key] = value
+        self.__changed_keys.add(key)
+        self.__removed_keys.discard(key)
         self.modified = True
 
     def get(self, key, default=None):
         return self.__session_data.get(key, default)
 
     def pop(self, key, default=None):
-        return self.__session_data.pop(key, default)
+        if key not in self.__session_data:
+            return default
+        self.__changed_keys.discard(key)
+        self.__removed_keys.add(key)
+        self.modified = True
+        return self.__session_data.pop(key)
 
     def get_id(self):
         return self.__session_id
@@ -40,12 +58,30 @@ class Session(object):
     def remove(self):
         self.need_remove = True
 
+    def changes(self):
+        """get session changes since last save
+
+        Returns tuple ({changed key: value}, set of removed keys)
+        Notice: in-place modifications of stored values are not tracked,
+        use set() for saving modified value.
+        """
+        changed = {key: self.__session_data[key]
+                   for key in self.__changed_keys}
+        return changed, set(self.__removed_keys)
+
+    def reset_changes(self):
+        self.__changed_keys.clear()
+        self.__removed_keys.clear()
+        self.modified = False
+
     def dump(self):
-        return pickle.dumps(self)
+        return session_codec.dumps([self.__session_id, self.expire_time,
+                                    self.__session_data])
 
     @classmethod
-    def load(self, dump):
-        return pickle.loads(dump)
+    def load(cls, dump):
+        session_id, expire_time, session_data = session_codec.loads(dump)
+        return cls(session_id, session_data, expire_time)
 
 
 class BaseSessionManager(object):
@@ -91,18 +127,76 @@ class BaseSessionManager(object):
 
 
 class InMemorySessionsManager(BaseSessionManager):
-    def __init__(self, expire_time=DEFAULT_EXPIRE_TIME):
+    """Sessions are stored in worker memory
+
+    Expired sessions are removed lazily on get() and by periodic sweep
+    (every sweep_interval seconds) using heap of expiration times.
+    If max_sessions is set, least recently used sessions are evicted
+    when the limit is exceeded.
+    """
+    def __init__(self, expire_time=DEFAULT_EXPIRE_TIME, max_sessions=None,
+                 sweep_interval=60):
         super().__init__(expire_time)
-        self.__sessions = {}
+        self.__sessions = OrderedDict()
+        self.__expire_heap = []
+        self.__max_sessions = max_sessions
+        self.__sweep_interval = sweep_interval
+        self.__sweep_task = None
 
     def count(self):
         return len(self.__sessions)
 
+    @asyncio.coroutine
+    def start(self):
+        if self.__sweep_interval:
+            self.__sweep_task = asyncio.ensure_future(self.__sweep_loop())
+
+    @asyncio.coroutine
+    def stop(self):
+        if self.__sweep_task:
+            self.__sweep_task.cancel()
+            self.__sweep_task = None
+
+    @asyncio.coroutine
+    def __sweep_loop(self):
+        while True:
+            yield from asyncio.sleep(self.__sweep_interval)
+            try:
+                self.sweep()
+            except Exception as err:
+                logger.error('sessions sweep failed: {}'.format(err))
+
+    def sweep(self):
+        """remove expired sessions, returns removed sessions count"""
+        now = time.time()
+        heap = self.__expire_heap
+        removed = 0
+        while heap and heap[0][0] <= now:
+            expire_time, session_id = heapq.heappop(heap)
+            session = self.__sessions.get(session_id, None)
+            # heap entry can be outdated if session was updated later
+            if session is not None and session.expire_time <= now:
+                del self.__sessions[session_id]
+                removed += 1
+
+        if len(heap) > 2 * len(self.__sessions) + 1024:
+            self.__rebuild_heap()
+        return removed
+
+    def __rebuild_heap(self):
+        self.__expire_heap = [(session.expire_time, session_id)
+                              for session_id, session
+                              in self.__sessions.items()]
+        heapq.heapify(self.__expire_heap)
+
     @asyncio.coroutine
     def get(self, session_id):
         session = self.__sessions.get(session_id, None)
         if session:
-            return session
+            if session.expire_time > time.time():
+                self.__sessions.move_to_end(session_id)
+                return session
+            del self.__sessions[session_id]
 
         session = Session(None)
         return session
@@ -119,7 +213,12 @@ class InMemorySessionsManager(BaseSessionManager):
         session.expire_time = exp_time
         session.set_id(session_id)
         self.__sessions[session_id] = session
-        session.modified = False
+        self.__sessions.move_to_end(session_id)
+        heapq.heappush(self.__expire_heap, (exp_time, session_id))
+        session.reset_changes()
+
+        if self.__max_sessions and len(self.__sessions) > self.__max_sessions:
+            self.__sessions.popitem(last=False)
 
     @asyncio.coroutine
     def remove(self, session):
@@ -128,3 +227,254 @@ class InMemorySessionsManager(BaseSessionManager):
             return False
         del self.__sessions[session_id]
         return True
+
+
+class SharedSessionsManager(BaseSessionManager):
+    """Base class for session managers with sessions storage shared
+    between leela workers.
+
+    Recently used sessions are cached in process memory (LRU with TTL),
+    so hot sessions does not need storage access on every request.
+    Session modified in other worker can be visible with delay
+    up to cache_ttl seconds (cache_size=0 disables the cache).
+    """
+    def __init__(self, expire_time=DEFAULT_EXPIRE_TIME,
+                 cache_size=1024, cache_ttl=5):
+        super().__init__(expire_time)
+        self.__cache = LRUCache(cache_size, cache_ttl) if cache_size else None
+
+    @asyncio.coroutine
+    def _load(self, session_id):
+        """return Session from storage (or None if not found)"""
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def _store(self, session):
+        """save session to storage
+        (only session.changes() can be saved if storage supports it)
+        """
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def _delete(self, session_id):
+        """remove session from storage, return True if it was found"""
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def _exists(self, session_id):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def get(self, session_id):
+        if session_id is None:
+            return Session(None)
+
+        if self.__cache is not None:
+            session = self.__cache.get(session_id)
+            if session is not None and session.expire_time > time.time():
+                return session
+
+        try:
+            session = yield from self._load(session_id)
+        except session_codec.SessionCodecError as err:
+            logger.warning('invalid session {} data: {}'
+                           .format(session_id, err))
+            session = None
+        if session is None:
+            return Session(None)
+
+        if session.expire_time < time.time():
+            yield from self.remove(session)
+            return Session(None)
+
+        if self.__cache is not None:
+            self.__cache.set(session_id, session)
+        return session
+
+    @asyncio.coroutine
+    def set(self, session):
+        session_id = session.get_id()
+        if session_id is None:  # new session
+            while True:
+                session_id = self.generate_session_id()
+                exists = yield from self._exists(session_id)
+                if not exists:
+                    break
+        self.update_session_time(session)
+        session.set_id(session_id)
+
+        yield from self._store(session)
+        session.reset_changes()
+        if self.__cache is not None:
+            self.__cache.set(session_id, session)
+
+    @asyncio.coroutine
+    def remove(self, session):
+        session_id = session.get_id()
+        if session_id is None:
+            return False
+        if self.__cache is not None:
+            self.__cache.pop(session_id)
+        return (yield from self._delete(session_id))
+
+
+class RedisSessionsManager(SharedSessionsManager):
+    """Sessions are stored in Redis (or any server with Redis protocol)
+    and expired by Redis itself.
+
+    Every session is Redis hash with separately encoded values,
+    so only changed keys are written on session saving.
+    """
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None,
+                 key_prefix='leela:session:', expire_time=DEFAULT_EXPIRE_TIME,
+                 cache_size=1024, cache_ttl=5):
+        super().__init__(expire_time, cache_size, cache_ttl)
+        self.__key_prefix = key_prefix
+        self.__client = RedisClient(host, port, db, password)
+
+    @asyncio.coroutine
+    def start(self):
+        yield from self.__client.connect()
+
+    @asyncio.coroutine
+    def stop(self):
+        yield from self.__client.close()
+
+    @asyncio.coroutine
+    def _load(self, session_id):
+        items = yield from self.__client.execute(
+            'HGETALL', self.__key_prefix + session_id)
+        if not items:
+            return None
+
+        expire_time = None
+        data = {}
+        for i in range(0, len(items), 2):
+            key, value = items[i], session_codec.loads(items[i + 1])
+            if key == REDIS_EXPIRE_FIELD:
+                expire_time = value
+            else:
+                data[key.decode()] = value
+        return Session(session_id, data, expire_time)
+
+    @asyncio.coroutine
+    def _store(self, session):
+        key = self.__key_prefix + session.get_id()
+        changed, removed = session.changes()
+
+        args = ['HSET', key,
+                REDIS_EXPIRE_FIELD, session_codec.dumps(session.expire_time)]
+        for s_key, value in changed.items():
+            args += [s_key, session_codec.dumps(value)]
+
+        # commands are pipelined, so all of them cost single round trip
+        cmds = [self.__client.execute(*args)]
+        if removed:
+            cmds.append(self.__client.execute('HDEL', key, *removed))
+        cmds.append(self.__client.execute('PEXPIRE', key,
+                                          int(self.expire_time * 1000)))
+        yield from asyncio.gather(*cmds)
+
+    @asyncio.coroutine
+    def _delete(self, session_id):
+        ret = yield from self.__client.execute(
+            'DEL', self.__key_prefix + session_id)
+        return ret > 0
+
+    @asyncio.coroutine
+    def _exists(self, session_id):
+        ret = yield from self.__client.execute(
+            'EXISTS', self.__key_prefix + session_id)
+        return ret > 0
+
+
+def _default_sessions_path():
+    base_path = '/dev/shm' if os.path.isdir('/dev/shm') \
+        else tempfile.gettempdir()
+    return os.path.join(base_path, 'leela-sessions')
+
+
+class FileSessionsManager(SharedSessionsManager):
+    """Sessions are stored as files in directory (one file per session)
+    that is shared between workers on single host.
+    By default directory is placed in /dev/shm (shared memory filesystem).
+    Expired sessions files are removed every sweep_interval seconds.
+    """
+    def __init__(self, path=None, expire_time=DEFAULT_EXPIRE_TIME,
+                 cache_size=1024, cache_ttl=5, sweep_interval=600):
+        super().__init__(expire_time, cache_size, cache_ttl)
+        self.__path = path or _default_sessions_path()
+        self.__sweep_interval = sweep_interval
+        self.__sweep_task = None
+
+    def __session_path(self, session_id):
+        # session_id comes from cookie, so never trust it as a path part
+        if not session_id.isalnum():
+            return None
+        return os.path.join(self.__path, session_id)
+
+    @asyncio.coroutine
+    def start(self):
+        os.makedirs(self.__path, mode=0o700, exist_ok=True)
+        if self.__sweep_interval:
+            self.__sweep_task = asyncio.ensure_future(self.__sweep_loop())
+
+    @asyncio.coroutine
+    def stop(self):
+        if self.__sweep_task:
+            self.__sweep_task.cancel()
+            self.__sweep_task = None
+
+    def sweep(self):
+        """remove expired sessions files"""
+        min_mtime = time.time() - self.expire_time
+        for file_name in os.listdir(self.__path):
+            f_path = os.path.join(self.__path, file_name)
+            try:
+                if os.path.getmtime(f_path) < min_mtime:
+                    os.unlink(f_path)
+            except OSError:
+                pass
+
+    @asyncio.coroutine
+    def __sweep_loop(self):
+        while True:
+            yield from asyncio.sleep(self.__sweep_interval)
+            try:
+                self.sweep()
+            except Exception as err:
+                logger.error('sessions sweep failed: {}'.format(err))
+
+    @asyncio.coroutine
+    def _load(self, session_id):
+        f_path = self.__session_path(session_id)
+        if f_path is None:
+            return None
+        try:
+            with open(f_path, 'rb') as fdesc:
+                return Session.load(fdesc.read())
+        except FileNotFoundError:
+            return None
+
+    @asyncio.coroutine
+    def _store(self, session):
+        f_path = self.__session_path(session.get_id())
+        tmp_path = '{}.{}.tmp'.format(f_path, os.getpid())
+        with open(tmp_path, 'wb') as fdesc:
+            fdesc.write(session.dump())
+        os.replace(tmp_path, f_path)
+
+    @asyncio.coroutine
+    def _delete(self, session_id):
+        f_path = self.__session_path(session_id)
+        if f_path is None:
+            return False
+        try:
+            os.unlink(f_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @asyncio.coroutine
+    def _exists(self, session_id):
+        return os.path.exists(self.__session_path(session_id))
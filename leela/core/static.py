@@ -0,0 +1,189 @@
+"""
+Static files serving for workers without nginx proxy.
+
+Small files (index.html, scripts, styles) are cached in memory and
+revalidated by mtime, large files are read by chunks in worker thread
+pool and sent through response transport.
+Responses have ETag and Last-Modified headers, conditional requests
+get 304 response. Precompressed files (<file>.br, <file>.gz) are sent
+to clients that accept their encoding.
+"""
+
+import os
+import stat
+import time
+import asyncio
+import mimetypes
+from email.utils import formatdate, parsedate_tz, mktime_tz
+from aiohttp import web
+
+from leela.core import executors
+from leela.core.compression import parse_accept_encoding
+from leela.utils.lru_cache import LRUCache
+
+
+# files of this size and smaller are kept in memory
+MEMORY_MAX_SIZE = 256 * 1024
+# max count of cached files
+CACHE_SIZE = 1024
+# cached files are revalidated by mtime not more often than this (seconds)
+CHECK_INTERVAL = 1
+CHUNK_SIZE = 256 * 1024
+
+# precompressed files extensions in preference order
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+class _StaticFile(object):
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'last_modified',
+                 'content_type', 'body', 'encodings', 'checked')
+
+    def __init__(self, path, st, content_type, coding=None):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime_ns
+        self.etag = '"{:x}-{:x}{}"'.format(
+            st.st_mtime_ns, st.st_size, '-' + coding if coding else '')
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.content_type = content_type
+        self.body = None
+        if self.size <= MEMORY_MAX_SIZE:
+            with open(path, 'rb') as fobj:
+                self.body = fobj.read()
+        self.encodings = {}
+        self.checked = time.monotonic()
+
+
+class StaticFiles(object):
+    """serves files of static_path directory"""
+    def __init__(self, static_path, cache_size=CACHE_SIZE):
+        self.__root = os.path.realpath(static_path)
+        self.__files = LRUCache(cache_size)
+
+    def __resolve(self, filename):
+        path = os.path.realpath(os.path.join(self.__root, filename))
+        if not path.startswith(self.__root + os.sep):
+            raise web.HTTPNotFound()
+        return path
+
+    def __load(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise web.HTTPNotFound()
+        if not stat.S_ISREG(st.st_mode):
+            raise web.HTTPNotFound()
+
+        content_type, coding = mimetypes.guess_type(path)
+        if coding:
+            # file is compressed itself (e.g. archive.tar.gz)
+            content_type = 'application/octet-stream'
+        content_type = content_type or 'application/octet-stream'
+        static_file = _StaticFile(path, st, content_type)
+
+        for coding, ext in PRECOMPRESSED:
+            try:
+                c_st = os.stat(path + ext)
+            except OSError:
+                continue
+            # outdated precompressed files are ignored
+            if stat.S_ISREG(c_st.st_mode) and \
+                    c_st.st_mtime_ns >= st.st_mtime_ns:
+                static_file.encodings[coding] = _StaticFile(
+                    path + ext, c_st, content_type, coding)
+        return static_file
+
+    def get(self, filename):
+        """returns cached file (it is reloaded if it was changed)"""
+        static_file = self.__files.get(filename, None)
+        now = time.monotonic()
+        if static_file is not None:
+            if now - static_file.checked < CHECK_INTERVAL:
+                return static_file
+            try:
+                st = os.stat(static_file.path)
+            except OSError:
+                st = None
+            if st is not None and st.st_mtime_ns == static_file.mtime and \
+                    st.st_size == static_file.size:
+                static_file.checked = now
+                return static_file
+            self.__files.pop(filename)
+
+        static_file = self.__load(self.__resolve(filename))
+        self.__files.set(filename, static_file)
+        return static_file
+
+    @staticmethod
+    def __not_modified(request, static_file):
+        etags = request.headers.get('IF-NONE-MATCH', None)
+        if etags is not None:
+            return etags.strip() == '*' or static_file.etag in etags
+        since = request.headers.get('IF-MODIFIED-SINCE', None)
+        if since is None:
+            return False
+        since = parsedate_tz(since)
+        if since is None:
+            return False
+        return static_file.mtime // 1000000000 <= mktime_tz(since)
+
+    @asyncio.coroutine
+    def serve(self, request, filename):
+        static_file = self.get(filename)
+
+        coding = None
+        if static_file.encodings:
+            accepted = parse_accept_encoding(
+                request.headers.get('ACCEPT-ENCODING', ''))
+            default = accepted.get('*', 0.0)
+            for name, _ in PRECOMPRESSED:
+                if name in static_file.encodings and \
+                        accepted.get(name, default) > 0:
+                    coding = name
+                    break
+        variant = static_file.encodings[coding] if coding else static_file
+
+        headers = {'ETag': variant.etag,
+                   'Last-Modified': variant.last_modified}
+        if static_file.encodings:
+            headers['Vary'] = 'Accept-Encoding'
+        if self.__not_modified(request, variant):
+            return web.Response(status=304, headers=headers)
+        if coding:
+            headers['Content-Encoding'] = coding
+
+        if variant.body is not None:
+            return web.Response(body=variant.body, headers=headers,
+                                content_type=variant.content_type)
+
+        resp = web.StreamResponse(headers=headers)
+        resp.content_type = variant.content_type
+        resp.content_length = variant.size
+        resp.start(request)
+        with open(variant.path, 'rb') as fobj:
+            yield from self.__send_file(resp, fobj)
+        return resp
+
+    @staticmethod
+    @asyncio.coroutine
+    def __send_file(resp, fobj):
+        # sendfile() to socket of transport is not used: transport
+        # owns the socket and buffers headers and data written before
+        pool = executors.get_executor(executors.THREAD)
+        while True:
+            chunk = yield from pool.run(fobj.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            resp.write(chunk)
+            yield from resp.drain()
+
+    @asyncio.coroutine
+    def handle(self, request):
+        """handler of /static/{filename} route"""
+        return (yield from self.serve(request,
+                                      request.match_info['filename']))
+
+    @asyncio.coroutine
+    def handle_index(self, request):
+        """handler of / route"""
+        return (yield from self.serve(request, 'index.html'))
@@ -0,0 +1,140 @@
+"""
+Spooled uploads.
+
+Uploaded data is read by chunks and kept in memory buffer while
+it is small, larger uploads are written to temporary file.
+Size limit is checked and digests are computed while data is read,
+so uploads of any size do not occupy worker memory.
+"""
+
+import os
+import io
+import errno
+import shutil
+import asyncio
+import hashlib
+import tempfile
+from aiohttp import web
+
+from leela.core import executors
+
+
+CHUNK_SIZE = 64 * 1024
+# uploads of this size and larger are written to temporary file
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+def copy_file(src_path, dst_path):
+    """copy file by sendfile() (data is not copied to user space)"""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset,
+                                   size - offset)
+                if not sent:
+                    break
+                offset += sent
+        except (AttributeError, OSError):
+            # sendfile() to regular file is not supported
+            src.seek(offset)
+            dst.seek(offset)
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class SpooledUpload(object):
+    """uploaded file (compatible with aiohttp FileField)
+
+    name - form field name
+    filename - file name sent by client
+    content_type - content type sent by client
+    file - file object (positioned to data start) for reading
+    size - size of data
+    """
+    def __init__(self, name=None, filename=None, content_type=None, *,
+                 max_size=None, hashes=(), spool_max_memory=SPOOL_MAX_MEMORY,
+                 upload_dir=None):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = io.BytesIO()
+        self.size = 0
+        self.__path = None
+        self.__max_size = max_size
+        self.__spool_max_memory = spool_max_memory
+        self.__upload_dir = upload_dir
+        self.__hashes = {algorithm: hashlib.new(algorithm)
+                         for algorithm in hashes}
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.__max_size is not None and self.size > self.__max_size:
+            raise web.HTTPRequestEntityTooLarge(
+                reason='Upload is larger than {} bytes'.format(
+                    self.__max_size))
+        for digest in self.__hashes.values():
+            digest.update(chunk)
+        if self.size >= self.__spool_max_memory and self.in_memory:
+            self.__rollover()
+        self.file.write(chunk)
+
+    def __rollover(self):
+        fd, self.__path = tempfile.mkstemp(prefix='leela-upload-',
+                                           dir=self.__upload_dir)
+        disk_file = os.fdopen(fd, 'w+b')
+        disk_file.write(self.file.getbuffer())
+        self.file = disk_file
+
+    @asyncio.coroutine
+    def read_from(self, read_chunk):
+        """read all data by read_chunk(size) coroutine"""
+        while True:
+            chunk = yield from read_chunk(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.write(chunk)
+        self.file.flush()
+        self.file.seek(0)
+        return self
+
+    @property
+    def in_memory(self):
+        return isinstance(self.file, io.BytesIO)
+
+    def hexdigest(self, name):
+        """digest of data by hash algorithm passed in hashes"""
+        return self.__hashes[name].hexdigest()
+
+    @asyncio.coroutine
+    def save(self, path):
+        """store data to path. Temporary file is moved to path
+        (or copied by sendfile() in thread pool if path is on other device)
+        """
+        if self.in_memory:
+            with open(path, 'wb') as dst:
+                dst.write(self.file.getbuffer())
+            return
+
+        try:
+            os.replace(self.__path, path)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            pool = executors.get_executor(executors.THREAD)
+            yield from pool.run(copy_file, self.__path, path)
+        else:
+            self.__path = None  # file is not temporary now
+
+    def close(self):
+        """close file and remove temporary file"""
+        self.file.close()
+        if self.__path is not None:
+            try:
+                os.unlink(self.__path)
+            except FileNotFoundError:
+                pass
+            self.__path = None
+
+    def __repr__(self):
+        return '<SpooledUpload {} {} bytes>'.format(self.filename, self.size)
@@ -2,10 +2,14 @@ import asyncio
 from aiohttp import web
 
 from leela.core.middleware import LeelaMiddleware
-from leela.services.auth import SESSION_USER_KEY, authorization
+from leela.services.auth import (SESSION_USER_KEY, UserRef, authorization,
+                                 users_service)
 
 
 class AuthMiddleware(LeelaMiddleware):
+    def need_on_request(self, params):
+        return bool(params.get('auth', None))
+
     @asyncio.coroutine
     def on_request(self, request, data, params, cache):
         auth_req = params.get('auth', None)
@@ -20,12 +24,13 @@ class AuthMiddleware(LeelaMiddleware):
         if not user:
             raise web.HTTPUnauthorized()
 
-        allowed_roles = auth_req.allowed_roles()
-        if allowed_roles:
-            allowed = user.get_roles() & allowed_roles
-            if not allowed:
-                raise web.HTTPUnauthorized(reason='Permission denied')
+        service = users_service()
+        if service is not None and isinstance(user, UserRef):
+            # roles of session reference are revalidated by users cache
+            # of service (invalidated users are loaded again)
+            if (yield from service.session_user(data)) is None:
+                raise web.HTTPUnauthorized()
+            user = data.session.get(SESSION_USER_KEY)
 
-    @asyncio.coroutine
-    def on_response(self, request, data, response, params, cache):
-        return response
+        if not auth_req.allows(user):
+            raise web.HTTPUnauthorized(reason='Permission denied')
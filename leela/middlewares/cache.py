@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+from aiohttp import web
+
+from leela.core.middleware import LeelaMiddleware
+from leela.core.decorators import leela_api
+from leela.core.compression import coded_etag, add_vary
+from leela.services.auth import SESSION_USER_KEY
+from leela.utils.lru_cache import LRUCache
+
+
+class ttl(object):
+    """responses caching parameters of API method:
+
+        @leela_get('stats', cache=ttl(30))
+
+    seconds - response lifetime
+    per_user - cache responses for every session user separately
+    """
+    def __init__(self, seconds, *, per_user=False):
+        self.seconds = seconds
+        self.per_user = per_user
+
+
+class _CachedResponse(object):
+    __slots__ = ('body', 'content_type', 'charset', 'etag', 'encodings')
+
+    def __init__(self, response):
+        self.body = response.body
+        self.content_type = response.content_type
+        self.charset = response.charset
+        self.etag = '"{}"'.format(hashlib.sha1(self.body).hexdigest())
+        # {coding: (compressed body, etag)}
+        self.encodings = {}
+
+
+class CacheMiddleware(LeelaMiddleware):
+    """caches responses of GET API methods with `cache` parameter
+
+    Responses are cached by path (with path parameters), query and
+    (optionally) session user. ETag header is added to responses,
+    304 is returned for requests with matching If-None-Match header.
+    Concurrent requests of not cached response wait for response
+    of the first one (API method is called once). If responses are
+    compressed, compressed bodies are cached too (ETag has coding suffix).
+
+    max_size - max count of cached responses (least recently used
+               responses are evicted over this limit)
+    wait_timeout - max time (seconds) of waiting for response of other
+                   request, API method is called after it
+    """
+    def __init__(self, max_size=1024, wait_timeout=30):
+        self.__responses = LRUCache(max_size)
+        self.__pending = {}
+        self.__wait_timeout = wait_timeout
+
+    def need_on_request(self, params):
+        return isinstance(params.get('cache', None), ttl)
+
+    need_on_response = need_on_request
+    need_on_failure = need_on_request
+
+    def need_on_preflight(self, params):
+        return False
+
+    def clear(self):
+        self.__responses.clear()
+
+    def __key(self, request, data, params):
+        user = None
+        if params['cache'].per_user and data.session:
+            user = data.session.get(SESSION_USER_KEY)
+            user = getattr(user, 'username', user)
+        return (request.path, tuple(sorted(request.GET.items())), user)
+
+    @staticmethod
+    @asyncio.coroutine
+    def __variant(request, cached):
+        """returns (coding, body, etag, vary) of response for client"""
+        compressor = leela_api.get_compressor()
+        if compressor is None or \
+                not compressor.compressible(cached.content_type,
+                                            len(cached.body)):
+            return None, cached.body, cached.etag, False
+        coding, compress = compressor.negotiate(
+            request.headers.get('ACCEPT-ENCODING', ''))
+        if coding is None:
+            return None, cached.body, cached.etag, True
+        variant = cached.encodings.get(coding, None)
+        if variant is None:
+            body = yield from compressor.compress_body(compress, cached.body)
+            variant = cached.encodings[coding] = \
+                (body, coded_etag(cached.etag, coding))
+        return (coding,) + variant + (True,)
+
+    @classmethod
+    @asyncio.coroutine
+    def __response(cls, request, cached, response=None):
+        """response with cached body (response of API method is updated
+        if it is passed)
+        """
+        coding, body, etag, vary = yield from cls.__variant(request, cached)
+        if etag in request.headers.get('IF-NONE-MATCH', ''):
+            response = web.Response(status=304)
+        elif response is None:
+            response = web.Response(body=body,
+                                    content_type=cached.content_type)
+            if cached.charset:
+                response.charset = cached.charset
+        else:
+            response.body = body
+        response.headers['ETag'] = etag
+        if coding is not None and response.status != 304:
+            response.headers['Content-Encoding'] = coding
+        if vary:
+            add_vary(response)
+        return response
+
+    @asyncio.coroutine
+    def on_request(self, request, data, params, cache):
+        if request.method != 'GET':
+            return None
+        key = self.__key(request, data, params)
+        while True:
+            cached = self.__responses.get(key, None)
+            if cached is not None:
+                return (yield from self.__response(request, cached))
+
+            pending = self.__pending.get(key, None)
+            if pending is None:
+                break
+            # response is processed by other request already
+            try:
+                cached = yield from asyncio.wait_for(
+                    asyncio.shield(pending), self.__wait_timeout)
+            except asyncio.TimeoutError:
+                cached = None
+            if cached is None:
+                break  # it is not cacheable, failed or too slow
+
+        if key not in self.__pending:
+            self.__pending[key] = asyncio.Future()
+        cache['response_cache_key'] = key
+        return None
+
+    def __release(self, key, cached):
+        pending = self.__pending.pop(key, None)
+        if pending is not None and not pending.done():
+            pending.set_result(cached)
+
+    @asyncio.coroutine
+    def on_response(self, request, data, response, params, cache):
+        key = cache.get('response_cache_key', None)
+        if key is None:
+            return response
+
+        cached = None
+        if type(response) is web.Response and response.status == 200 \
+                and response.body is not None:
+            cached = _CachedResponse(response)
+            self.__responses.set(key, cached, params['cache'].seconds)
+        self.__release(key, cached)
+
+        if cached is None:
+            return response
+        return (yield from self.__response(request, cached, response))
+
+    @asyncio.coroutine
+    def on_failure(self, request, data, error, params, cache):
+        key = cache.get('response_cache_key', None)
+        if key is not None:
+            self.__release(key, None)
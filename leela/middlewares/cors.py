@@ -1,8 +1,21 @@
 import re
 import asyncio
+from types import MappingProxyType
+from aiohttp import web
 
 from leela.core.middleware import LeelaMiddleware
-from leela.core.sessions import BaseSessionManager, InMemorySessionsManager
+from leela.utils.lru_cache import LRUCache
+
+
+DEFAULT_ALLOW = 'HEAD,GET,PUT,POST,PATCH,DELETE,OPTIONS'
+
+# seconds while browser can use cached preflight response
+DEFAULT_MAX_AGE = 600
+
+# numbered backreferences are broken by rules regexps joining
+_BACKREF_RE = re.compile(r'\\[1-9]')
+
+_NOT_FOUND = object()
 
 
 class CORS(object):
@@ -20,6 +33,7 @@ class CORS(object):
                                       ['x-requested-with', 'content-type',
                                        'accept', 'origin', 'authorization',
                                        'x-csrftoken'])
+        self.max_age = rule.get('max_age', DEFAULT_MAX_AGE)
 
         self.http_headers = {
             'Access-Control-Allow-Origin':  ' '.join(self.allow_origin),
@@ -28,27 +42,89 @@ class CORS(object):
             'Access-Control-Allow-Methods': ', '.join(self.allow_methods),
             'Access-Control-Allow-Headers': ', '.join(self.allow_headers)}
 
+        # headers of OPTIONS response
+        preflight_headers = dict(self.http_headers)
+        preflight_headers['Allow'] = ','.join(self.allow_methods)
+        if self.max_age is not None:
+            preflight_headers['Access-Control-Max-Age'] = \
+                str(int(self.max_age))
+        self.preflight_headers = MappingProxyType(preflight_headers)
+
     def __repr__(self):
         return 'CORS({})'.format(self.url_regex)
 
     def check(self, request):
         if request.method not in self.allow_methods:
             raise web.HTTPMethodNotAllowed(request.method, self.allow_methods,
-                                           headers=self.http_headers())
+                                           headers=self.http_headers)
 
     def matched(self, url):
         return bool(self.url_regex.match(url))
 
 
-class CorsMiddleware(LeelaMiddleware):
+class CORSMatcher(object):
+    """finds first CORS rule matched to URL path
+
+    Rules regexps are joined into one alternation regexp,
+    so path is matched in one pass instead of trying rules one by one.
+    Rules are tried one by one if regexps can not be joined.
+    """
     def __init__(self, rules):
+        self.__rules = rules
+        self.__regex = None
+        self.__groups = {}
+
+        parts = []
+        group = 1
+        for rule in rules:
+            pattern = rule.url_regex.pattern
+            if _BACKREF_RE.search(pattern):
+                return
+            self.__groups[group] = rule
+            parts.append('({})'.format(pattern))
+            group += rule.url_regex.groups + 1
+
+        if not parts:
+            return
+        try:
+            self.__regex = re.compile('|'.join(parts))
+        except re.error:
+            self.__regex = None
+
+    @property
+    def is_joined(self):
+        return self.__regex is not None
+
+    def find(self, path):
+        if self.__regex is None:
+            for cors_rule in self.__rules:
+                if cors_rule.matched(path):
+                    return cors_rule
+            return None
+
+        match = self.__regex.match(path)
+        if match is None:
+            return None
+        # group of rule's regexp is closed last
+        return self.__groups[match.lastindex]
+
+
+class CorsMiddleware(LeelaMiddleware):
+    def __init__(self, rules, cache_size=1024):
+        """
+        rules - list of CORS rules configs (checked in order)
+        cache_size - max count of URL paths with cached matched rule
+        """
         self.__cors_rules = [CORS(rule) for rule in rules]
+        self.__matcher = CORSMatcher(self.__cors_rules)
+        self.__cache = LRUCache(cache_size)
 
     def _find_cors_rule(self, path):
-        for cors_rule in self.__cors_rules:
-            if cors_rule.matched(path):
-                return cors_rule
-        return None
+        cors_rule = self.__cache.get(path, _NOT_FOUND)
+        if cors_rule is _NOT_FOUND:
+            cors_rule = self.__matcher.find(path)
+            self.__cache.set(path, cors_rule)
+        return cors_rule
 
     @asyncio.coroutine
     def on_request(self, request, data, params, cache):
@@ -61,17 +137,17 @@ class CorsMiddleware(LeelaMiddleware):
 
     @asyncio.coroutine
     def on_response(self, request, data, response, params, cache):
-        cors_rule = cache.get('cors_rule')
+        cors_rule = cache.get('cors_rule', _NOT_FOUND)
+        if cors_rule is _NOT_FOUND:
+            # on_request is not called for OPTIONS requests
+            cors_rule = self._find_cors_rule(request.path)
 
         if request.method == 'OPTIONS':
-            cors_rule = self._find_cors_rule(request.path)
             if cors_rule:
-                response.headers['Allow'] = ','.join(cors_rule.allow_methods)
+                response.headers.update(cors_rule.preflight_headers)
             else:
-                response.headers['Allow'] = \
-                    'HEAD,GET,PUT,POST,PATCH,DELETE,OPTIONS'
-
-        if cors_rule:
+                response.headers['Allow'] = DEFAULT_ALLOW
+        elif cors_rule:
             response.headers.update(cors_rule.http_headers)
 
         return response
@@ -0,0 +1,32 @@
+import asyncio
+
+from leela.core.middleware import LeelaMiddleware
+from leela.core.orm import IdentityMap
+
+
+class IdentityMapMiddleware(LeelaMiddleware):
+    """activates ORM identity map while request processing,
+    so Model.get() and Model.find_one() results are reused
+    by API method and middlewares after this one
+    """
+    def need_on_preflight(self, params):
+        return False
+
+    @asyncio.coroutine
+    def on_request(self, request, data, params, cache):
+        identity_map = IdentityMap()
+        identity_map.activate()
+        cache['identity_map'] = identity_map
+
+    @asyncio.coroutine
+    def on_response(self, request, data, response, params, cache):
+        identity_map = cache.get('identity_map', None)
+        if identity_map is not None:
+            identity_map.deactivate()
+        return response
+
+    @asyncio.coroutine
+    def on_failure(self, request, data, error, params, cache):
+        identity_map = cache.get('identity_map', None)
+        if identity_map is not None:
+            identity_map.deactivate()
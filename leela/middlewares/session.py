@@ -21,7 +21,11 @@ class SessionMiddleware(LeelaMiddleware):
 
     @asyncio.coroutine
     def destroy(self):
-        yield from self.session_manager.destroy()
+        yield from self.session_manager.stop()
+
+    def need_on_preflight(self, params):
+        # there is no session for OPTIONS requests
+        return False
 
     @asyncio.coroutine
     def on_request(self, request, data, params, cache):
@@ -1,25 +1,67 @@
 import asyncio
-import hashlib
 from aiohttp import web
 
+from leela.core import session_codec, passwords
 from leela.core.service import LeelaService
 from leela.core.decorators import leela_post
+from leela.utils.lru_cache import LRUCache
 
 
 SESSION_USER_KEY = '_leela_user'
 
+# process-local cache of users loaded by AuthBasedService.get_user()
+USERS_CACHE_SIZE = 1024
+USERS_CACHE_TTL = 60
+
+# service that loads users of sessions for AuthMiddleware
+_users_service = None
+
+# bits of roles (assigned in process on first usage)
+_role_bits = {}
+# {roles tuple: roles bitmask}
+_roles_masks = {}
+
+
+def roles_mask(roles):
+    """bitmask of roles (valid in current process only)"""
+    roles = tuple(roles)
+    mask = _roles_masks.get(roles, None)
+    if mask is None:
+        mask = 0
+        for role in roles:
+            bit = _role_bits.get(role, None)
+            if bit is None:
+                bit = _role_bits[role] = 1 << len(_role_bits)
+            mask |= bit
+        _roles_masks[roles] = mask
+    return mask
+
 
 class authorization(object):
     def __init__(self, *roles):
         self.__roles = set(roles)
+        self.__mask = roles_mask(sorted(roles))
 
     def allowed_roles(self):
         return self.__roles
 
+    def allows(self, user):
+        """user (UserRef or BaseUser) has one of allowed roles"""
+        if not self.__mask:
+            return True
+        mask = getattr(user, 'roles_mask', None)
+        if mask is None:
+            mask = roles_mask(user.get_roles())
+        return bool(mask & self.__mask)
+
 need_auth = authorization()
 
 
 class BaseUser(object):
+    # should be changed by application when user roles are changed
+    # (sessions of user are revalidated by AuthBasedService.session_user)
+    version = 0
+
     def __init__(self, username, password_digest, roles, **additional_info):
         self.username = username
         self.password_digest = password_digest
@@ -27,25 +69,140 @@ class BaseUser(object):
         self.additional_info = additional_info
 
     def check_password(self, password):
-        pwd_digest = hashlib.sha1(password.encode()).hexdigest()
-        return pwd_digest == self.password_digest
+        """verify password in current thread
+        (verify_password() coroutine should be used in services)
+        """
+        return passwords.get_hashers().check(password, self.password_digest)
+
+    @asyncio.coroutine
+    def verify_password(self, password):
+        return (yield from passwords.get_hashers().verify(
+            password, self.password_digest))
 
     @classmethod
     def create(cls, username, password, roles, **additional_info):
-        pwd_digest = hashlib.sha1(password.encode()).hexdigest()
+        pwd_digest = passwords.get_hashers().encode(password)
         return cls(username=username, password_digest=pwd_digest,
                    roles=roles, additional_info=additional_info)
 
     def get_roles(self):
         return set(self.roles)
 
+
+class UserRef(object):
+    """compact reference to user stored in session instead of user object
+
+    Roles are checked by AuthMiddleware without loading user while user
+    is cached in process, full user object is available by AuthBasedService.session_user()
+    """
+    __slots__ = ('username', 'roles', 'version', 'roles_mask')
+
+    def __init__(self, username, roles, version=0):
+        self.username = username
+        self.roles = tuple(roles)
+        self.version = version
+        self.roles_mask = roles_mask(self.roles)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.username, sorted(user.get_roles()), user.version)
+
+    def get_roles(self):
+        return set(self.roles)
+
+    def __eq__(self, other):
+        return isinstance(other, UserRef) and \
+            (self.username, self.roles, self.version) == \
+            (other.username, other.roles, other.version)
+
+    def __repr__(self):
+        return '<UserRef {} {}>'.format(self.username, self.roles)
+
+
+session_codec.register_type(
+    1, BaseUser,
+    lambda user: [user.username, user.password_digest, user.roles,
+                  user.additional_info],
+    lambda value: BaseUser(value[0], value[1], value[2], **value[3]))
+
+session_codec.register_type(
+    2, UserRef,
+    lambda ref: [ref.username, ref.roles, ref.version],
+    lambda value: UserRef(value[0], value[1], value[2]))
+
+
+def users_service():
+    """AuthBasedService that revalidates session users for AuthMiddleware
+    (the last started one) or None
+    """
+    return _users_service
+
+
 class AuthBasedService(LeelaService):
+    __users = None
+
+    @asyncio.coroutine
+    def start(self):
+        """registers service for AuthMiddleware (call it if start()
+        is overridden)
+        """
+        global _users_service
+        _users_service = self
+
+    def __users_cache(self):
+        global _users_service
+        if self.__users is None:
+            self.__users = LRUCache(USERS_CACHE_SIZE, USERS_CACHE_TTL)
+            if _users_service is None:
+                _users_service = self
+        return self.__users
 
     @asyncio.coroutine
     def get_user(self, username):
         """MUST be implemented in inherited class"""
         raise RuntimeError('not implemented')
 
+    @asyncio.coroutine
+    def update_password_digest(self, user):
+        """called on login when digest of user password is made by
+        outdated hasher and user.password_digest is updated.
+        Should be implemented in inherited class for saving new digest
+        """
+        pass
+
+    def invalidate_user(self, username):
+        """remove user from process-local cache (MUST be called when user
+        roles are changed in this process, BaseUser.version should be
+        changed too for revalidation of sessions in other processes).
+        Sessions of user are revalidated by AuthMiddleware on next request
+        """
+        self.__users_cache().pop(username)
+
+    @asyncio.coroutine
+    def session_user(self, req):
+        """returns user of request session (or None).
+        Users are cached in process for USERS_CACHE_TTL seconds,
+        session reference is updated if user roles or version are changed
+        """
+        ref = req.session.get(SESSION_USER_KEY) if req.session else None
+        if not ref:
+            return None
+        if isinstance(ref, BaseUser):
+            return ref  # stored by old leela versions
+
+        users = self.__users_cache()
+        user = users.get(ref.username, None)
+        if user is None or user.version != ref.version:
+            user = yield from self.get_user(ref.username)
+            if not user:
+                return None
+            users.set(ref.username, user)
+
+        new_ref = UserRef.from_user(user)
+        if new_ref != ref:
+            req.session.set(SESSION_USER_KEY, new_ref)
+        return user
+
     @leela_post('__auth__')
     def util_auth(self, req):
         self.mandatory_check(req.data, 'username', 'password')
@@ -55,10 +212,18 @@ class AuthBasedService(LeelaService):
         if not user:
             raise web.HTTPUnauthorized(reason='User does not found')
 
-        if not user.check_password(req.data.password):
+        valid = yield from user.verify_password(req.data.password)
+        if not valid:
             raise web.HTTPUnauthorized(reason='Invalid password')
 
-        req.session.set(SESSION_USER_KEY, user)
+        hashers = passwords.get_hashers()
+        if hashers.must_update(user.password_digest):
+            user.password_digest = yield from hashers.encode_async(
+                req.data.password)
+            yield from self.update_password_digest(user)
+
+        self.__users_cache().set(user.username, user)
+        req.session.set(SESSION_USER_KEY, UserRef.from_user(user))
 
         return {'username': user.username,
                 'roles': user.roles,
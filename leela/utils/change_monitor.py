@@ -0,0 +1,258 @@
+"""
+Files changes monitor.
+
+Linux inotify is used (through libc, no extra dependencies) if it is
+available, otherwise watched directories trees are polled periodically.
+Changes are batched: they are reported after short period without
+new changes, so e.g. git checkout of many files gives one batch.
+"""
+
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+import asyncio
+
+from .logger import logger
+
+
+# quiet period after last change before changes batch is reported
+DEBOUNCE_TIME = 0.3
+# directories trees scan interval if inotify is not available
+POLL_INTERVAL = 1
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+
+_EVENT = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class ChangeMonitor:
+    """Watches directories trees for changed, created and removed files
+
+    paths - directories for watching (recursively)
+    file_filter - callable(file_path) -> bool, changes of files
+                  that are not accepted by filter are ignored
+    debounce - quiet period in seconds before changes are reported
+    poll_interval - scan interval in seconds if inotify is not used
+    use_inotify - use polling if False
+    """
+    def __init__(self, paths, file_filter=None, *, debounce=DEBOUNCE_TIME,
+                 poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.__paths = [os.path.abspath(path) for path in paths]
+        self.__filter = file_filter or (lambda path: True)
+        self.__debounce = debounce
+        self.__poll_interval = poll_interval
+        self.__libc = _load_libc() if use_inotify else None
+        self.__changes = set()
+        self.__overflow = False
+        self.__event = asyncio.Event()
+        self.__fd = None
+        self.__watches = {}
+        self.__snapshot = None
+        self.__poll_task = None
+
+    @property
+    def is_inotify(self):
+        return self.__fd is not None
+
+    def start(self):
+        if self.__libc is not None:
+            try:
+                self.__start_inotify()
+                return
+            except OSError as err:
+                logger.warning('inotify is not available ({}), '
+                               'directories will be polled for changes'
+                               .format(err))
+                self.__close_inotify()
+
+        self.__snapshot = self.__scan()
+        self.__poll_task = asyncio.ensure_future(self.__poll())
+
+    def stop(self):
+        self.__close_inotify()
+        if self.__poll_task is not None:
+            self.__poll_task.cancel()
+            self.__poll_task = None
+
+    @asyncio.coroutine
+    def wait(self):
+        """wait for changes
+
+        Returns set of changed files paths or None if changed files
+        can not be determined (inotify events queue is overflowed)
+        """
+        while not (self.__changes or self.__overflow):
+            self.__event.clear()
+            yield from self.__event.wait()
+
+        while True:
+            self.__event.clear()
+            try:
+                yield from asyncio.wait_for(self.__event.wait(),
+                                            self.__debounce)
+            except asyncio.TimeoutError:
+                break
+
+        changes, self.__changes = self.__changes, set()
+        if self.__overflow:
+            self.__overflow = False
+            return None
+        return changes
+
+    def discard(self):
+        """forget all changes made till now"""
+        if self.__fd is not None:
+            self.__read_events()
+        elif self.__snapshot is not None:
+            self.__snapshot = self.__scan()
+        self.__changes = set()
+        self.__overflow = False
+
+    def __add_change(self, path):
+        if self.__filter(path):
+            self.__changes.add(path)
+
+    def __start_inotify(self):
+        fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.__fd = fd
+
+        for path in self.__paths:
+            if os.path.isdir(path):
+                self.__add_watches(path)
+        asyncio.get_event_loop().add_reader(fd, self.__on_events)
+
+    def __close_inotify(self):
+        if self.__fd is None:
+            return
+        asyncio.get_event_loop().remove_reader(self.__fd)
+        os.close(self.__fd)
+        self.__fd = None
+        self.__watches = {}
+
+    def __add_watches(self, root):
+        for cur_path, _, _ in os.walk(root):
+            wd = self.__libc.inotify_add_watch(
+                self.__fd, os.fsencode(cur_path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # removed already
+                raise OSError(err, '{}: {}'.format(os.strerror(err),
+                                                   cur_path))
+            self.__watches[wd] = cur_path
+
+    def __on_events(self):
+        if self.__read_events():
+            self.__event.set()
+
+    def __read_events(self):
+        changed = False
+        while True:
+            try:
+                data = os.read(self.__fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            if not data:
+                return changed
+            changed = self.__parse_events(data) or changed
+
+    def __parse_events(self, data):
+        changes_count = len(self.__changes)
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _, name_len = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = os.fsdecode(data[pos:pos + name_len].rstrip(b'\0'))
+            pos += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                self.__overflow = True
+                continue
+            if mask & IN_IGNORED:
+                self.__watches.pop(wd, None)
+                continue
+            dir_path = self.__watches.get(wd, None)
+            if dir_path is None or mask & IN_DELETE_SELF:
+                continue
+
+            path = os.path.join(dir_path, name)
+            if not mask & IN_ISDIR:
+                self.__add_change(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.__add_watches(path)
+                except OSError as err:
+                    logger.warning('can not watch {}: {}'.format(path, err))
+                    self.__overflow = True
+                # files can be created before directory watch is added
+                for cur_path, _, files in os.walk(path):
+                    for file_name in files:
+                        self.__add_change(os.path.join(cur_path, file_name))
+            elif mask & IN_MOVED_FROM:
+                # files of moved out directory are unknown
+                self.__overflow = True
+
+        return self.__overflow or len(self.__changes) != changes_count
+
+    def __scan(self):
+        snapshot = {}
+        dirs = list(self.__paths)
+        while dirs:
+            try:
+                entries = list(os.scandir(dirs.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif self.__filter(entry.path):
+                        snapshot[entry.path] = entry.stat().st_mtime
+                except OSError:
+                    continue
+        return snapshot
+
+    @asyncio.coroutine
+    def __poll(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            yield from asyncio.sleep(self.__poll_interval)
+            snapshot = yield from loop.run_in_executor(None, self.__scan)
+            old_snapshot = self.__snapshot
+            for path, mtime in snapshot.items():
+                if old_snapshot.get(path, None) != mtime:
+                    self.__changes.add(path)
+            self.__changes.update(old_snapshot.keys() - snapshot.keys())
+            self.__snapshot = snapshot
+            if self.__changes:
+                self.__event.set()
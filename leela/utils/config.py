@@ -35,13 +35,30 @@ class LeelaConfig(object):
         self.__config['leela_proc_count'] = self.__gv(config,
                                                       'leela_proc_count',
                                                       -1, int)
+        # several workers are started behind nginx by default,
+        # nginx_proxy: false enables pre-fork mode (shared socket)
         def_proxy = self.__config['leela_proc_count'] != 1
         self.__config['is_nginx_proxy'] = self.__gv(config, 'nginx_proxy',
                                                     def_proxy)
+        self.__config['reuse_port'] = self.__gv(config, 'reuse_port',
+                                                False, bool)
+        # nginx compresses responses if it is used
+        self.__config['compression'] = self.__gv(
+            config, 'compression', not self.__config['is_nginx_proxy'], bool)
+        self.__config['compression_min_size'] = self.__gv(
+            config, 'compression_min_size', 500, int)
+        # pools for API methods with executor parameter
+        self.__config['thread_pool_size'] = self.__gv(
+            config, 'thread_pool_size', None, int)
+        self.__config['process_pool_size'] = self.__gv(
+            config, 'process_pool_size', None, int)
         self.__config['need_daemonize'] = self.__gv(config, 'daemonize',
                                                     True, bool)
         def_user = os.environ.get('SUDO_USER', 'leela')
         self.__config['username'] = self.__gv(config, 'username', def_user)
+        self.__config['json_codec'] = self.__gv(config, 'json_codec', 'json')
+        self.__config['metrics_port'] = self.__gv(config, 'metrics_port',
+                                                  None, int)
         logger_config = self.__gv(config, 'logger_config', 'logger.yaml')
         self.__config['logger_config_path'] = os.path.join(self.__project_path,
                                                            'config',
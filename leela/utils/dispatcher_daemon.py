@@ -5,16 +5,22 @@ import json
 import yaml
 import time
 import signal
+import socket
 import logging
 import logging.config
 import multiprocessing
 import asyncio.subprocess
 import tempfile
 import copy
+import functools
+import shutil
+from collections import deque
 
 import leela
 from .logger import logger
 from .daemon3x import daemon as Daemon
+from .change_monitor import ChangeMonitor
+from leela.core import metrics
 
 
 RC_OK = 0
@@ -22,6 +28,13 @@ RC_ERR = 1
 RC_NEEDRELOAD = 2
 RC_NEEDREBUILD = 3
 
+# max time for new worker to start listening its socket
+WORKER_START_TIMEOUT = 30
+# time for finishing proxied requests by old worker after nginx reload
+WORKER_DRAIN_TIME = 5
+# backlog of TCP socket shared by workers
+LISTEN_BACKLOG = 1024
+
 NGINX_CFG_TMPL = '''
 worker_processes 1;
 daemon off;
@@ -46,6 +59,7 @@ http {
                       application/atom+xml;
 
     upstream app_servers {
+        least_conn;
         %(app_servers)s
     }
 
@@ -155,25 +169,54 @@ def _check_root(config):
 
 
 class ServiceMgmt:
-    def __init__(self, username=None, outstream=None):
+    def __init__(self, username=None, outstream=None, restart_delay=1,
+                 max_restart_delay=60, crash_loop_count=5,
+                 crash_loop_period=60):
         self.__proc = None
         self.__out = None
         self.__stopped = True
         self.__args = None
         self.__env = None
         self.__input_s = None
+        self.__need_stdout = False
+        self.__pass_fds = ()
+        self.__notify_ready = False
+        self.__ready_fd = None
         self.__username = username
+        self.__started_at = None
+        self.__restart_delay = restart_delay
+        self.__max_restart_delay = max_restart_delay
+        self.__crash_loop_count = crash_loop_count
+        self.__crash_loop_period = crash_loop_period
 
     def __repr__(self):
         return str(self.__args)
 
+    def is_running(self):
+        return self.__proc is not None and self.__proc.returncode is None
+
+    def send_signal(self, sig):
+        if self.is_running():
+            self.__proc.send_signal(sig)
+
     @asyncio.coroutine
-    def start(self, *args, env=None, input_s=None, need_stdout=False):
+    def start(self, *args, env=None, input_s=None, need_stdout=False,
+              pass_fds=(), notify_ready=False):
+        """start process
+
+        pass_fds - file descriptors inherited by process
+        notify_ready - process should write to file descriptor from
+                       LEELA_READY_FD environment variable when it is ready
+                       (see wait_ready() method)
+        """
         if env is None:
             env = {}
         self.__args = args
         self.__env = env
         self.__input_s = input_s
+        self.__need_stdout = need_stdout
+        self.__pass_fds = pass_fds
+        self.__notify_ready = notify_ready
         if self.__username:
             args = ['su', self.__username, '-s'] + list(args)
             stderr = asyncio.subprocess.PIPE
@@ -184,23 +227,50 @@ class ServiceMgmt:
             self.__out = None
             stderr = self.__out
 
-        self.__proc = yield from \
-            asyncio.create_subprocess_exec(*args,
-                                           stdout=self.__out,
-                                           stderr=stderr,
-                                           stdin=asyncio.subprocess.PIPE,
-                                           env=env)
+        ready_w = None
+        if notify_ready:
+            self.__close_ready_fd()
+            self.__ready_fd, ready_w = os.pipe()
+            os.set_blocking(self.__ready_fd, False)
+            env = dict(env, LEELA_READY_FD=str(ready_w))
+            pass_fds = tuple(pass_fds) + (ready_w,)
+
+        try:
+            self.__proc = yield from \
+                asyncio.create_subprocess_exec(*args,
+                                               stdout=self.__out,
+                                               stderr=stderr,
+                                               stdin=asyncio.subprocess.PIPE,
+                                               env=env,
+                                               pass_fds=pass_fds)
+        finally:
+            if ready_w is not None:
+                os.close(ready_w)
         self.__stopped = False
+        self.__started_at = time.time()
         if input_s:
             self.__proc.stdin.write(input_s.encode() + b'\n')
         self.__proc.stdin.close()
 
     @asyncio.coroutine
     def check_run(self):
+        """watch process and restart it on unexpected termination
+
+        Restarts are delayed with exponential backoff. If process crashes
+        crash_loop_count times during crash_loop_period seconds,
+        it is not restarted anymore (crash loop).
+        Returns False if process is given up in crash loop
+        """
+        delay = self.__restart_delay
+        crashes = deque()
         while True:
+            if self.__proc is None:
+                return True
             ret = yield from self.__proc.wait()
-            yield from asyncio.sleep(1)
-            if not self.__stopped:
+            if self.__stopped:
+                return True
+
+            if self.__proc.stderr is not None:
                 try:
                     err_msg = yield from self.__proc.stderr.read()
                     logger.error('child stderr: {}'.format(err_msg[-1000:]))
@@ -208,98 +278,382 @@ class ServiceMgmt:
                     logger.error('check_run() -> stderr.read() failed: {}'
                                  .format(err))
 
-                logger.error('Unexpected process "{}" termination.'
-                             ' Try to reload...'.format(' '.join(self.__args)))
+            now = time.time()
+            if now - self.__started_at > self.__max_restart_delay:
+                # process was working well for a while
+                delay = self.__restart_delay
+
+            crashes.append(now)
+            while crashes[0] < now - self.__crash_loop_period:
+                crashes.popleft()
+            if len(crashes) >= self.__crash_loop_count:
+                logger.error('Process "{}" crashed {} times in {} seconds. '
+                             'It will not be restarted anymore.'
+                             .format(' '.join(self.__args), len(crashes),
+                                     self.__crash_loop_period))
+                self.__stopped = True
+                return False
+
+            logger.error('Unexpected process "{}" termination (retcode={}).'
+                         ' Try to reload in {} seconds...'
+                         .format(' '.join(self.__args), ret, delay))
+            yield from asyncio.sleep(delay)
+            delay = min(delay * 2, self.__max_restart_delay)
+            if self.__stopped:
+                return True
+
+            yield from self.start(*self.__args, env=self.__env,
+                                  input_s=self.__input_s,
+                                  need_stdout=self.__need_stdout,
+                                  pass_fds=self.__pass_fds,
+                                  notify_ready=self.__notify_ready)
+
+    def __close_ready_fd(self):
+        if self.__ready_fd is not None:
+            os.close(self.__ready_fd)
+            self.__ready_fd = None
 
-                yield from self.start(*self.__args, env=self.__env,
-                                      input_s=self.__input_s)
-            else:
-                return
+    @asyncio.coroutine
+    def wait_ready(self, timeout=WORKER_START_TIMEOUT):
+        """wait readiness notification from process started
+        with notify_ready=True
+        """
+        end_time = time.time() + timeout
+        try:
+            while time.time() < end_time:
+                try:
+                    # empty data means that process closed pipe
+                    # without notification (or exited)
+                    return bool(os.read(self.__ready_fd, 1))
+                except BlockingIOError:
+                    yield from asyncio.sleep(0.1)
+            return False
+        finally:
+            self.__close_ready_fd()
 
     @asyncio.coroutine
-    def stop(self):
+    def stop(self, timeout=30):
         self.__stopped = True
-        if self.__proc is None:
+        proc = self.__proc
+        if proc is None:
             return
 
-        self.__proc.send_signal(signal.SIGINT)
-        for _ in range(30):
-            if self.__proc.returncode is None:
-                break
-            try:
-                ret = yield from asyncio.wait_for(self.__proc.communicate(), 1)
-                break
-            except asyncio.TimeoutError:
-                pass
-
+        try:
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGINT)
+                yield from asyncio.wait_for(proc.communicate(), timeout)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            logger.error('Process "{}" is not stopped in {} seconds. '
+                         'Killing it...'.format(' '.join(self.__args),
+                                                timeout))
+            proc.kill()
+
+        self.__close_ready_fd()
         self.__proc = None
 
 
-def _run_leela_processes(loop, bin_dir, home_path, proj_name, config):
-    leela_processes = []
-    bind_sockets = []
-    env = copy.copy(os.environ)
-    env['PYTHONPATH']= os.path.abspath(os.path.dirname(leela.__file__))\
-        .rstrip('leela')
+def _make_listen_socket(config):
+    """bind TCP socket that is shared by all leela workers"""
+    family = socket.AF_INET6 if ':' in config.bind_address \
+        else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if config.reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.bind((config.bind_address, config.bind_port))
+    except OSError as err:
+        sock.close()
+        raise RuntimeError('Can not bind {}:{}: {}'
+                           .format(config.bind_address, config.bind_port,
+                                   err))
+    sock.listen(LISTEN_BACKLOG)
+    return sock
+
+
+@asyncio.coroutine
+def _wait_worker_ready(s_mgmt, bind_addr, timeout=WORKER_START_TIMEOUT):
+    """wait while worker starts listening its unix socket"""
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        if not s_mgmt.is_running():
+            return False
+        try:
+            _, writer = yield from asyncio.open_unix_connection(bind_addr)
+            writer.close()
+            return True
+        except OSError:
+            yield from asyncio.sleep(0.1)
+    return False
+
+
+def _aggregate_metrics(metrics_dir):
+    snapshot = metrics.merge_snapshots(metrics.load_snapshots(metrics_dir))
+    return metrics.format_prometheus(snapshot).encode()
+
 
+@asyncio.coroutine
+def _serve_metrics(metrics_dir, reader, writer):
+    """minimal HTTP server of workers requests metrics"""
+    try:
+        while True:
+            line = yield from reader.readline()
+            if not line or line in (b'\r\n', b'\n'):
+                break
+        loop = asyncio.get_event_loop()
+        body = yield from loop.run_in_executor(None, _aggregate_metrics,
+                                               metrics_dir)
+        writer.write('HTTP/1.1 200 OK\r\n'
+                     'Content-Type: {}\r\n'
+                     'Content-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'
+                     .format(metrics.PROMETHEUS_CONTENT_TYPE, len(body))
+                     .encode())
+        writer.write(body)
+        yield from writer.drain()
+    except Exception as err:
+        logger.error('metrics request failed: {}'.format(err))
+    finally:
+        writer.close()
+
+
+class WorkersPool:
+    """leela workers processes (and nginx proxy in front of them if used)
+
+    Workers are supervised by ServiceMgmt.check_run().
+    With nginx proxy every worker listens its own unix socket.
+    Without nginx dispatcher binds TCP socket and all workers
+    accept connections on inherited socket (pre-fork mode).
+
+    If metrics_port is configured, workers dump their requests metrics
+    to common directory and dispatcher serves sum of them on this port.
+    Dumps of stopped workers are kept, so counters are not decreased
+    after workers restart.
+
+    Workers can be restarted without downtime one by one:
+    new worker is started and after it is ready old worker is stopped
+    gracefully. With nginx proxy new worker gets new unix socket and
+    nginx upstream is switched to it by config reload.
+    """
+    def __init__(self, bin_dir, home_path, proj_name, config):
+        self.__bin_dir = bin_dir
+        self.__home_path = home_path
+        self.__proj_name = proj_name
+        self.__config = config
+        self.__workers = []
+        self.__nginx = None
+        self.__listen_sock = None
+        self.__generation = 0
+        self.__given_up = set()
+        self.__failed = None
+        self.__restart_lock = asyncio.Lock()
+        self.__metrics_dir = None
+        self.__metrics_server = None
+
+        self.__env = copy.copy(os.environ)
+        self.__env['PYTHONPATH'] = \
+            os.path.abspath(os.path.dirname(leela.__file__)).rstrip('leela')
+        if config.metrics_port:
+            self.__metrics_dir = os.path.join(
+                tempfile.gettempdir(), 'leela-{}-metrics'.format(proj_name))
+            self.__env['LEELA_METRICS_DIR'] = self.__metrics_dir
+
+    def bind_sockets(self):
+        return [bind_addr for _, bind_addr in self.__workers]
+
+    def processes(self):
+        ret = [s_mgmt for s_mgmt, _ in self.__workers]
+        if self.__nginx:
+            ret.append(self.__nginx)
+        return ret
+
+    def can_restart_gracefully(self):
+        return self.__nginx is not None or self.__listen_sock is not None
 
-    for i in range(config.leela_proc_count):
+    @asyncio.coroutine
+    def start_worker(self, num):
+        config = self.__config
         s_mgmt = ServiceMgmt(config.username)
         is_unixsocket = config.is_nginx_proxy
         lp_is_ssl = config.ssl and not is_unixsocket
-        if not config.is_nginx_proxy:
+        if not is_unixsocket:
             lp_bind_addr = '{}:{}'.format(config.bind_address,
                                           config.bind_port)
         else:
-            tmpdir = tempfile.gettempdir()
-            tmp_file = os.path.join(tmpdir,
-                                    '{}-{}.unixsocket'.format(proj_name, i))
-            lp_bind_addr = tmp_file
-
-        bind_sockets.append(lp_bind_addr)
-
-        params_str = json.dumps(['services', home_path,
-                                 {'middlewares': config.middlewares},
+            # every started worker gets new socket,
+            # so old one can serve requests while new one is starting
+            self.__generation += 1
+            lp_bind_addr = os.path.join(
+                tempfile.gettempdir(),
+                '{}-{}-{}.unixsocket'.format(self.__proj_name, num,
+                                             self.__generation))
+
+        listen_fd = None
+        if self.__listen_sock is not None:
+            listen_fd = self.__listen_sock.fileno()
+
+        params_str = json.dumps(['services', self.__home_path,
+                                 {'middlewares': config.middlewares,
+                                  'json_codec': config.json_codec,
+                                  'compression': config.compression,
+                                  'compression_min_size':
+                                      config.compression_min_size,
+                                  'thread_pool_size': config.thread_pool_size,
+                                  'process_pool_size':
+                                      config.process_pool_size},
                                  config.logger_config_path,
                                  config.services,
                                  lp_is_ssl,
                                  lp_bind_addr, is_unixsocket,
-                                 config.static_path])
+                                 config.static_path,
+                                 listen_fd])
+
+        yield from s_mgmt.start(config.python_exec,
+                                os.path.join(self.__bin_dir, 'leela-worker'),
+                                '{}-{}'.format(self.__proj_name, num),
+                                env=self.__env, input_s=params_str,
+                                need_stdout=not config.need_daemonize,
+                                pass_fds=() if listen_fd is None
+                                else (listen_fd,),
+                                notify_ready=listen_fd is not None)
+        return s_mgmt, lp_bind_addr
+
+    def __make_nginx_config(self):
+        config = self.__config
+        if not config.static_path:
+            config.static_path = os.path.abspath(
+                os.path.join(self.__home_path, 'www'))
+
+        return _make_nginx_config(config.username, self.__proj_name,
+                                  self.bind_sockets(), config.bind_port,
+                                  config.static_path, config.ssl_cert,
+                                  config.ssl_key, config.ssl_only)
 
-        cor = s_mgmt.start(config.python_exec,
-                           os.path.join(bin_dir, 'leela-worker'),
-                           '{}-{}'.format(proj_name, i),
-                           env=env, input_s=params_str,
-                           need_stdout = not config.need_daemonize)
-
-        loop.run_until_complete(cor)
-        leela_processes.append(s_mgmt)
-
-    return leela_processes, bind_sockets
+    @asyncio.coroutine
+    def start(self):
+        if not self.__config.is_nginx_proxy:
+            self.__listen_sock = _make_listen_socket(self.__config)
+
+        if self.__metrics_dir:
+            shutil.rmtree(self.__metrics_dir, ignore_errors=True)
+            os.makedirs(self.__metrics_dir)
+            if self.__config.username:
+                shutil.chown(self.__metrics_dir, user=self.__config.username)
+            self.__metrics_server = yield from asyncio.start_server(
+                functools.partial(_serve_metrics, self.__metrics_dir),
+                self.__config.bind_address, self.__config.metrics_port)
+
+        for num in range(self.__config.leela_proc_count):
+            worker = yield from self.start_worker(num)
+            self.__workers.append(worker)
+
+        if self.__config.is_nginx_proxy:
+            cnf_file = self.__make_nginx_config()
+            self.__nginx = ServiceMgmt()
+            yield from self.__nginx.start(self.__config.nginx_exec,
+                                          '-c', cnf_file)
+
+    def supervise(self):
+        """start processes supervising
+
+        Returns future that is resolved when workers are dead
+        and can not be restarted anymore
+        """
+        self.__failed = asyncio.Future()
+        for num, (s_mgmt, _) in enumerate(self.__workers):
+            self.__watch(num, s_mgmt)
+        if self.__nginx:
+            self.__watch(None, self.__nginx)
+        return self.__failed
+
+    def __watch(self, num, s_mgmt):
+        task = asyncio.ensure_future(s_mgmt.check_run())
+        task.add_done_callback(functools.partial(self.__on_check_done,
+                                                 num, s_mgmt))
+
+    def __on_check_done(self, num, s_mgmt, task):
+        if task.cancelled() or self.__failed.done():
+            return
+        if task.exception() is not None:
+            logger.error('process {} supervising failed: {}'
+                         .format(s_mgmt, task.exception()))
+        elif task.result():
+            return  # process is stopped normally
+
+        if num is None:
+            self.__failed.set_result('nginx process is dead')
+            return
 
+        if self.__workers[num][0] is not s_mgmt:
+            return  # worker was already replaced
+        self.__given_up.add(num)
+        if len(self.__given_up) == len(self.__workers):
+            self.__failed.set_result('all leela workers are dead')
 
-def _run_nginx(loop, home_path, proj_name, config,
-               leela_processes,  bind_sockets):
+    @asyncio.coroutine
+    def restart_worker(self, num):
+        old_mgmt, old_addr = self.__workers[num]
 
-    if not config.static_path:
-        config.static_path = os.path.abspath(os.path.join(home_path, 'www'))
+        s_mgmt, bind_addr = yield from self.start_worker(num)
+        if self.__nginx:
+            ready = yield from _wait_worker_ready(s_mgmt, bind_addr)
+        else:
+            ready = yield from s_mgmt.wait_ready()
+        if not ready:
+            logger.error('New leela worker #{} is not started. '
+                         'Old worker is kept running.'.format(num))
+            yield from s_mgmt.stop()
+            return False
+
+        self.__workers[num] = (s_mgmt, bind_addr)
+        self.__given_up.discard(num)
+        if self.__failed is not None:
+            self.__watch(num, s_mgmt)
+
+        if self.__nginx:
+            self.__make_nginx_config()
+            self.__nginx.send_signal(signal.SIGHUP)
+            # let nginx workers with old upstream finish their requests
+            yield from asyncio.sleep(WORKER_DRAIN_TIME)
+        yield from old_mgmt.stop()
+        return True
 
-    if config.is_nginx_proxy:
-        cnf_file = _make_nginx_config(config.username, proj_name,
-                                      bind_sockets, config.bind_port,
-                                      config.static_path, config.ssl_cert,
-                                      config.ssl_key,
-                                      config.ssl_only)
-        nginx_mgmt = ServiceMgmt()
-        cor = nginx_mgmt.start(config.nginx_exec, '-c', cnf_file)
-        loop.run_until_complete(cor)
-        leela_processes.append(nginx_mgmt)
+    @asyncio.coroutine
+    def rolling_restart(self, nums=None):
+        """restart workers one by one"""
+        if nums is None:
+            nums = range(len(self.__workers))
+
+        yield from self.__restart_lock.acquire()
+        try:
+            logger.info('restarting leela workers...')
+            for num in nums:
+                yield from self.restart_worker(num)
+            logger.info('leela workers are restarted')
+        finally:
+            self.__restart_lock.release()
+
+    def stop(self, loop):
+        _stop_processes(loop, self.processes())
+        if self.__listen_sock is not None:
+            self.__listen_sock.close()
+            self.__listen_sock = None
+        if self.__metrics_server is not None:
+            self.__metrics_server.close()
+            loop.run_until_complete(self.__metrics_server.wait_closed())
+            self.__metrics_server = None
+        if self.__metrics_dir:
+            shutil.rmtree(self.__metrics_dir, ignore_errors=True)
 
 
 def _stop_processes(loop, leela_processes):
     cors = []
     for proc in leela_processes:
-        cors.append(proc.stop())
+        cors.append(asyncio.ensure_future(proc.stop()))
+    if not cors:
+        return
 
     try:
         done, pending = loop.run_until_complete(
@@ -313,30 +667,98 @@ def _stop_processes(loop, leela_processes):
         logger.error('proc.stop() faied: {}'.format(err))
 
 
+def _change_type(path, services_path, www_path):
+    """returns RC_NEEDRELOAD if leela workers should be restarted
+    because of changed file, RC_NEEDREBUILD if front-end should be rebuilt
+    and None if file change does not matter
+    """
+    if path.startswith(services_path + os.sep):
+        return RC_NEEDRELOAD if path.endswith('.py') else None
+    if path.startswith(www_path + os.sep):
+        return None if path.endswith('.html') else RC_NEEDREBUILD
+    return None
+
+
+@asyncio.coroutine
+def _rebuild_static(home_path):
+    logger.info('rebuilding front-end...')
+    try:
+        proc = yield from asyncio.create_subprocess_exec('gulp',
+                                                         cwd=home_path)
+        retcode = yield from proc.wait()
+    except OSError as err:
+        logger.error('<gulp> does not started: {}'.format(err))
+        return False
+    if retcode:
+        logger.error('<gulp> failed with exit code {}'.format(retcode))
+        return False
+    return True
+
+
 @asyncio.coroutine
-def _check_changes(pypath, wwwpath):
-    cur_time = time.time()
-    print('cur time: ', cur_time)
-    while True:
-        for cur_path, _, files in os.walk(pypath):
-            for file_name in files:
-                f_path = os.path.join(cur_path, file_name)
-                if not f_path.endswith('.py'):
-                    continue
-                if os.path.getmtime(f_path) > cur_time:
-                    print('detected changed file at {}...'.format(f_path))
-                    return RC_NEEDRELOAD
-
-        for cur_path, _, files in os.walk(wwwpath):
-            for file_name in files:
-                f_path = os.path.join(cur_path, file_name)
-                if f_path.endswith('.html'):
-                    continue
-                if os.path.getmtime(f_path) > cur_time:
-                    print('detected changed file at {}...'.format(f_path))
-                    return RC_NEEDREBUILD
-
-        yield from asyncio.sleep(1)
+def _dispatch(pool, config, home_path, restart_event):
+    failed = pool.supervise()
+    changes_task = restart_task = monitor = None
+    if config.monitor_changes:
+        services_path = os.path.abspath(os.path.join(home_path, 'services'))
+        www_path = os.path.abspath(os.path.join(home_path, 'www'))
+        change_type = functools.partial(_change_type,
+                                        services_path=services_path,
+                                        www_path=www_path)
+        monitor = ChangeMonitor([services_path, www_path],
+                                lambda path: change_type(path) is not None)
+        monitor.start()
+    try:
+        while True:
+            if monitor and changes_task is None:
+                changes_task = asyncio.ensure_future(monitor.wait())
+            if restart_task is None:
+                restart_task = asyncio.ensure_future(restart_event.wait())
+
+            waits = [failed, restart_task]
+            if changes_task:
+                waits.append(changes_task)
+            yield from asyncio.wait(waits,
+                                    return_when=asyncio.FIRST_COMPLETED)
+
+            if failed.done():
+                logger.error('leela dispatcher failed: {}'
+                             .format(failed.result()))
+                return RC_ERR
+
+            if changes_task and changes_task.done():
+                changes = changes_task.result()
+                changes_task = None
+                if changes is None:
+                    logger.info('detected unknown changes in project')
+                    retcodes = {RC_NEEDRELOAD, RC_NEEDREBUILD}
+                else:
+                    logger.info('detected {} changed file(s)'
+                                .format(len(changes)))
+                    for path in changes:
+                        logger.debug('changed file: {}'.format(path))
+                    retcodes = set(map(change_type, changes))
+
+                if RC_NEEDREBUILD in retcodes:
+                    # static files are served from disk,
+                    # so workers are not restarted after rebuild
+                    yield from _rebuild_static(home_path)
+                    monitor.discard()
+                if RC_NEEDRELOAD in retcodes:
+                    if not pool.can_restart_gracefully():
+                        return RC_NEEDRELOAD
+                    yield from pool.rolling_restart()
+
+            if restart_task.done():
+                restart_event.clear()
+                restart_task = None
+                yield from pool.rolling_restart()
+    finally:
+        for task in (changes_task, restart_task):
+            if task:
+                task.cancel()
+        if monitor:
+            monitor.stop()
 
 
 def start(bin_dir, home_path, config, *, loop):
@@ -349,8 +771,6 @@ def start(bin_dir, home_path, config, *, loop):
 
     if config.leela_proc_count <= 0:
         config.leela_proc_count = multiprocessing.cpu_count()
-    if config.leela_proc_count > 1:
-        config.is_nginx_proxy = True
 
     if config.is_nginx_proxy:
         _check_root(config)
@@ -362,43 +782,29 @@ def start(bin_dir, home_path, config, *, loop):
         daemon = Daemon('/tmp/leela-{}.pid'.format(proj_name))
         daemon.start()
 
-    leela_processes = []
-    bind_sockets = []
+    pool = WorkersPool(bin_dir, home_path, proj_name, config)
     try:
-        leela_processes, bind_sockets = _run_leela_processes(loop, bin_dir,
-                                                             home_path,
-                                                             proj_name,
-                                                             config)
-
-        _run_nginx(loop, home_path, proj_name, config,
-                   leela_processes,  bind_sockets)
-
+        loop.run_until_complete(pool.start())
     except BaseException as err:
         logger.error('leela daemon failed: {}'.format(err))
-        _stop_processes(loop, leela_processes)
+        pool.stop(loop)
         return
 
     logger.info('started leela dispatcher')
+    restart_event = asyncio.Event()
+    loop.add_signal_handler(signal.SIGHUP, restart_event.set)
     retcode = RC_ERR
     try:
-        if config.monitor_changes:
-            cor = _check_changes(os.path.join(home_path, 'services'),
-                                 os.path.join(home_path, 'www'))
-            retcode = loop.run_until_complete(cor)
-        else:
-            tasks = []
-            for proc in leela_processes:
-                tasks.append(asyncio.async(proc.check_run()))
-
-
-            for task in tasks:
-                loop.run_until_complete(task)
+        retcode = loop.run_until_complete(
+            _dispatch(pool, config, home_path, restart_event))
     except KeyboardInterrupt:
         retcode = RC_OK
+    finally:
+        loop.remove_signal_handler(signal.SIGHUP)
 
     logger.info('stopping leela dispatcher...')
     try:
-        _stop_processes(loop, leela_processes)
+        pool.stop(loop)
     except Exception as err:
         logger.error('leela processes does not stopped: %s', err)
     finally:
@@ -408,6 +814,23 @@ def start(bin_dir, home_path, config, *, loop):
     return retcode
 
 
+def _read_pid(home_path):
+    proj_name = os.path.basename(home_path.rstrip('/'))
+    try:
+        with open('/tmp/leela-{}.pid'.format(proj_name)) as pid_file:
+            return int(pid_file.read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def reload(home_path):
+    """restart leela workers of running dispatcher one by one"""
+    pid = _read_pid(home_path)
+    if pid is None:
+        raise RuntimeError('Leela daemon is not running')
+    os.kill(pid, signal.SIGHUP)
+
+
 def stop(home_path):
     proj_name = os.path.basename(home_path.rstrip('/'))
     daemon = Daemon('/tmp/leela-{}.pid'.format(proj_name))
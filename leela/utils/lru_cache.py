@@ -0,0 +1,46 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Bounded LRU cache with optional items TTL (in seconds)"""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__items = OrderedDict()
+
+    def __len__(self):
+        return len(self.__items)
+
+    def get(self, key, default=None):
+        item = self.__items.get(key, None)
+        if item is None:
+            return default
+
+        value, expire_time = item
+        if expire_time is not None and expire_time < time.monotonic():
+            del self.__items[key]
+            return default
+
+        self.__items.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.__ttl
+        expire_time = None if ttl is None else time.monotonic() + ttl
+
+        self.__items[key] = (value, expire_time)
+        self.__items.move_to_end(key)
+        if len(self.__items) > self.__max_size:
+            self.__items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self.__items.pop(key, None)
+        if item is None:
+            return default
+        return item[0]
+
+    def clear(self):
+        self.__items.clear()
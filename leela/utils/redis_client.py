@@ -0,0 +1,140 @@
+import asyncio
+from collections import deque
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisClient(object):
+    """Minimal asyncio client for Redis protocol (RESP)
+
+    Commands are pipelined over single connection:
+    replies are matched with requests in order.
+    Connection is (re)established on demand.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None):
+        self.__host = host
+        self.__port = port
+        self.__db = db
+        self.__password = password
+        self.__reader = None
+        self.__writer = None
+        self.__reader_task = None
+        self.__waiters = deque()
+        self.__conn_lock = asyncio.Lock()
+
+    def is_connected(self):
+        return self.__writer is not None
+
+    @asyncio.coroutine
+    def connect(self):
+        yield from self.__conn_lock.acquire()
+        try:
+            if self.__writer is not None:
+                return
+
+            self.__reader, self.__writer = yield from asyncio.open_connection(
+                self.__host, self.__port)
+            self.__reader_task = asyncio.ensure_future(self.__read_replies())
+
+            if self.__password:
+                yield from self.__execute('AUTH', self.__password)
+            if self.__db:
+                yield from self.__execute('SELECT', self.__db)
+        finally:
+            self.__conn_lock.release()
+
+    @asyncio.coroutine
+    def close(self):
+        if self.__writer is None:
+            return
+        self.__writer.close()
+        self.__writer = None
+        if self.__reader_task:
+            self.__reader_task.cancel()
+            self.__reader_task = None
+        self.__fail_waiters(ConnectionError('Redis connection closed'))
+
+    @asyncio.coroutine
+    def execute(self, *args):
+        if self.__writer is None:
+            yield from self.connect()
+        return (yield from self.__execute(*args))
+
+    @asyncio.coroutine
+    def __execute(self, *args):
+        waiter = asyncio.Future()
+        self.__waiters.append(waiter)
+        self.__writer.write(self.__encode(args))
+        return (yield from waiter)
+
+    def __encode(self, args):
+        ret = [b'*', str(len(args)).encode(), b'\r\n']
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif not isinstance(arg, (bytes, bytearray)):
+                arg = str(arg).encode()
+            ret += [b'$', str(len(arg)).encode(), b'\r\n', arg, b'\r\n']
+        return b''.join(ret)
+
+    def __fail_waiters(self, err):
+        while self.__waiters:
+            waiter = self.__waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(err)
+
+    @asyncio.coroutine
+    def __read_replies(self):
+        try:
+            while True:
+                reply = yield from self.__read_reply()
+                waiter = self.__waiters.popleft()
+                if waiter.done():
+                    continue
+                if isinstance(reply, RedisError):
+                    waiter.set_exception(reply)
+                else:
+                    waiter.set_result(reply)
+        except asyncio.CancelledError:
+            pass
+        except Exception as err:
+            if self.__writer is not None:
+                self.__writer.close()
+            self.__writer = None
+            self.__reader_task = None
+            self.__fail_waiters(ConnectionError(
+                'Redis connection lost: {}'.format(err)))
+
+    @asyncio.coroutine
+    def __read_reply(self):
+        line = yield from self.__reader.readline()
+        if not line:
+            raise ConnectionError('connection closed by server')
+
+        prefix, line = line[:1], line[1:-2]
+        if prefix == b'+':
+            return line.decode()
+        if prefix == b'-':
+            return RedisError(line.decode())
+        if prefix == b':':
+            return int(line)
+        if prefix == b'$':
+            length = int(line)
+            if length < 0:
+                return None
+            data = yield from self.__reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            length = int(line)
+            if length < 0:
+                return None
+            ret = []
+            for _ in range(length):
+                item = yield from self.__read_reply()
+                ret.append(item)
+            return ret
+
+        raise RedisError('Unexpected reply: {}'.format(prefix + line))
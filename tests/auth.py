@@ -9,6 +9,11 @@ import os
 sys.path.insert(0, os.path.abspath('.'))
 
 from leela.core import *
+from leela.core import passwords
+from leela.core import session_codec
+from leela.services.auth import (need_auth, authorization, BaseUser,
+                                 UserRef, SESSION_USER_KEY, users_service)
+from tests.services import B
 
 loop = asyncio.get_event_loop()
 app = Application()
@@ -72,6 +77,8 @@ class TestAuthAPI(unittest.TestCase):
         cookies = r.cookies
         print('COOKIES 1:', r.cookies)
         yield from r.release()
+        # old sha1 digest is updated on login
+        self.assertTrue(B.DIGESTS['kst'].startswith('pbkdf2$'))
 
         r = yield from aiohttp.get('http://0.0.0.0:6666/api/secret')
         self.assertEqual(r.status, 401)
@@ -85,6 +92,12 @@ class TestAuthAPI(unittest.TestCase):
         self.assertEqual(int(count), 1)
 
 
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/whoami',
+                                   cookies=cookies)
+        self.assertEqual(r.status, 200, r.reason)
+        data = yield from r.json()
+        self.assertEqual(data, {'username': 'kst', 'roles': ['testrole']})
+
         r = yield from aiohttp.get('http://0.0.0.0:6666/api/top_secret',
                                    cookies=cookies)
         self.assertEqual(r.status, 200, r.reason)
@@ -118,6 +131,130 @@ class TestAuthAPI(unittest.TestCase):
         self.assertEqual(int(count), 1)
 
 
+    @async_test
+    def test_revoked_roles(self):
+        r = yield from aiohttp.post(
+            'http://0.0.0.0:6666/api/__auth__',
+            data=json.dumps({'username': 'kst', 'password': '123'}))
+        self.assertEqual(r.status, 200, r.reason)
+        yield from r.release()
+        cookies = r.cookies
+
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/top_secret',
+                                   cookies=cookies)
+        self.assertEqual(r.status, 200, r.reason)
+        yield from r.release()
+
+        # roles are changed, session reference is not updated yet
+        B.ROLES['kst'] = ['otherrole']
+        users_service().invalidate_user('kst')
+        try:
+            r = yield from aiohttp.get(
+                'http://0.0.0.0:6666/api/top_secret', cookies=cookies)
+            self.assertEqual(r.status, 401, r.reason)
+            yield from r.release()
+
+            r = yield from aiohttp.get('http://0.0.0.0:6666/api/whoami',
+                                       cookies=cookies)
+            data = yield from r.json()
+            self.assertEqual(data, {'username': 'kst',
+                                    'roles': ['otherrole']})
+        finally:
+            del B.ROLES['kst']
+            users_service().invalidate_user('kst')
+
+    def test_pipeline(self):
+        session_mw, auth_mw = mw_list
+        self.assertTrue(session_mw.need_on_request({}))
+        self.assertTrue(session_mw.need_on_response({}))
+        self.assertFalse(session_mw.need_on_preflight({}))
+        self.assertFalse(auth_mw.need_on_request({}))
+        self.assertTrue(auth_mw.need_on_request({'auth': need_auth}))
+        self.assertFalse(auth_mw.need_on_response({'auth': need_auth}))
+        self.assertFalse(auth_mw.need_on_preflight({'auth': need_auth}))
+
+
+class TestUserRef(unittest.TestCase):
+    def test_roles(self):
+        user = BaseUser('kst', 'digest', ['b', 'a'])
+        ref = UserRef.from_user(user)
+        self.assertEqual((ref.username, ref.roles, ref.version),
+                         ('kst', ('a', 'b'), 0))
+        ret = session_codec.loads(session_codec.dumps(
+            {SESSION_USER_KEY: ref}))
+        self.assertEqual(ret[SESSION_USER_KEY], ref)
+        self.assertEqual(ret[SESSION_USER_KEY].roles_mask, ref.roles_mask)
+
+        self.assertTrue(need_auth.allows(ref))
+        self.assertTrue(authorization('a', 'c').allows(ref))
+        self.assertTrue(authorization('b').allows(user))
+        self.assertFalse(authorization('c').allows(ref))
+        self.assertFalse(authorization('c').allows(user))
+        self.assertFalse(authorization('a').allows(UserRef('kst', [])))
+
+        user.version = 1
+        self.assertNotEqual(UserRef.from_user(user), ref)
+
+
+class TestPasswords(unittest.TestCase):
+    def test_hashers(self):
+        hashers = passwords.PasswordHashers(
+            [passwords.PBKDF2Hasher(1000), passwords.SHA1Hasher()])
+        digest = hashers.encode('123')
+        self.assertTrue(digest.startswith('pbkdf2$1000$'))
+        self.assertNotEqual(digest, hashers.encode('123'))  # salted
+        self.assertTrue(hashers.check('123', digest))
+        self.assertFalse(hashers.check('1234', digest))
+        self.assertFalse(hashers.must_update(digest))
+
+        legacy = '40bd001563085fc35165329ea1ff5c5ecbdbbeef'
+        for old in (legacy, 'sha1$' + legacy):
+            self.assertTrue(hashers.check('123', old))
+            self.assertFalse(hashers.check('12', old))
+            self.assertTrue(hashers.must_update(old))
+        self.assertFalse(hashers.check('123', 'md5$' + legacy))
+        self.assertFalse(hashers.check('123', None))
+
+        other = passwords.PasswordHashers([passwords.PBKDF2Hasher(2000)])
+        self.assertTrue(other.check('123', digest))
+        self.assertTrue(other.must_update(digest))
+        self.assertFalse(other.check('123', legacy))
+
+        # malformed digests are not verified and should be updated
+        for bad in ('pbkdf2$1000$salt', 'pbkdf2$x$c2FsdA$hash',
+                    'pbkdf2$1000$!!!$hash', 'pbkdf2$0$c2FsdA$hash',
+                    'pbkdf2$1000$c2FsdA$hash$extra'):
+            self.assertFalse(hashers.check('123', bad), bad)
+            self.assertTrue(hashers.must_update(bad), bad)
+
+    @async_test
+    def test_verify(self):
+        hashers = passwords.PasswordHashers([passwords.PBKDF2Hasher(1000)],
+                                            max_concurrency=2)
+        digest = yield from hashers.encode_async('123')
+        ret = yield from asyncio.gather(
+            *[hashers.verify(pwd, digest) for pwd in ('123', '321') * 5])
+        self.assertEqual(ret, [True, False] * 5)
+
+        user = BaseUser('kst', digest, ['testrole'])
+        self.assertTrue((yield from user.verify_password('123')))
+        self.assertFalse((yield from user.verify_password('')))
+
+    def test_scrypt(self):
+        try:
+            hasher = passwords.ScryptHasher(n=2 ** 8)
+        except RuntimeError:
+            self.skipTest('scrypt is not supported')
+        hashers = passwords.PasswordHashers([hasher])
+        digest = hashers.encode('123')
+        self.assertTrue(digest.startswith('scrypt$256$8$1$'))
+        self.assertTrue(hashers.check('123', digest))
+        self.assertFalse(hashers.check('12', digest))
+        for bad in ('scrypt$256$8$1$c2FsdA', 'scrypt$x$8$1$c2FsdA$hash',
+                    'scrypt$255$8$1$c2FsdA$hash'):
+            self.assertFalse(hashers.check('123', bad), bad)
+            self.assertTrue(hashers.must_update(bad), bad)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,6 +3,7 @@ import aiohttp
 import asyncio
 import unittest
 import json
+import time
 import sys
 import os
 
@@ -93,6 +94,79 @@ class TestBasicAPI(unittest.TestCase):
         self.assertEqual(len(data), 3)
         self.assertEqual(data, ['test sting', 22, 4444])
 
+    @async_test
+    def test_stream(self):
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/stream')
+        self.assertEqual(r.status, 200)
+        data = yield from r.json()
+        self.assertEqual(data, [{'num': 0}, {'num': 1}, {'num': 2}])
+
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/stream',
+                                   params={'count': 0})
+        self.assertEqual(r.status, 200)
+        data = yield from r.json()
+        self.assertEqual(data, [])
+
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/stream',
+                                   params={'count': 10000})
+        data = yield from r.json()
+        self.assertEqual(len(data), 10000)
+        self.assertEqual(data[-1], {'num': 9999})
+
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/stream',
+                                   headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(r.status, 200)
+        self.assertEqual(r.headers['CONTENT-TYPE'], 'application/x-ndjson')
+        data = yield from r.text()
+        self.assertEqual([json.loads(l) for l in data.splitlines()],
+                         [{'num': 0}, {'num': 1}, {'num': 2}])
+
+    @async_test
+    def test_single_flight(self):
+        @asyncio.coroutine
+        def get_shared(params=None):
+            r = yield from aiohttp.get('http://0.0.0.0:6666/api/shared',
+                                       params=params)
+            self.assertEqual(r.status, 200)
+            return (yield from r.json())
+
+        res = yield from asyncio.gather(*[get_shared() for _ in range(20)])
+        self.assertEqual(res, [{'calls': 1}] * 20)
+
+        res = yield from asyncio.gather(get_shared({'a': 1}),
+                                        get_shared({'a': 2}))
+        self.assertEqual(sorted(r['calls'] for r in res), [2, 3])
+
+    @async_test
+    def test_executor(self):
+        @asyncio.coroutine
+        def get(path):
+            r = yield from aiohttp.get('http://0.0.0.0:6666/api/' + path)
+            self.assertEqual(r.status, 200)
+            return (yield from r.json())
+
+        t0 = time.time()
+        res = yield from asyncio.gather(get('blocking'), get('blocking'),
+                                        get('blocking_process?x=1'))
+        # methods do not block event loop and each other
+        self.assertLess(time.time() - t0, 0.4)
+        self.assertEqual(res, [{'service': 2222}, {'service': 2222},
+                               {'service': None, 'x': '1'}])
+
+    @async_test
+    def test_metrics(self):
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/test_path')
+        yield from r.release()
+
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/__metrics__')
+        self.assertEqual(r.status, 200)
+        self.assertTrue(r.headers['CONTENT-TYPE'].startswith('text/plain'))
+        data = yield from r.text()
+        self.assertIn('leela_requests_total{method="GET",'
+                      'route="test_path",status="200"}', data)
+        self.assertIn('leela_request_duration_seconds_count{method="GET",'
+                      'route="test_path",stage="handler"}', data)
+
     @async_test
     def test_fileupload(self):
         with open(__file__, 'rb') as fdesc:
@@ -127,6 +201,57 @@ class TestBasicAPI(unittest.TestCase):
         with open(__file__, 'rb') as rfile:
             self.assertEqual(data[2], hashlib.sha1(rfile.read()).hexdigest())
 
+    @async_test
+    def test_spooled_upload(self):
+        with open(__file__, 'rb') as fdesc:
+            content = fdesc.read()
+        r = yield from aiohttp.post(
+            'http://0.0.0.0:6666/api/spooled_file', data=content)
+        self.assertEqual(r.status, 200)
+        data = yield from r.json()
+        self.assertEqual(data, {'size': len(content), 'saved': len(content),
+                                'sha1': hashlib.sha1(content).hexdigest()})
+
+        r = yield from aiohttp.post(
+            'http://0.0.0.0:6666/api/spooled_file',
+            data=b'0' * (1024 * 1024 + 1))
+        self.assertEqual(r.status, 413)
+        yield from r.release()
+
+    @async_test
+    def test_form_limit(self):
+        @asyncio.coroutine
+        def chunked(data):
+            for pos in range(0, len(data), 256):
+                yield data[pos:pos + 256]
+
+        def form(value):
+            return ('--xyz\r\nContent-Disposition: form-data; name="f"\r\n'
+                    '\r\n{}\r\n--xyz--\r\n'.format(value)).encode()
+
+        headers = {'Content-Type': 'multipart/form-data; boundary=xyz'}
+        url = 'http://0.0.0.0:6666/api/limited_form'
+        r = yield from aiohttp.post(url, data=chunked(form('a' * 100)),
+                                    headers=headers)
+        self.assertEqual(r.status, 200)
+        self.assertEqual((yield from r.json()), {'f': 100})
+
+        # large field of chunked request (without Content-Length)
+        r = yield from aiohttp.post(url, data=chunked(form('a' * 4096)),
+                                    headers=headers)
+        self.assertEqual(r.status, 413)
+        yield from r.release()
+
+        r = yield from aiohttp.post(url, data=chunked(b'f=' + b'a' * 10),
+                                    headers={'Content-Type':
+                                             'application/'
+                                             'x-www-form-urlencoded'})
+        self.assertEqual(r.status, 411)
+        yield from r.release()
+
+        r = yield from aiohttp.post(url, data={'f': 'a' * 10})
+        self.assertEqual((yield from r.json()), {'f': 10})
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,164 @@
+import aiohttp
+import asyncio
+import unittest
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core import *
+from leela.middlewares.cache import ttl
+from leela.core import metrics
+from leela.core.compression import Compressor
+from tests.services import CacheTest
+
+loop = asyncio.get_event_loop()
+app = Application()
+middlewares = [
+    {'endpoint': 'leela.middlewares.session.SessionMiddleware'},
+    {'endpoint': 'leela.middlewares.cache.CacheMiddleware', 'max_size': 16},
+    {'endpoint': 'leela.middlewares.identity_map.IdentityMapMiddleware'},
+    {'endpoint': 'tests.services.EarlyResponseMiddleware'},
+]
+mw_list = []
+for mw in middlewares:
+    mw_list.append(loop.run_until_complete(app.init_middleware(mw)))
+future = app.init_service('tests.services.CacheTest', {}, mw_list)
+loop.run_until_complete(future)
+future = app.init_service('tests.services.IdentityMapCheck', {}, [])
+loop.run_until_complete(future)
+app.handle_static('.')
+srv = app.make_tcp_server('127.0.0.1', 6666)
+
+
+def async_test(f):
+    def wrapper(*args, **kwargs):
+        coro = asyncio.coroutine(f)
+        future = coro(*args, **kwargs)
+        loop.run_until_complete(future)
+    return wrapper
+
+
+@asyncio.coroutine
+def get(path, headers=None):
+    r = yield from aiohttp.get('http://0.0.0.0:6666/api/' + path,
+                               headers=headers)
+    body = yield from r.read()
+    return r, body
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        CacheTest.CALLS = 0
+        mw_list[1].clear()
+
+    @async_test
+    def test_cache(self):
+        r, body = yield from get('stats?a=1')
+        self.assertEqual(r.status, 200)
+        self.assertEqual(json.loads(body.decode())['calls'], 1)
+        etag = r.headers['ETAG']
+
+        r, cached_body = yield from get('stats?a=1')
+        self.assertEqual(cached_body, body)
+        self.assertEqual(r.headers['ETAG'], etag)
+        self.assertEqual(CacheTest.CALLS, 1)
+
+        r, body = yield from get('stats?a=1', {'If-None-Match': etag})
+        self.assertEqual(r.status, 304)
+        self.assertEqual(body, b'')
+
+        r, body = yield from get('stats?a=2')
+        self.assertEqual(json.loads(body.decode())['query'], {'a': '2'})
+        self.assertEqual(CacheTest.CALLS, 2)
+
+    @async_test
+    def test_stampede(self):
+        res = yield from asyncio.gather(*[get('stats') for _ in range(10)])
+        self.assertEqual(CacheTest.CALLS, 1)
+        self.assertEqual(set(body for _, body in res), {res[0][1]})
+
+        # waiting requests are released if handler is failed
+        res = yield from asyncio.gather(*[get('failed') for _ in range(3)])
+        self.assertEqual([r.status for r, _ in res], [404] * 3)
+
+    @async_test
+    def test_compressed(self):
+        leela_api.set_compressor(Compressor(10))
+        try:
+            r, body = yield from get('stats?c=1',
+                                     {'Accept-Encoding': 'identity'})
+            self.assertNotIn('CONTENT-ENCODING', r.headers)
+            etag = r.headers['ETAG']
+
+            for _ in range(2):
+                r, gz_body = yield from get('stats?c=1',
+                                            {'Accept-Encoding': 'gzip'})
+                self.assertEqual(r.headers['CONTENT-ENCODING'], 'gzip')
+                self.assertEqual(r.headers['VARY'], 'Accept-Encoding')
+                self.assertEqual(gz_body, body)  # decompressed by client
+                gz_etag = r.headers['ETAG']
+                self.assertEqual(gz_etag, etag[:-1] + '-gzip"')
+
+            r, _ = yield from get('stats?c=1', {'Accept-Encoding': 'gzip',
+                                                'If-None-Match': gz_etag})
+            self.assertEqual(r.status, 304)
+            r, _ = yield from get('stats?c=1', {'Accept-Encoding': 'identity',
+                                                'If-None-Match': gz_etag})
+            self.assertEqual(r.status, 200)
+            self.assertEqual(CacheTest.CALLS, 1)
+        finally:
+            leela_api.set_compressor(None)
+
+    @async_test
+    def test_disconnected(self):
+        # client is disconnected while response is not cached yet
+        with self.assertRaises(asyncio.TimeoutError):
+            yield from asyncio.wait_for(get('stats?d=1'), 0.03)
+        yield from asyncio.sleep(0.05)
+        r, body = yield from asyncio.wait_for(get('stats?d=1'), 2)
+        self.assertEqual(r.status, 200)
+
+    @async_test
+    def test_early_response(self):
+        # response is returned by middleware after CacheMiddleware
+        res = yield from asyncio.gather(*[get('early') for _ in range(3)])
+        self.assertEqual([body for _, body in res], [b'"early"'] * 3)
+        r, body = yield from asyncio.wait_for(get('early'), 2)
+        self.assertEqual(body, b'"early"')
+        self.assertIn('ETAG', r.headers)
+        self.assertEqual(CacheTest.CALLS, 0)
+
+    @async_test
+    def test_identity_map(self):
+        # keep-alive requests of connection are processed in single task,
+        # identity map is not active after early response
+        session = aiohttp.ClientSession()
+        try:
+            for path in ('early', 'early', 'identity_map'):
+                r = yield from session.get('http://0.0.0.0:6666/api/' + path)
+                body = yield from r.read()
+            self.assertEqual(body, b'false')
+        finally:
+            session.close()
+
+    def test_pipeline(self):
+        cache_mw = mw_list[1]
+        self.assertFalse(cache_mw.need_on_request({}))
+        self.assertTrue(cache_mw.need_on_request({'cache': ttl(1)}))
+        self.assertTrue(cache_mw.need_on_response({'cache': ttl(1)}))
+        self.assertTrue(cache_mw.need_on_failure({'cache': ttl(1)}))
+        self.assertFalse(cache_mw.need_on_preflight({'cache': ttl(1)}))
+
+        # metrics stages of middlewares are named by position and endpoint
+        stages = metrics.registry.route('GET', 'stats').stages
+        self.assertIn('1:leela.middlewares.cache.CacheMiddleware.on_request',
+                      stages)
+        self.assertIn('2:leela.middlewares.identity_map.'
+                      'IdentityMapMiddleware.on_response', stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
+    app.destroy()
@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.utils.change_monitor import ChangeMonitor
+from leela.utils.dispatcher_daemon import (_change_type, RC_NEEDRELOAD,
+                                           RC_NEEDREBUILD)
+
+loop = asyncio.get_event_loop()
+
+def async_test(f):
+    def wrapper(*args, **kwargs):
+        coro = asyncio.coroutine(f)
+        future = coro(*args, **kwargs)
+        loop.run_until_complete(future)
+    return wrapper
+
+
+def write(path, data='test'):
+    with open(path, 'w') as fobj:
+        fobj.write(data)
+
+
+class TestChangeMonitor(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.path, 'sub'))
+        write(os.path.join(self.path, 'sub', 'old.py'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @asyncio.coroutine
+    def check_monitor(self, monitor, is_inotify):
+        monitor.start()
+        try:
+            self.assertEqual(monitor.is_inotify, is_inotify)
+            yield from asyncio.sleep(0.1)
+
+            write(os.path.join(self.path, 'sub', 'old.py'), 'changed')
+            write(os.path.join(self.path, 'new.py'))
+            write(os.path.join(self.path, 'ignored.txt'))
+            os.makedirs(os.path.join(self.path, 'new_dir', 'deep'))
+            write(os.path.join(self.path, 'new_dir', 'deep', 'deep.py'))
+
+            changes = yield from asyncio.wait_for(monitor.wait(), 5)
+            self.assertEqual(changes,
+                             {os.path.join(self.path, 'sub', 'old.py'),
+                              os.path.join(self.path, 'new.py'),
+                              os.path.join(self.path, 'new_dir', 'deep',
+                                           'deep.py')})
+
+            # watching of new directory
+            os.unlink(os.path.join(self.path, 'new_dir', 'deep', 'deep.py'))
+            changes = yield from asyncio.wait_for(monitor.wait(), 5)
+            self.assertEqual(changes, {os.path.join(self.path, 'new_dir',
+                                                    'deep', 'deep.py')})
+
+            # discarded changes are not reported
+            write(os.path.join(self.path, 'new.py'), 'changed')
+            yield from asyncio.sleep(0.1)
+            monitor.discard()
+            with self.assertRaises(asyncio.TimeoutError):
+                yield from asyncio.wait_for(monitor.wait(), 1.5)
+        finally:
+            monitor.stop()
+
+    @async_test
+    def test_inotify(self):
+        monitor = ChangeMonitor([self.path], lambda p: p.endswith('.py'),
+                                debounce=0.1)
+        yield from self.check_monitor(monitor, True)
+
+    @async_test
+    def test_polling(self):
+        monitor = ChangeMonitor([self.path], lambda p: p.endswith('.py'),
+                                debounce=0.1, poll_interval=0.1,
+                                use_inotify=False)
+        yield from self.check_monitor(monitor, False)
+
+    def test_change_type(self):
+        services, www = '/proj/services', '/proj/www'
+        self.assertEqual(_change_type('/proj/services/a/b.py',
+                                      services, www), RC_NEEDRELOAD)
+        self.assertEqual(_change_type('/proj/services/b.pyc',
+                                      services, www), None)
+        self.assertEqual(_change_type('/proj/www/js/app.js',
+                                      services, www), RC_NEEDREBUILD)
+        self.assertEqual(_change_type('/proj/www/index.html',
+                                      services, www), None)
+        self.assertEqual(_change_type('/proj/services_old/a.py',
+                                      services, www), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+import gzip
+import zlib
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from aiohttp import web
+from leela.core import executors, metrics
+from leela.core.compression import (Compressor, parse_accept_encoding,
+                                    EXECUTOR_MIN_SIZE)
+
+loop = asyncio.get_event_loop()
+
+def async_test(f):
+    def wrapper(*args, **kwargs):
+        coro = asyncio.coroutine(f)
+        future = coro(*args, **kwargs)
+        loop.run_until_complete(future)
+    return wrapper
+
+
+class FakeRequest(object):
+    def __init__(self, accept_encoding=None):
+        self.headers = {}
+        if accept_encoding is not None:
+            self.headers['ACCEPT-ENCODING'] = accept_encoding
+
+
+def json_response(size):
+    return web.Response(body=b'[' + b'1,' * (size // 2) + b'1]',
+                        content_type='application/json')
+
+
+class TestCompression(unittest.TestCase):
+    def test_negotiate(self):
+        self.assertEqual(parse_accept_encoding('gzip;q=0.5, br, *;q=0'),
+                         {'gzip': 0.5, 'br': 1.0, '*': 0.0})
+
+        compressor = Compressor(use_brotli=False)
+        self.assertEqual(compressor.codings(), ['gzip', 'deflate'])
+        self.assertEqual(compressor.negotiate('gzip, deflate')[0], 'gzip')
+        self.assertEqual(compressor.negotiate('deflate')[0], 'deflate')
+        self.assertEqual(compressor.negotiate('gzip;q=0, deflate')[0],
+                         'deflate')
+        self.assertEqual(compressor.negotiate('*')[0], 'gzip')
+        self.assertEqual(compressor.negotiate('identity')[0], None)
+        self.assertEqual(compressor.negotiate('')[0], None)
+
+    @async_test
+    def test_compress(self):
+        compressor = Compressor(100, use_brotli=False)
+
+        resp = json_response(1000)
+        body = resp.body
+        resp = yield from compressor.compress(FakeRequest('gzip'), resp)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.body), body)
+
+        # large body is compressed in thread pool of worker
+        executors.configure(thread_pool_size=2)
+        workers = metrics.registry.gauge('executor_workers', pool='thread')
+        resp = json_response(EXECUTOR_MIN_SIZE * 2)
+        body = resp.body
+        resp = yield from compressor.compress(FakeRequest('deflate'), resp)
+        self.assertEqual(resp.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(resp.body), body)
+        self.assertEqual(workers.value, 2)
+        executors.shutdown()
+
+        # ETag of compressed body differs from ETag of original one
+        resp = json_response(1000)
+        resp.headers['ETag'] = '"abc"'
+        resp.headers['Vary'] = 'Accept-Encoding'
+        resp = yield from compressor.compress(FakeRequest('gzip'), resp)
+        self.assertEqual(resp.headers['ETag'], '"abc-gzip"')
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+
+        # small, not accepted and not compressible responses
+        resp = yield from compressor.compress(FakeRequest('gzip'),
+                                              json_response(10))
+        self.assertNotIn('Content-Encoding', resp.headers)
+        resp = yield from compressor.compress(FakeRequest(),
+                                              json_response(1000))
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        resp = web.Response(body=b'0' * 1000, content_type='image/png')
+        resp = yield from compressor.compress(FakeRequest('gzip'), resp)
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -67,11 +67,17 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.monitor_changes, False)
         self.assertEqual(config.leela_proc_count, -1)
         self.assertEqual(config.is_nginx_proxy, True)
+        self.assertEqual(config.reuse_port, False)
+        self.assertEqual(config.compression, False)
+        self.assertEqual(config.compression_min_size, 500)
+        self.assertEqual(config.thread_pool_size, None)
+        self.assertEqual(config.process_pool_size, None)
         self.assertEqual(config.need_daemonize, True)
         self.assertEqual(config.username, 'leela')
         self.assertEqual(config.logger_config_path,
                          '/tmp/testproject/config/logger.yaml')
         self.assertEqual(config.static_path, '/tmp/testproject/www')
+        self.assertEqual(config.json_codec, 'json')
         self.assertEqual(config.services,
                          [{'srv_config': {},
                            'srv_endpoint': 'test.com.TestService',
@@ -96,6 +102,7 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.username, 'leela')
         self.assertEqual(config.logger_config_path, '/test/my_logger.yaml')
         self.assertEqual(config.static_path, '/my/custom/path')
+        self.assertEqual(config.json_codec, 'orjson')
         self.assertEqual(config.services,
                          [{'srv_endpoint': 'test.com.service.TestService',
                            'srv_config': {'test_dict':
@@ -9,6 +9,8 @@ import os
 sys.path.insert(0, os.path.abspath('.'))
 
 from leela.core import *
+from leela.core import metrics
+from leela.middlewares.cors import CORS, CORSMatcher, CorsMiddleware
 
 loop = asyncio.get_event_loop()
 app = Application()
@@ -18,7 +20,7 @@ middlewares = [
                 'allow_methods': ['GET', 'POST', 'PUT',
                                   'PATCH', 'DELETE', 'OPTIONS', 'HEAD'],
                 'allow_headers': ['content-type']},
-               {'url_regex': '.*/readonly',
+               {'url_regex': '.*/readonly', 'max_age': 3600,
                 'allow_methods': ['GET', 'OPTIONS', 'HEAD']},
                {'url_regex': '.*/echo',
                 'allow_methods': ['POST', 'PUT', 'PATCH']},
@@ -55,12 +57,14 @@ class TestCORS(unittest.TestCase):
                          'content-type')
         self.assertEqual(r.headers['ACCESS-CONTROL-ALLOW-CREDENTIALS'],
                          'true')
+        self.assertEqual(r.headers['ACCESS-CONTROL-MAX-AGE'], '600')
 
         r = yield from aiohttp.options('http://0.0.0.0:6666/api/readonly')
         self.assertEqual(r.status, 200)
         yield from r.release()
         self.assertTrue('ALLOW' in r.headers)
         self.assertEqual(r.headers['ALLOW'], 'GET,OPTIONS,HEAD')
+        self.assertEqual(r.headers['ACCESS-CONTROL-MAX-AGE'], '3600')
         self.assertEqual(r.headers['ACCESS-CONTROL-ALLOW-HEADERS'],
                          'x-requested-with, content-type, accept, origin, authorization, x-csrftoken')
         self.assertEqual(r.headers['ACCESS-CONTROL-ALLOW-CREDENTIALS'],
@@ -76,6 +80,53 @@ class TestCORS(unittest.TestCase):
         self.assertEqual(r.headers['ACCESS-CONTROL-ALLOW-CREDENTIALS'],
                          'false')
 
+        # GET response is not preflight one
+        r = yield from aiohttp.get('http://0.0.0.0:6666/api/readonly')
+        self.assertEqual(r.status, 200)
+        yield from r.release()
+        self.assertFalse('ACCESS-CONTROL-MAX-AGE' in r.headers)
+
+        preflights = metrics.registry.route('OPTIONS', 'readonly')
+        self.assertEqual(preflights.statuses[200], 1)
+
+
+class TestCORSMatcher(unittest.TestCase):
+    def check_matcher(self, patterns, is_joined):
+        rules = [CORS({'url_regex': pattern}) for pattern in patterns]
+        matcher = CORSMatcher(rules)
+        self.assertEqual(matcher.is_joined, is_joined)
+        for path in ['/api/allallow', '/api/x/readonly', '/api/echo',
+                     '/api/tenant42/echo', '/other', '', '/api/aa']:
+            expected = None
+            for rule in rules:
+                if rule.matched(path):
+                    expected = rule
+                    break
+            self.assertIs(matcher.find(path), expected, path)
+
+    def test_matcher(self):
+        self.check_matcher(['.*/allallow', '.*/(x)/(readonly)',
+                            '/api/(?P<tenant>\\w+)/echo', '.*/echo',
+                            '/api/'], True)
+        # first matched rule wins
+        self.check_matcher(['/api/', '.*/echo'], True)
+        # backreferences can not be joined
+        self.check_matcher(['.*/echo', '/api/(a)\\1'], False)
+        self.check_matcher([], False)
+
+    def test_cache(self):
+        mw = CorsMiddleware([{'url_regex': '.*/echo'}], cache_size=2)
+        rule = mw._find_cors_rule('/api/echo')
+        self.assertIs(mw._find_cors_rule('/api/echo'), rule)
+        self.assertIsNone(mw._find_cors_rule('/api/other'))
+        self.assertIsNone(mw._find_cors_rule('/api/other'))
+        self.assertEqual(rule.preflight_headers['Allow'],
+                         'GET,POST,PUT,PATCH,DELETE,OPTIONS')
+        self.assertEqual(rule.preflight_headers['Access-Control-Max-Age'],
+                         '600')
+        rule = CORS({'url_regex': '.*', 'max_age': None})
+        self.assertFalse('Access-Control-Max-Age' in rule.preflight_headers)
+
 
 if __name__ == '__main__':
     unittest.main()
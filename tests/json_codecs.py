@@ -0,0 +1,80 @@
+import unittest
+import datetime
+import sys
+import os
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core import codecs
+from leela.core.codecs import get_json_codec, available_json_codecs
+
+
+UTC = datetime.timezone.utc
+
+PAYLOAD = {
+    'str': 'text тест', 'int': 2 ** 40, 'float': 3.14, 'bool': [True, False],
+    'none': None, 'list': [1, 'a', [2, {'b': 3}]], 'tuple': (1, 2),
+    'datetime': datetime.datetime(2020, 1, 2, 3, 4, 5, 678000),
+    'aware': datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=UTC),
+    'date': datetime.date(2020, 1, 2),
+    'bytes': b'binary',
+    'keys': {1: 'one', 2: {3: [b'three']}}}
+
+# payload decoded by API client
+DECODED = {
+    'str': 'text тест', 'int': 2 ** 40, 'float': 3.14, 'bool': [True, False],
+    'none': None, 'list': [1, 'a', [2, {'b': 3}]], 'tuple': [1, 2],
+    'datetime': '2020-01-02T03:04:05.678000',
+    'aware': '2020-01-02T03:04:05+00:00',
+    'date': '2020-01-02',
+    'bytes': 'binary',
+    'keys': {'1': 'one', '2': {'3': ['three']}}}
+
+
+class TestJSONCodecs(unittest.TestCase):
+    def setUp(self):
+        self.codecs = available_json_codecs()
+
+    def test_available(self):
+        names = [codec.name for codec in self.codecs]
+        self.assertIn('json', names)
+        for name in ('orjson', 'ujson', 'rapidjson'):
+            if name not in names:
+                print('{} codec is not installed, skipped'.format(name))
+
+    def test_round_trip(self):
+        for codec in self.codecs:
+            data = codec.dumps(PAYLOAD)
+            self.assertIsInstance(data, bytes, codec.name)
+            self.assertEqual(codec.loads(data), DECODED, codec.name)
+            # requests are decoded from bytes by any codec
+            for other in self.codecs:
+                self.assertEqual(other.loads(data), DECODED,
+                                 (codec.name, other.name))
+
+    def test_not_serializable(self):
+        for codec in self.codecs:
+            with self.assertRaises(TypeError, msg=codec.name):
+                codec.dumps({'obj': object()})
+            with self.assertRaises(ValueError, msg=codec.name):
+                codec.loads(b'{"broken": ')
+
+    def test_get_codec(self):
+        self.assertIsInstance(get_json_codec('json'), codecs.StdJSONCodec)
+        with self.assertRaises(RuntimeError):
+            get_json_codec('simplejson')
+
+    def test_missing_package(self):
+        modules = {'orjson': None, 'ujson': None, 'rapidjson': None}
+        with mock.patch.dict(sys.modules, modules):
+            for name in modules:
+                with self.assertRaises(RuntimeError):
+                    get_json_codec(name)
+            # stdlib codec is always available
+            self.assertEqual([codec.name for codec in
+                              available_json_codecs()], ['json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import tempfile
+import shutil
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def make_registry(self, count):
+        registry = metrics.MetricsRegistry()
+        route = registry.route('GET', 'test')
+        for i in range(count):
+            route.count(200)
+            route.stage('total').observe(0.002)
+            route.stage('handler').observe(100)
+        route.count(500)
+        registry.gauge('executor_tasks', pool='thread').inc(count)
+        return registry
+
+    def test_snapshot(self):
+        snapshot = self.make_registry(3).snapshot()
+        # snapshot should be JSON serializable
+        snapshot = json.loads(json.dumps(snapshot))
+        route, = snapshot['routes']
+        self.assertEqual(route['statuses'], {'200': 3, '500': 1})
+        total = route['stages']['total']
+        self.assertEqual(sum(total['counts']), 3)
+        self.assertEqual(total['counts'][metrics.BUCKETS.index(0.0025)], 3)
+        self.assertEqual(route['stages']['handler']['counts'][-1], 3)
+
+    def test_merge_and_format(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.make_registry(3).dump(os.path.join(path, 'w1.json'))
+            self.make_registry(4).dump(os.path.join(path, 'w2.json'))
+            snapshot = metrics.merge_snapshots(metrics.load_snapshots(path))
+        finally:
+            shutil.rmtree(path)
+
+        route, = snapshot['routes']
+        self.assertEqual(route['statuses'], {'200': 7, '500': 2})
+        self.assertAlmostEqual(route['stages']['handler']['sum'], 700)
+
+        text = metrics.format_prometheus(snapshot)
+        lines = text.splitlines()
+        self.assertIn('leela_requests_total{method="GET",route="test",'
+                      'status="200"} 7', lines)
+        self.assertIn('leela_request_duration_seconds_bucket{method="GET",'
+                      'route="test",stage="total",le="0.001"} 0', lines)
+        self.assertIn('leela_request_duration_seconds_bucket{method="GET",'
+                      'route="test",stage="total",le="0.0025"} 7', lines)
+        self.assertIn('leela_request_duration_seconds_bucket{method="GET",'
+                      'route="test",stage="handler",le="+Inf"} 7', lines)
+        self.assertIn('leela_request_duration_seconds_count{method="GET",'
+                      'route="test",stage="handler"} 7', lines)
+        self.assertIn('# TYPE leela_executor_tasks gauge', lines)
+        self.assertIn('leela_executor_tasks{pool="thread"} 7', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
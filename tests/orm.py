@@ -0,0 +1,459 @@
+import asyncio
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core.orm import (Model, CompactModel, ConnectionPool, IdentityMap,
+                            AbstractDatabase, QueryResult, ASC, DESC)
+from leela.core.orm_sqlite import SQLiteDatabase
+
+loop = asyncio.get_event_loop()
+
+def async_test(f):
+    def wrapper(*args, **kwargs):
+        coro = asyncio.coroutine(f)
+        future = coro(*args, **kwargs)
+        loop.run_until_complete(future)
+    return wrapper
+
+
+class User(Model):
+    name = None
+    age = 0
+    is_admin = False
+    tags = []
+
+
+class CompactUser(CompactModel):
+    name = None
+    age = 0
+    tags = []
+
+
+class FakeConnection(object):
+    def __init__(self, num):
+        self.num = num
+        self.alive = True
+        self.closed = False
+        self.check_delay = 0
+
+
+class TestConnectionPool(unittest.TestCase):
+    def make_pool(self, **params):
+        self.opened = []
+
+        @asyncio.coroutine
+        def open_connection():
+            conn = FakeConnection(len(self.opened))
+            self.opened.append(conn)
+            return conn
+
+        @asyncio.coroutine
+        def close_connection(conn):
+            conn.closed = True
+
+        @asyncio.coroutine
+        def check_connection(conn):
+            yield from asyncio.sleep(conn.check_delay)
+            return conn.alive
+
+        return ConnectionPool(open_connection, close_connection,
+                              check_connection, **params)
+
+    @async_test
+    def test_pool(self):
+        pool = self.make_pool(min_size=1, max_size=2, acquire_timeout=0.2)
+        yield from pool.fill()
+        self.assertEqual(pool.size(), 1)
+
+        conn1 = yield from pool.acquire()
+        conn2 = yield from pool.acquire()
+        self.assertEqual(pool.size(), 2)
+        with self.assertRaises(RuntimeError):
+            yield from pool.acquire()
+
+        # waiter gets released connection
+        waiter = asyncio.ensure_future(pool.acquire())
+        yield from asyncio.sleep(0.01)
+        pool.release(conn1)
+        conn = yield from waiter
+        self.assertIs(conn, conn1)
+
+        # broken connection is replaced
+        pool.release(conn2, discard=True)
+        yield from asyncio.sleep(0.01)
+        self.assertTrue(conn2.closed)
+        self.assertEqual(pool.size(), 1)
+        conn3 = yield from pool.acquire()
+        self.assertEqual(conn3.num, 2)
+        pool.release(conn3)
+        pool.release(conn1)
+
+        yield from pool.close()
+        self.assertTrue(conn1.closed and conn3.closed)
+        with self.assertRaises(RuntimeError):
+            yield from pool.acquire()
+
+    @async_test
+    def test_health_check(self):
+        pool = self.make_pool(min_size=1, max_size=1,
+                              health_check_interval=0)
+        yield from pool.fill()
+        self.opened[0].alive = False
+        yield from asyncio.sleep(0.01)
+        conn = yield from pool.acquire()
+        self.assertEqual(conn.num, 1)
+        self.assertTrue(self.opened[0].closed)
+        pool.release(conn)
+
+        # acquire() is timed out while connection is checked
+        pool = self.make_pool(min_size=1, max_size=1, acquire_timeout=0.05,
+                              health_check_interval=0)
+        yield from pool.fill()
+        self.opened[0].check_delay = 1
+        yield from asyncio.sleep(0.01)
+        with self.assertRaises(RuntimeError):
+            yield from pool.acquire()
+        yield from asyncio.sleep(0.01)
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.size(), 0)
+        conn = yield from pool.acquire()
+        self.assertEqual(conn.num, 1)
+        pool.release(conn)
+        yield from pool.close()
+
+
+class TestSQLiteDatabase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = SQLiteDatabase(os.path.join(self.path, 'test.db'),
+                                 pool_max_size=2)
+        loop.run_until_complete(self.db.connect())
+        User.init(self.db)
+
+    def tearDown(self):
+        loop.run_until_complete(self.db.disconnect())
+        shutil.rmtree(self.path)
+
+    @async_test
+    def test_model(self):
+        user = User(name='John', age=33, tags=['a', 'b'])
+        yield from user.save()
+        self.assertTrue(user.get_id())
+
+        user = yield from User.get(user.get_id())
+        self.assertEqual(user.name, 'John')
+        self.assertEqual(user.tags, ['a', 'b'])
+        self.assertEqual(user.is_admin, False)
+
+        user.is_admin = True
+        yield from user.save()
+        user = yield from User.find_one(name='John')
+        self.assertEqual(user.is_admin, True)
+        self.assertEqual((yield from User.find().count()), 1)
+
+        yield from user.remove()
+        self.assertEqual((yield from User.get(user.get_id())), None)
+
+    @async_test
+    def test_bulk(self):
+        users = [User(_id='u{}'.format(i), name='user{}'.format(i), age=i)
+                 for i in range(2000)]
+        count = yield from User.save_many(users)
+        self.assertEqual(count, 2000)
+        self.assertEqual((yield from User.find().count()), 2000)
+
+        res = yield from User.find(age=5)
+        self.assertEqual([u.name for u in res], ['user5'])
+
+        res = yield from User.find().sort(age=DESC)
+        self.assertEqual(res[0].get_id(), 'u1999')
+        first = yield from User.find().sort(age=ASC).first()
+        self.assertEqual(first.get_id(), 'u0')
+
+        users[7].name = 'changed'
+        yield from User.save_many(users[:10])
+        user = yield from User.get('u7')
+        self.assertEqual(user.name, 'changed')
+
+        count = yield from User.remove_many(users[:1500])
+        self.assertEqual(count, 1500)
+        self.assertEqual((yield from User.find().count()), 500)
+
+        with self.assertRaises(RuntimeError):
+            yield from User.save_many([FakeConnection(1)])
+
+    @async_test
+    def test_compact_model(self):
+        CompactUser.init(self.db)
+        self.assertEqual(CompactUser._meta_name, 'compactuser')
+        self.assertEqual(set(CompactUser.get_fields()),
+                         {'name', 'age', 'tags'})
+
+        user = CompactUser(name='John')
+        self.assertEqual(user.age, 0)
+        # mutable default is not shared
+        user.tags.append('a')
+        self.assertEqual(CompactUser().tags, [])
+        with self.assertRaises(RuntimeError):
+            CompactUser(unknown=1)
+
+        yield from user.save()
+        self.assertTrue(user.get_id())
+        self.assertEqual(user.to_dict(), {'_id': user.get_id(),
+                                          'name': 'John', 'age': 0,
+                                          'tags': ['a']})
+
+        loaded = yield from CompactUser.get(user.get_id())
+        self.assertEqual(loaded.to_dict(), user.to_dict())
+
+        users = [CompactUser(_id=str(i), age=i) for i in range(10)]
+        yield from CompactUser.save_many(users)
+        res = yield from CompactUser.find().sort(age=DESC).first()
+        self.assertEqual(res.get_id(), '9')
+        self.assertEqual((yield from CompactUser.remove_many(users)), 10)
+
+    @asyncio.coroutine
+    def read_cursor(self, cursor):
+        ret = []
+        while True:
+            try:
+                obj = yield from cursor.__anext__()
+            except StopAsyncIteration:
+                return ret
+            ret.append(obj)
+
+    @async_test
+    def test_cursor(self):
+        users = [User(_id='u{:04}'.format(i), name='user{}'.format(i), age=i)
+                 for i in range(250)]
+        yield from User.save_many(users)
+
+        for prefetch in (True, False):
+            cursor = User.find().sort(age=ASC).cursor(batch_size=100,
+                                                      prefetch=prefetch)
+            res = yield from self.read_cursor(cursor)
+            self.assertEqual([u.age for u in res], list(range(250)))
+            self.assertIsInstance(res[0], User)
+            self.assertEqual(self.db.pool().free_size(), self.db.pool().size())
+
+        res = yield from self.read_cursor(User.find(age=7).cursor())
+        self.assertEqual([u.name for u in res], ['user7'])
+
+        # stopped iteration
+        cursor = User.find().cursor(batch_size=10)
+        yield from cursor.__anext__()
+        self.assertEqual(self.db.pool().free_size(), 0)
+        yield from cursor.close()
+        self.assertEqual(self.db.pool().free_size(), self.db.pool().size())
+        with self.assertRaises(StopAsyncIteration):
+            yield from cursor.__anext__()
+
+    @async_test
+    def test_projection(self):
+        users = [User(_id='u{}'.format(i), name='user{}'.format(i), age=i,
+                      tags=['t'])
+                 for i in range(5)]
+        yield from User.save_many(users)
+
+        res = yield from User.find(age=3).only('name')
+        self.assertEqual(res[0].name, 'user3')
+        self.assertEqual(res[0].get_id(), 'u3')
+        self.assertEqual(res[0].tags, [])
+
+        res = yield from User.find(age=3).raw()
+        self.assertEqual(res, [{'_id': 'u3', 'name': 'user3', 'age': 3,
+                                'is_admin': False, 'tags': ['t']}])
+
+        res = yield from User.find().sort(age=ASC).only('name').as_dicts()
+        self.assertEqual(res[:2], [{'_id': 'u0', 'name': 'user0'},
+                                   {'_id': 'u1', 'name': 'user1'}])
+        self.assertEqual((yield from User.find(age=1).as_dicts().first()),
+                         users[1].to_dict())
+
+        cursor = User.find().only('age').as_dicts().cursor(batch_size=2)
+        res = yield from self.read_cursor(cursor)
+        self.assertEqual(sorted(r['age'] for r in res), list(range(5)))
+
+        with self.assertRaises(RuntimeError):
+            User.find().only('unknown')
+
+    @async_test
+    def test_connection(self):
+        with (yield from self.db.connection()) as conn:
+            self.assertEqual(conn.execute('SELECT 1').fetchone()[0], 1)
+        self.assertEqual(self.db.pool().free_size(), 1)
+
+
+class MemoryQueryResult(QueryResult):
+    """connector that implements only required QueryResult methods"""
+    def __init__(self, db, model_class, query):
+        self.__db = db
+        self.__model_class = model_class
+        self.__query = query
+
+    @asyncio.coroutine
+    def upsert(self):
+        self.__db.items[self.__query['_id']] = dict(self.__query)
+
+    @asyncio.coroutine
+    def first(self):
+        objects = yield from self
+        return objects[0] if objects else None
+
+    @asyncio.coroutine
+    def __iter__(self):
+        return [self.__model_class(**item)
+                for _, item in sorted(self.__db.items.items())
+                if all(item.get(key) == value
+                       for key, value in self.__query.items())]
+
+
+class MemoryDatabase(AbstractDatabase):
+    _query_result_class = MemoryQueryResult
+
+    def __init__(self):
+        super().__init__('memory')
+        self.items = {}
+
+
+class PlainFirstQueryResult(MemoryQueryResult):
+    first = QueryResult.first  # plain method, not coroutine
+
+
+class PlainFirstDatabase(MemoryDatabase):
+    _query_result_class = PlainFirstQueryResult
+
+
+class TestBaseConnector(unittest.TestCase):
+    def setUp(self):
+        self.db = MemoryDatabase()
+        loop.run_until_complete(self.db.connect())
+        User.init(self.db)
+
+    def tearDown(self):
+        loop.run_until_complete(self.db.disconnect())
+
+    @async_test
+    def test_without_pool(self):
+        self.assertIsNone(self.db.pool())
+        with self.assertRaises(RuntimeError):
+            yield from self.db.acquire()
+        yield from User(_id='u1', name='user1').save()
+        self.assertEqual((yield from User.get('u1')).name, 'user1')
+        self.assertEqual((yield from User.find_one(name='user1')).name,
+                         'user1')
+
+    @async_test
+    def test_plain_first(self):
+        User.init(PlainFirstDatabase())
+        self.assertIsNone((yield from User.find_one(name='user1')))
+
+    @async_test
+    def test_dicts(self):
+        for i in range(3):
+            yield from User(_id='u{}'.format(i), name='user{}'.format(i),
+                            age=i, tags={'t'}).save()
+
+        res = yield from User.find(age=1).raw()
+        self.assertEqual(res, [{'_id': 'u1', 'name': 'user1', 'age': 1,
+                                'is_admin': False, 'tags': {'t'}}])
+        res = yield from User.find(age=1).as_dicts()
+        self.assertEqual(res, [{'_id': 'u1', 'name': 'user1', 'age': 1,
+                                'is_admin': False, 'tags': "{'t'}"}])
+
+        res = yield from User.find().only('name').sort(age=ASC).as_dicts()
+        self.assertEqual(res, [{'_id': 'u0', 'name': 'user0'},
+                               {'_id': 'u1', 'name': 'user1'},
+                               {'_id': 'u2', 'name': 'user2'}])
+        res = yield from User.find().raw().only('age').first()
+        self.assertEqual(res, {'_id': 'u0', 'age': 0})
+        self.assertIsNone((yield from User.find(age=5).as_dicts().first()))
+
+        cursor = User.find().only('age').raw().cursor(batch_size=2)
+        res = []
+        while True:
+            try:
+                res.append((yield from cursor.__anext__()))
+            except StopAsyncIteration:
+                break
+        self.assertEqual([r['age'] for r in res], [0, 1, 2])
+
+
+class CountingDatabase(SQLiteDatabase):
+    requests = 0
+
+    @asyncio.coroutine
+    def execute(self, table, func):
+        self.requests += 1
+        return (yield from super().execute(table, func))
+
+
+class Tenant(Model):
+    name = None
+
+
+class TestCaches(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = CountingDatabase(os.path.join(self.path, 'test.db'))
+        loop.run_until_complete(self.db.connect())
+        Tenant.init(self.db)
+        loop.run_until_complete(Tenant(_id='t1', name='first').save())
+        self.db.requests = 0
+
+    def tearDown(self):
+        Tenant.disable_read_cache()
+        loop.run_until_complete(self.db.disconnect())
+        shutil.rmtree(self.path)
+
+    @async_test
+    def test_identity_map(self):
+        identity_map = IdentityMap()
+        identity_map.activate()
+        try:
+            tenant = yield from Tenant.get('t1')
+            self.assertIs((yield from Tenant.get('t1')), tenant)
+            self.assertIs((yield from Tenant.find_one(name='first')), tenant)
+            self.assertIs((yield from Tenant.find_one(name='first')), tenant)
+            self.assertEqual(self.db.requests, 2)
+
+            tenant.name = 'changed'
+            yield from tenant.save()
+            self.assertIs((yield from Tenant.find_one(name='changed')),
+                          tenant)
+            self.assertIsNone((yield from Tenant.find_one(name='first')))
+
+            yield from tenant.remove()
+            requests = self.db.requests
+            self.assertIsNone((yield from Tenant.get('t1')))
+            self.assertEqual(self.db.requests, requests)
+        finally:
+            identity_map.deactivate()
+        self.assertIsNone(IdentityMap.current())
+
+    @async_test
+    def test_read_cache(self):
+        Tenant.enable_read_cache(ttl=60)
+        tenant = yield from Tenant.get('t1')
+        cached = yield from Tenant.get('t1')
+        self.assertEqual(self.db.requests, 1)
+        # cached object is a copy
+        self.assertIsNot(cached, tenant)
+        self.assertEqual(cached.name, 'first')
+
+        tenant.name = 'changed'
+        yield from Tenant.save_many([tenant])
+        tenant = yield from Tenant.get('t1')
+        self.assertEqual(tenant.name, 'changed')
+
+        yield from tenant.remove()
+        self.assertIsNone((yield from Tenant.get('t1')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+import os
+import time
 import asyncio
+import tempfile
 from datetime import datetime
 
 from leela.core import *
 from leela.services.auth import (need_auth, authorization,
                                  AuthBasedService, BaseUser)
+from leela.middlewares.cache import ttl
+from leela.core.middleware import LeelaMiddleware
+from leela.core.orm import IdentityMap
 
 class A(LeelaService):
+    SHARED_CALLS = 0
+
     def __init__(self, a):
         super().__init__()
         self.__a = a
@@ -41,10 +49,36 @@ class A(LeelaService):
         del self.__incoming[req.data.key]
         return True
 
+    @leela_get('shared', single_flight=True)
+    def test_shared(self, req):
+        self.__class__.SHARED_CALLS += 1
+        calls = self.SHARED_CALLS
+        yield from asyncio.sleep(0.1)
+        return {'calls': calls}
+
+    @leela_get('blocking', executor='thread')
+    def test_blocking(self, req):
+        time.sleep(0.2)
+        return {'service': self.__a}
+
+    @leela_get('blocking_process', executor='process')
+    def test_blocking_process(self, req):
+        time.sleep(0.2)
+        return {'service': self, 'x': req.query.get('x')}
+
+    @leela_get('stream')
+    def test_stream(self, req):
+        count = int(req.query.get('count', 3))
+        yield from asyncio.sleep(0)
+        return ({'num': i} for i in range(count))
+
 
 class B(A, AuthBasedService):
     FNAME = None
     FCONT = None
+    # sha1 digest of '123' made by old leela versions
+    DIGESTS = {'kst': '40bd001563085fc35165329ea1ff5c5ecbdbbeef'}
+    ROLES = {}
 
     def __init__(self, a, b):
         super().__init__(a)
@@ -52,10 +86,15 @@ class B(A, AuthBasedService):
 
     @asyncio.coroutine
     def get_user(self, username):
-        if username == 'kst':
-            return BaseUser.create(username, '123', ['testrole'])
+        if username in self.DIGESTS:
+            return BaseUser(username, self.DIGESTS[username],
+                            self.ROLES.get(username, ['testrole']))
         return None
 
+    @asyncio.coroutine
+    def update_password_digest(self, user):
+        self.DIGESTS[user.username] = user.password_digest
+
     @leela_get('test_path2')
     def test22(self, req):
         ret = yield from self.test(req)
@@ -66,6 +105,11 @@ class B(A, AuthBasedService):
     def test_secret(self, req):
         return 'SECRET'
 
+    @leela_get('whoami', auth=need_auth)
+    def test_whoami(self, req):
+        user = yield from self.session_user(req)
+        return {'username': user.username, 'roles': user.roles}
+
     @leela_get('top_secret', auth=authorization('testrole', 'superrole'))
     def test_topsecret(self, req):
         return 'TOP SECRET'
@@ -84,6 +128,11 @@ class B(A, AuthBasedService):
 
         print('some_file proc time: %s'%(datetime.now()-t0))
 
+    @leela_form_post('limited_form', max_size=1024)
+    def test_limited_form(self, req):
+        return {name: len(value) for name, value in req.data.items()
+                if isinstance(value, str)}
+
     @leela_get('some_file')
     def test_file_info(self, req):
         rec = [self.FNAME, self.FCONT.decode(),
@@ -104,6 +153,17 @@ class B(A, AuthBasedService):
 
         print('some_str_file proc time: %s'%(datetime.now()-t0))
 
+    @leela_uploadstream('spooled_file', spool=True, max_size=1024 * 1024,
+                        hashes=('sha1',), spool_max_memory=1024)
+    def test_spooled_file(self, req):
+        path = os.path.join(tempfile.gettempdir(), 'leela-test-spooled')
+        yield from req.data.file.save(path)
+        with open(path, 'rb') as fdesc:
+            content = fdesc.read()
+        os.unlink(path)
+        return {'size': req.data.file.size, 'saved': len(content),
+                'sha1': req.data.file.hexdigest('sha1')}
+
 
 class CorsTest(LeelaService):
     @leela_get('allallow')
@@ -117,3 +177,41 @@ class CorsTest(LeelaService):
     @leela_post('echo')
     def test_echo(self, req):
         return req.data
+
+
+class CacheTest(LeelaService):
+    CALLS = 0
+
+    @leela_get('stats', cache=ttl(30))
+    def test_stats(self, req):
+        self.__class__.CALLS += 1
+        yield from asyncio.sleep(0.1)
+        return {'calls': self.CALLS, 'query': req.query}
+
+    @leela_get('failed', cache=ttl(30))
+    def test_failed(self, req):
+        self.__class__.CALLS += 1
+        yield from asyncio.sleep(0.1)
+        raise web.HTTPNotFound()
+
+    @leela_get('early', cache=ttl(30), early=True)
+    def test_early(self, req):
+        self.__class__.CALLS += 1
+        return 'not called'
+
+
+class IdentityMapCheck(LeelaService):
+    @leela_get('identity_map')
+    def test_identity_map(self, req):
+        return IdentityMap.current() is not None
+
+
+class EarlyResponseMiddleware(LeelaMiddleware):
+    """returns response from on_request() for methods with early=True"""
+    def need_on_request(self, params):
+        return bool(params.get('early', None))
+
+    @asyncio.coroutine
+    def on_request(self, request, data, params, cache):
+        yield from asyncio.sleep(0.05)
+        return web.Response(body=b'"early"', content_type='application/json')
@@ -0,0 +1,243 @@
+
+import asyncio
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from leela.core.sessions import (Session, InMemorySessionsManager,
+                                 RedisSessionsManager, FileSessionsManager)
+from leela.core import session_codec
+from leela.services.auth import BaseUser
+
+loop = asyncio.get_event_loop()
+
+def async_test(f):
+    def wrapper(*args, **kwargs):
+        coro = asyncio.coroutine(f)
+        future = coro(*args, **kwargs)
+        loop.run_until_complete(future)
+    return wrapper
+
+
+class FakeRedisServer(object):
+    """local stand-in for Redis server (sessions related hash commands)"""
+    def __init__(self):
+        self.data = {}
+        self.server = None
+
+    @asyncio.coroutine
+    def start(self, port):
+        self.server = yield from asyncio.start_server(self.handle_client,
+                                                      '127.0.0.1', port)
+
+    @asyncio.coroutine
+    def stop(self):
+        self.server.close()
+        yield from self.server.wait_closed()
+
+    @asyncio.coroutine
+    def handle_client(self, reader, writer):
+        while True:
+            line = yield from reader.readline()
+            if not line:
+                break
+            args = []
+            for _ in range(int(line[1:])):
+                length = int((yield from reader.readline())[1:])
+                args.append((yield from reader.readexactly(length + 2))[:-2])
+            writer.write(self.process(args[0].decode().upper(), args[1:]))
+        writer.close()
+
+    def int_reply(self, val):
+        return ':{}\r\n'.format(int(val)).encode()
+
+    def process(self, cmd, args):
+        if cmd == 'HGETALL':
+            items = self.data.get(args[0], {})
+            ret = [b'*' + str(len(items) * 2).encode() + b'\r\n']
+            for item in items.items():
+                for val in item:
+                    ret.append(b'$' + str(len(val)).encode() + b'\r\n' +
+                               val + b'\r\n')
+            return b''.join(ret)
+        if cmd == 'HSET':
+            items = self.data.setdefault(args[0], {})
+            for i in range(1, len(args), 2):
+                items[args[i]] = args[i + 1]
+            return self.int_reply(len(args) // 2)
+        if cmd == 'HDEL':
+            items = self.data.get(args[0], {})
+            return self.int_reply(sum(bool(items.pop(key, None))
+                                      for key in args[1:]))
+        if cmd == 'PEXPIRE':
+            return self.int_reply(args[0] in self.data)
+        if cmd == 'DEL':
+            return self.int_reply(bool(self.data.pop(args[0], None)))
+        if cmd == 'EXISTS':
+            return self.int_reply(args[0] in self.data)
+        return b'-ERR unknown command\r\n'
+
+
+class TestSessions(unittest.TestCase):
+    def check_manager(self, manager, other_manager):
+        session = yield from manager.get(None)
+        self.assertEqual(session.get_id(), None)
+
+        session.set('key', 'value')
+        yield from manager.set(session)
+        session_id = session.get_id()
+        self.assertEqual(len(session_id), 32)
+        self.assertFalse(session.modified)
+
+        # session is visible for other worker
+        session = yield from other_manager.get(session_id)
+        self.assertEqual(session.get_id(), session_id)
+        self.assertEqual(session.get('key'), 'value')
+
+        session = yield from manager.get('unknownsessionid')
+        self.assertEqual(session.get_id(), None)
+
+        ret = yield from other_manager.remove(session)
+        self.assertFalse(ret)
+
+        session = yield from other_manager.get(session_id)
+        session.set('user', BaseUser('kst', 'digest', ['admin']))
+        session.pop('key')
+        yield from other_manager.set(session)
+
+        session = yield from manager.get(session_id)
+        self.assertEqual(session.get('key'), None)
+        self.assertEqual(session.get('user').username, 'kst')
+        self.assertEqual(session.get('user').roles, ['admin'])
+
+        session = yield from other_manager.get(session_id)
+        ret = yield from other_manager.remove(session)
+        self.assertTrue(ret)
+        session = yield from other_manager.get(session_id)
+        self.assertEqual(session.get_id(), None)
+
+    def test_codec(self):
+        data = {'none': None, 'bool': [True, False], 'str': 'text' * 100,
+                'ints': (0, -1, 200, -70000, 2 ** 40, 2 ** 80),
+                'float': 3.14, 'bytes': b'\x00\x01', 'set': {1, 2},
+                'nested': {'user': BaseUser('kst', 'digest', ['a', 'b'])}}
+        ret = session_codec.loads(session_codec.dumps(data))
+        user = ret['nested'].pop('user')
+        self.assertEqual((user.username, user.password_digest, user.roles),
+                         ('kst', 'digest', ['a', 'b']))
+        del data['nested']['user']
+        self.assertEqual(ret, data)
+
+        with self.assertRaises(session_codec.SessionCodecError):
+            session_codec.dumps({'obj': object()})
+        with self.assertRaises(session_codec.SessionCodecError):
+            session_codec.loads(b'\x99data')
+
+        # long numbers, corrupted and truncated data, trailing bytes
+        self.assertEqual(session_codec.loads(session_codec.dumps(10 ** 300)),
+                         10 ** 300)
+        dump = session_codec.dumps({'key': 'value', 'num': 2 ** 80})
+        bad_int = session_codec.dumps(2 ** 80).replace(b'1', b'x')
+        unhashable = b'\x01\x0d\x01\x00\x00\x00\x0b\x00\x00\x00\x00\x00'
+        for data in (dump[:-3], dump + b'\x00', bad_int, unhashable,
+                     b'\x01\x0f\xff\xff\x00'):
+            with self.assertRaises(session_codec.SessionCodecError):
+                session_codec.loads(data)
+
+    def test_dirty_keys(self):
+        session = Session('id', {'a': 1, 'b': 2})
+        self.assertEqual(session.changes(), ({}, set()))
+        session.set('c', 3)
+        session.pop('a')
+        session.pop('unknown')
+        self.assertEqual(session.changes(), ({'c': 3}, {'a'}))
+        self.assertTrue(session.modified)
+        session.reset_changes()
+        self.assertEqual(session.changes(), ({}, set()))
+        self.assertFalse(session.modified)
+
+    @async_test
+    def test_inmemory(self):
+        manager = InMemorySessionsManager()
+        yield from self.check_manager(manager, manager)
+
+    @async_test
+    def test_inmemory_expiration(self):
+        manager = InMemorySessionsManager(expire_time=0.1, max_sessions=3)
+        sessions = []
+        for i in range(4):
+            session = yield from manager.get(None)
+            session.set('num', i)
+            yield from manager.set(session)
+            sessions.append(session)
+
+        # least recently used session is evicted
+        self.assertEqual(manager.count(), 3)
+        session = yield from manager.get(sessions[0].get_id())
+        self.assertEqual(session.get_id(), None)
+
+        yield from asyncio.sleep(0.15)
+        session = yield from manager.get(sessions[1].get_id())
+        self.assertEqual(session.get_id(), None)
+        self.assertEqual(manager.count(), 2)
+
+        self.assertEqual(manager.sweep(), 2)
+        self.assertEqual(manager.count(), 0)
+
+    @async_test
+    def test_redis(self):
+        server = FakeRedisServer()
+        yield from server.start(16379)
+        managers = [RedisSessionsManager(port=16379, cache_size=0)
+                    for _ in range(2)]
+        try:
+            for manager in managers:
+                yield from manager.start()
+            yield from self.check_manager(*managers)
+            self.assertEqual(server.data, {})
+        finally:
+            for manager in managers:
+                yield from manager.stop()
+            yield from server.stop()
+
+    @async_test
+    def test_file(self):
+        path = tempfile.mkdtemp()
+        managers = [FileSessionsManager(path, cache_size=0)
+                    for _ in range(2)]
+        try:
+            for manager in managers:
+                yield from manager.start()
+            yield from self.check_manager(*managers)
+
+            session = yield from managers[0].get('../../etc/passwd')
+            self.assertEqual(session.get_id(), None)
+        finally:
+            for manager in managers:
+                yield from manager.stop()
+            shutil.rmtree(path)
+
+    @async_test
+    def test_local_cache(self):
+        path = tempfile.mkdtemp()
+        manager = FileSessionsManager(path, cache_ttl=60)
+        try:
+            session = Session(None)
+            session.set('key', 'value')
+            yield from manager.set(session)
+            os.unlink(os.path.join(path, session.get_id()))
+
+            # hot session is still cached locally
+            cached = yield from manager.get(session.get_id())
+            self.assertTrue(cached is session)
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
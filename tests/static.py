@@ -0,0 +1,149 @@
+import asyncio
+import unittest
+import tempfile
+import shutil
+import gzip
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('.'))
+
+import aiohttp
+from aiohttp import web
+from leela.core import static, Application
+from leela.core.static import StaticFiles
+
+loop = asyncio.get_event_loop()
+
+def async_test(f):
+    def wrapper(*args, **kwargs):
+        coro = asyncio.coroutine(f)
+        future = coro(*args, **kwargs)
+        loop.run_until_complete(future)
+    return wrapper
+
+
+class FakeRequest(object):
+    def __init__(self, **headers):
+        self.headers = {key.upper().replace('_', '-'): value
+                        for key, value in headers.items()}
+
+
+class TestStatic(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.write('index.html', b'<html>index</html>')
+        self.write('app.js', b'var a = 1;' * 100)
+        self.write('app.js.gz', gzip.compress(b'var a = 1;' * 100))
+        self.files = StaticFiles(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, data, mtime=None):
+        path = os.path.join(self.path, name)
+        with open(path, 'wb') as fobj:
+            fobj.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    @async_test
+    def test_index(self):
+        resp = yield from self.files.serve(FakeRequest(), 'index.html')
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.body, b'<html>index</html>')
+        self.assertEqual(resp.content_type, 'text/html')
+        etag = resp.headers['ETag']
+        modified = resp.headers['Last-Modified']
+
+        resp = yield from self.files.serve(
+            FakeRequest(if_none_match=etag), 'index.html')
+        self.assertEqual(resp.status, 304)
+        resp = yield from self.files.serve(
+            FakeRequest(if_modified_since=modified), 'index.html')
+        self.assertEqual(resp.status, 304)
+        resp = yield from self.files.serve(
+            FakeRequest(if_none_match='"other"'), 'index.html')
+        self.assertEqual(resp.status, 200)
+
+        # file is reloaded when it is changed
+        self.write('index.html', b'<html>new index</html>',
+                   time.time() + 10)
+        resp = yield from self.files.serve(FakeRequest(), 'index.html')
+        self.assertEqual(resp.body, b'<html>index</html>')  # not checked
+        static.CHECK_INTERVAL, interval = 0, static.CHECK_INTERVAL
+        try:
+            resp = yield from self.files.serve(
+                FakeRequest(if_none_match=etag), 'index.html')
+        finally:
+            static.CHECK_INTERVAL = interval
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.body, b'<html>new index</html>')
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    @async_test
+    def test_precompressed(self):
+        resp = yield from self.files.serve(FakeRequest(), 'app.js')
+        self.assertEqual(resp.body, b'var a = 1;' * 100)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+
+        resp = yield from self.files.serve(
+            FakeRequest(accept_encoding='gzip, deflate'), 'app.js')
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.body), b'var a = 1;' * 100)
+        gz_etag = resp.headers['ETag']
+
+        resp = yield from self.files.serve(
+            FakeRequest(accept_encoding='gzip', if_none_match=gz_etag),
+            'app.js')
+        self.assertEqual(resp.status, 304)
+        resp = yield from self.files.serve(
+            FakeRequest(if_none_match=gz_etag), 'app.js')
+        self.assertEqual(resp.status, 200)
+
+        # outdated precompressed file is not used
+        self.write('app.js', b'var b = 2;' * 100, time.time() + 10)
+        files = StaticFiles(self.path)
+        resp = yield from files.serve(
+            FakeRequest(accept_encoding='gzip'), 'app.js')
+        self.assertEqual(resp.body, b'var b = 2;' * 100)
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    @async_test
+    def test_not_found(self):
+        for name in ('missing.html', '../etc/passwd', '', '.'):
+            with self.assertRaises(web.HTTPNotFound):
+                yield from self.files.serve(FakeRequest(), name)
+
+
+class TestStaticServer(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        # larger than memory cache and socket buffers
+        self.data = os.urandom(8 * 1024 * 1024)
+        with open(os.path.join(self.path, 'big.bin'), 'wb') as fobj:
+            fobj.write(self.data)
+        self.app = Application()
+        self.app.handle_static(self.path)
+        self.app.make_tcp_server('127.0.0.1', 6667)
+
+    def tearDown(self):
+        loop.run_until_complete(self.app.destroy())
+        shutil.rmtree(self.path)
+
+    @async_test
+    def test_large_file(self):
+        for _ in range(2):
+            r = yield from aiohttp.get('http://127.0.0.1:6667/static/big.bin')
+            self.assertEqual(r.status, 200)
+            self.assertEqual(int(r.headers['CONTENT-LENGTH']),
+                             len(self.data))
+            body = yield from r.read()
+            self.assertEqual(len(body), len(self.data))
+            self.assertTrue(body == self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()